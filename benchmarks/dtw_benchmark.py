@@ -0,0 +1,65 @@
+"""Compare tts_metrics DTW with fastdtw on 10 s utterance-sized mel cepstra
+
+    python benchmarks/dtw_benchmark.py --seconds 10 --repeat 3
+"""
+import argparse
+import time
+
+import numpy as np
+from fastdtw import fastdtw, dtw as fastdtw_exact
+
+from tts_metrics.mcd import log_spec_dB_dist
+from tts_metrics.utils.dtw import dtw
+
+
+def synthetic_mceps(num_frames, dim, rng):
+    # smooth random trajectories look more like cepstra than white noise
+    return np.cumsum(rng.normal(scale=0.1, size=(num_frames, dim)), axis=0)
+
+
+def timeit(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DTW benchmark against fastdtw")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Utterance length")
+    parser.add_argument("--frame_period", type=float, default=5.0, help="Frame period in ms (WORLD default)")
+    parser.add_argument("--dim", type=int, default=24, help="Cepstrum order")
+    parser.add_argument("--band", type=int, default=100, help="Sakoe-Chiba radius of the banded run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--exact_fastdtw", type=int, default=0,
+                        help="1 to also time fastdtw's exact dtw (slow: one Python call per cell)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    num_frames = int(args.seconds * 1000 / args.frame_period)
+    x = synthetic_mceps(num_frames, args.dim, rng)
+    y = synthetic_mceps(int(num_frames * 1.1), args.dim, rng)
+    dtw(x[:8], y[:8], metric='log_spec_dB')  # JIT warm-up
+
+    rows = []
+    seconds, (distance, path_x, _) = timeit(lambda: dtw(x, y, metric='log_spec_dB'), args.repeat)
+    rows.append(("tts_metrics dtw (exact)", seconds, distance, len(path_x)))
+    seconds, (distance, path_x, _) = timeit(lambda: dtw(x, y, metric='log_spec_dB', band=args.band), args.repeat)
+    rows.append((f"tts_metrics dtw (band={args.band})", seconds, distance, len(path_x)))
+    seconds, (distance, path) = timeit(lambda: fastdtw(x, y, dist=log_spec_dB_dist), 1)
+    rows.append(("fastdtw (radius=1, approximate)", seconds, distance, len(path)))
+    if args.exact_fastdtw:
+        seconds, (distance, path) = timeit(lambda: fastdtw_exact(x, y, dist=log_spec_dB_dist), 1)
+        rows.append(("fastdtw dtw (exact)", seconds, distance, len(path)))
+
+    print(f"[INFO] {x.shape[0]} x {y.shape[0]} frames, dim {args.dim}")
+    print(f"| {'method':<34} | {'time (s)':>9} | {'distance':>14} | {'path':>6} |")
+    print(f"|{'-' * 36}|{'-' * 11}|{'-' * 16}|{'-' * 8}|")
+    for method, seconds, distance, path_len in rows:
+        print(f"| {method:<34} | {seconds:>9.3f} | {distance:>14.3f} | {path_len:>6} |")
+
+
+if __name__ == "__main__":
+    main()
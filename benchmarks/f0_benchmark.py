@@ -0,0 +1,54 @@
+"""Speed of every F0 estimator and its agreement with pyin on the files of a mapper
+
+    python benchmarks/f0_benchmark.py --dataroot data/audio --datapairs data/mapper.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from tts_metrics.gpe import GPE, FMAX_C7, FMIN_C2
+from tts_metrics.utils.audio_cache import load_wav
+from tts_metrics.utils.pitch import F0_ESTIMATORS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="F0 estimators benchmark against pyin")
+    parser.add_argument("--dataroot", default="./data/", help="Root dir of pairs exist in JSON")
+    parser.add_argument("--datapairs", default="./data/mapper.json", help="path to JSON file contains information of pairs")
+    parser.add_argument("--sr", type=int, default=22050, help="Sampling rate of wavefile")
+    parser.add_argument("--frame_length", type=int, default=1024)
+    parser.add_argument("--methods", default=",".join(F0_ESTIMATORS), help="Comma separated estimators to time")
+    args = parser.parse_args()
+
+    pairs = json.load(open(args.datapairs))
+    files = sorted(set(pairs) | set(pairs.values()))
+    wavs = [load_wav(os.path.join(args.dataroot, wavefile), sr=args.sr) for wavefile in files]
+    audio_seconds = sum(len(wav) for wav in wavs) / args.sr
+    params = dict(sr=args.sr, fmin=FMIN_C2, fmax=FMAX_C7,
+                  frame_length=args.frame_length, hop_length=args.frame_length // 4)
+
+    tracks, seconds = {}, {}
+    for method in ['pyin'] + [m for m in args.methods.split(",") if m != 'pyin']:
+        start = time.perf_counter()
+        tracks[method] = [F0_ESTIMATORS[method](wav, **params) for wav in wavs]
+        seconds[method] = time.perf_counter() - start
+
+    # agreement: GPE/VDE of every method against pyin on the same file, counted over all frames
+    print(f"[INFO] {len(files)} files, {audio_seconds:.1f} s of audio")
+    print(f"| {'method':<8} | {'time (s)':>9} | {'x real time':>11} | {'speedup':>8} | {'GPE vs pyin':>11} | {'VDE vs pyin':>11} |")
+    print(f"|{'-' * 10}|{'-' * 11}|{'-' * 13}|{'-' * 10}|{'-' * 13}|{'-' * 13}|")
+    for method, method_tracks in tracks.items():
+        counts = np.zeros(4, dtype=np.int64)
+        for (p1, v1), (p2, v2) in zip(tracks['pyin'], method_tracks):
+            counts += GPE.error_counts(p1, v1, p2, v2)
+        F0_err, both_voiced, voicing_err, num_frames = counts
+        print(f"| {method:<8} | {seconds[method]:>9.3f} | {audio_seconds / seconds[method]:>11.1f} "
+              f"| {seconds['pyin'] / seconds[method]:>8.1f} | {100 * F0_err / max(both_voiced, 1):>10.2f}% "
+              f"| {100 * voicing_err / max(num_frames, 1):>10.2f}% |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Synthetic speech-like fixtures: voiced (harmonic) and unvoiced (noise) segments of controlled length and pitch
+
+Every pair is a reference and a "synthesized" version of it, 5 % longer and
+3 % higher, so DTW and the pitch metrics have something to align and compare.
+Files are generated from a seed per pair: the same arguments always give the
+same audio, and no external data is needed.
+
+    python benchmarks/fixtures.py --output fixtures/10s --seconds 10 --pairs 100
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import soundfile as sf
+
+SYN_STRETCH = 1.05
+SYN_PITCH_SHIFT = 1.03
+
+
+def segment_layout(rng, voiced_ratio=0.7, min_seconds=0.08, max_seconds=0.4, seconds=1.0):
+    """Alternating voiced/unvoiced segments as (start, stop, voiced), in fractions of the duration
+    """
+    layout, position, voiced = [], 0.0, True
+    while position < 1.0:
+        length = rng.uniform(min_seconds, max_seconds) / seconds
+        if not voiced:
+            length *= (1 - voiced_ratio) / voiced_ratio
+        layout.append((position, min(position + length, 1.0), voiced))
+        position += length
+        voiced = not voiced
+    return layout
+
+
+def synthetic_speech(seconds, sr=22050, f0=120.0, layout=None, seed=0, num_harmonics=40):
+    """Return a float32 waveform of `seconds` with voiced segments at about `f0` Hz
+
+    Voiced segments are harmonics of a slowly drifting F0 with 5 Hz vibrato and a
+    -6 dB/octave tilt; unvoiced ones are low level noise. Segment edges are
+    faded over 5 ms so frames near a boundary stay realistic.
+
+    Args:
+        seconds (float): duration
+        sr (int, optional): sampling rate. Defaults to 22050.
+        f0 (float, optional): mean F0 of voiced segments in Hz. Defaults to 120.0.
+        layout (list, optional): (start, stop, voiced) in fractions of the duration, see segment_layout.
+            Defaults to None (drawn from `seed`).
+        seed (int, optional): seed of the layout, F0 drift and noise. Defaults to 0.
+        num_harmonics (int, optional): harmonics below Nyquist kept in voiced segments. Defaults to 40.
+    """
+    rng = np.random.default_rng(seed)
+    if layout is None:
+        layout = segment_layout(rng, seconds=seconds)
+    num_samples = int(round(seconds * sr))
+    t = np.arange(num_samples) / sr
+    drift = 1 + 0.08 * np.sin(2 * np.pi * t / max(seconds, 1e-3) + rng.uniform(0, 2 * np.pi))
+    f0_track = f0 * drift * (1 + 0.02 * np.sin(2 * np.pi * 5 * t))
+    phase = 2 * np.pi * np.cumsum(f0_track) / sr
+
+    voiced = np.zeros(num_samples)
+    for k in range(1, num_harmonics + 1):
+        below_nyquist = k * f0_track < sr / 2
+        voiced += below_nyquist * np.sin(k * phase) / k
+    unvoiced = 0.05 * rng.standard_normal(num_samples)
+
+    gate = np.zeros(num_samples)
+    for start, stop, is_voiced in layout:
+        gate[int(start * num_samples):int(stop * num_samples)] = 1.0 if is_voiced else 0.0
+    fade = max(int(0.005 * sr), 1)
+    gate = np.convolve(gate, np.ones(fade) / fade, mode='same')
+
+    wav = gate * voiced + (1 - gate) * unvoiced
+    return (0.5 * wav / max(np.abs(wav).max(), 1e-9)).astype(np.float32)
+
+
+def pair_f0(index, f0=None):
+    # pitch of pair `index`: `f0` when fixed, else spread over male and female ranges
+    if f0 is not None:
+        return f0
+    return float(np.random.default_rng([index, 1]).uniform(90.0, 240.0))
+
+
+def synthetic_pair(index, seconds, sr=22050, f0=None):
+    """Return (reference, synthesized) waveforms of pair `index`
+    """
+    layout = segment_layout(np.random.default_rng([index, 0]), seconds=seconds)
+    f0 = pair_f0(index, f0)
+    ref = synthetic_speech(seconds, sr, f0, layout=layout, seed=index)
+    syn = synthetic_speech(seconds * SYN_STRETCH, sr, f0 * SYN_PITCH_SHIFT, layout=layout, seed=index + 1_000_003)
+    return ref, syn
+
+
+def write_fixtures(root, seconds, num_pairs, sr=22050, f0=None):
+    """Write `num_pairs` pairs of `seconds` under `root` and a mapper of all of them
+
+    Files already there are kept, so growing a fixture set only writes the new pairs.
+
+    Returns:
+        str: path to the mapper JSON {reference: synthesized}, relative to `root`
+    """
+    os.makedirs(root, exist_ok=True)
+    mapper = {}
+    for index in range(num_pairs):
+        ref_file, syn_file = f"ref_{index:05d}.wav", f"syn_{index:05d}.wav"
+        mapper[ref_file] = syn_file
+        if os.path.exists(os.path.join(root, ref_file)) and os.path.exists(os.path.join(root, syn_file)):
+            continue
+        ref, syn = synthetic_pair(index, seconds, sr, f0)
+        sf.write(os.path.join(root, ref_file), ref, sr, subtype='PCM_16')
+        sf.write(os.path.join(root, syn_file), syn, sr, subtype='PCM_16')
+    return write_mapper(root, mapper)
+
+
+def write_mapper(root, mapper):
+    mapper_path = os.path.join(root, f"mapper_{len(mapper)}.json")
+    with open(mapper_path, 'w') as f:
+        json.dump(mapper, f, indent=1)
+    return mapper_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic pairs for benchmarks")
+    parser.add_argument("--output", required=True, help="Directory of the wav files and mapper")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Length of reference files")
+    parser.add_argument("--pairs", type=int, default=10, help="Number of pairs")
+    parser.add_argument("--sr", type=int, default=22050, help="Sampling rate of wavefile")
+    parser.add_argument("--f0", type=float, default=None, help="Mean F0 of every file, drawn in [90, 240] Hz per pair by default")
+    args = parser.parse_args()
+    mapper_path = write_fixtures(args.output, args.seconds, args.pairs, args.sr, args.f0)
+    print(f"[INFO] {args.pairs} pairs of {args.seconds} s written, mapper {mapper_path}")
+
+
+if __name__ == "__main__":
+    main()
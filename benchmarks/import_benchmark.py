@@ -0,0 +1,73 @@
+"""Guard the import time of tts_metrics and the startup of the example CLIs
+
+Fails (exit code 1) when a heavy dependency is imported eagerly or a command
+is over the time budget:
+
+    python benchmarks/import_benchmark.py --budget_ms 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# imported on first use only, never by `import tts_metrics.<module>` or `--help`
+HEAVY_MODULES = ('librosa', 'scipy', 'numba', 'pyworld', 'pysptk', 'soundfile', 'soxr', 'fastdtw')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_CHECK = (
+    "import sys, json\n"
+    "import tts_metrics, tts_metrics.mcd, tts_metrics.gpe, tts_metrics.evaluator\n"
+    "print(json.dumps(sorted(m for m in {heavy} if m in sys.modules)))\n"
+)
+
+
+# the examples run against this checkout, installed or not
+ENV = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+
+
+def best_of(command, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, env=ENV, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time guard")
+    parser.add_argument("--budget_ms", type=float, default=200.0, help="Budget of every command, in ms")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    check = subprocess.run([sys.executable, "-c", IMPORT_CHECK.format(heavy=HEAVY_MODULES)],
+                           cwd=ROOT, env=ENV, check=True, capture_output=True, text=True)
+    eager = json.loads(check.stdout.strip().splitlines()[-1])
+    if eager:
+        print(f"[!] Imported eagerly: {', '.join(eager)}")
+        failed = True
+
+    # the interpreter alone is the baseline, it is not part of the budget
+    baseline = best_of([sys.executable, "-c", "pass"], args.repeat)
+    commands = {
+        "import tts_metrics": [sys.executable, "-c", "import tts_metrics"],
+        "import tts_metrics.mcd, .gpe": [sys.executable, "-c", "import tts_metrics.mcd, tts_metrics.gpe"],
+        "examples/mcd/mcd.py --help": [sys.executable, "examples/mcd/mcd.py", "--help"],
+        "examples/gpe/gpe.py --help": [sys.executable, "examples/gpe/gpe.py", "--help"],
+        "tts-metrics run --help": [sys.executable, "-m", "tts_metrics.cli", "run", "--help"],
+    }
+    print(f"| {'command':<30} | {'time (ms)':>9} |")
+    print(f"|{'-' * 32}|{'-' * 11}|")
+    for name, command in commands.items():
+        milliseconds = (best_of(command, args.repeat) - baseline) * 1000
+        failed |= milliseconds > args.budget_ms
+        print(f"| {name:<30} | {milliseconds:>9.1f} |")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
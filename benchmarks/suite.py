@@ -0,0 +1,211 @@
+"""Reproducible timings of the extraction, pitch, DTW and compute() stages on synthetic fixtures
+
+Times wav_to_mcep, get_mfccs, GPE.estimate_pitch and the DTW of MCD on one
+pair at every --durations, then the full MCD and GPE compute() over
+--pair_counts pairs of --compute_seconds. Fixtures are generated (see
+fixtures.py) and kept in --fixtures, so the suite runs offline and later runs
+reuse them. Results go to a JSON file; --baseline compares against the JSON
+of an earlier release and fails (exit code 1) on a slowdown over --tolerance.
+
+    python benchmarks/suite.py --output results/bench.json
+    python benchmarks/suite.py --quick --output new.json --baseline results/bench.json
+
+The full grid (1/10/60 s, 10/1k/10k pairs) takes hours with pyin, --quick
+runs 1 and 10 s with 10 and 100 pairs.
+"""
+import argparse
+import contextlib
+import importlib.metadata
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from fixtures import write_fixtures, write_mapper
+
+from tts_metrics.gpe import GPE, GPEConfig
+from tts_metrics.mcd import MCD, MCDConfig
+from tts_metrics.utils.audio_cache import get_waveform_cache
+from tts_metrics.utils.data_utils import get_mfccs, wav_to_mcep
+from tts_metrics.utils.dtw import dtw
+from tts_metrics.utils.profiling import Profiler, get_profiler, set_profiler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGES = ('numpy', 'scipy', 'librosa', 'numba', 'pyworld', 'pysptk', 'soundfile', 'soxr')
+
+
+def parse_list(text, cast):
+    return [cast(value) for value in text.split(",") if value]
+
+
+def timed(fn, repeat, setup=None):
+    """Run `fn` `repeat` times, `setup` before each run (not timed)
+
+    Returns:
+        dict: best and mean seconds, and the runs
+    """
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {'best_seconds': min(runs), 'mean_seconds': sum(runs) / len(runs), 'runs': runs}
+
+
+def environment():
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'commit': commit, 'packages': versions}
+
+
+def cold():
+    # every timed run decodes its audio, as a first run over a corpus does
+    get_waveform_cache().clear()
+
+
+def component_benchmarks(root, mapper_path, seconds, args):
+    ref_file, syn_file = next(iter(json.load(open(mapper_path)).items()))
+    ref_path, syn_path = os.path.join(root, ref_file), os.path.join(root, syn_file)
+    config = MCDConfig(sampling_rate=args.sr)
+    gpe = GPE(root, mapper_path, GPEConfig(method=args.method, sampling_rate=args.sr), "GPE")
+    mcep_1 = wav_to_mcep(ref_path, SAMPLING_RATE=args.sr)
+    mcep_2 = wav_to_mcep(syn_path, SAMPLING_RATE=args.sr)
+
+    benchmarks = {
+        'wav_to_mcep': lambda: wav_to_mcep(ref_path, alpha=config.alpha, fft_size=config.fft_size,
+                                           mcep_size=config.mcep_size, SAMPLING_RATE=args.sr,
+                                           FRAME_PERIOD=config.frame_period),
+        'get_mfccs': lambda: get_mfccs(ref_path, sample_rate=args.sr, n_mfcc=config.K, hop_length=config.hop_length),
+        'estimate_pitch': lambda: gpe.estimate_pitch(ref_file),
+        'dtw': lambda: dtw(mcep_1[:, 1:], mcep_2[:, 1:], metric='log_spec_dB'),
+    }
+    rows = []
+    for name, fn in benchmarks.items():
+        fn()  # warm-up: lazy imports and first-call compilation are not part of the timing
+        row = timed(fn, args.repeat, setup=cold if name != 'dtw' else None)
+        row.update(benchmark=name, audio_seconds=seconds, pairs=1)
+        if name == 'dtw':
+            row['frames'] = [len(mcep_1), len(mcep_2)]
+        rows.append(row)
+        print(f"[INFO] {name} on {seconds} s: {row['best_seconds']:.3f} s")
+    return rows
+
+
+def compute_benchmarks(root, mapper_path, num_pairs, seconds, args):
+    rows = []
+    for metric in args.metrics:
+        store = tempfile.mkdtemp(prefix="tts_metrics_bench_")
+
+        def run():
+            # the summaries compute() prints would bury the suite's own output
+            with contextlib.redirect_stdout(io.StringIO()):
+                if metric == 'mcd':
+                    # absolute outdir: the feature store lives in a scratch directory, not next to the fixtures
+                    MCD(root, mapper_path, MCDConfig(sampling_rate=args.sr), use_mfcc=False, name="MCD",
+                        mceps_outdir=store, num_workers=args.num_workers).compute()
+                else:
+                    GPE(root, mapper_path, GPEConfig(method=args.method, sampling_rate=args.sr), "GPE",
+                        num_workers=args.num_workers).compute()
+
+        def setup():
+            cold()
+            shutil.rmtree(store, ignore_errors=True)
+            set_profiler(Profiler(enabled=True))
+
+        try:
+            row = timed(run, args.repeat, setup=setup)
+            stages = get_profiler().to_dict()
+        finally:
+            set_profiler(Profiler())
+            shutil.rmtree(store, ignore_errors=True)
+        row.update(benchmark=f"{metric}.compute", audio_seconds=seconds, pairs=num_pairs,
+                   pairs_per_second=num_pairs / row['best_seconds'], profile=stages)
+        rows.append(row)
+        print(f"[INFO] {metric}.compute over {num_pairs} pairs of {seconds} s: {row['best_seconds']:.3f} s")
+    return rows
+
+
+def compare(rows, baseline_path, tolerance):
+    """Return the benchmarks slower than in the baseline by more than `tolerance`
+    """
+    with open(baseline_path) as f:
+        baseline = {(row['benchmark'], row['audio_seconds'], row['pairs']): row for row in json.load(f)['results']}
+    regressions = []
+    for row in rows:
+        previous = baseline.get((row['benchmark'], row['audio_seconds'], row['pairs']))
+        if previous is None:
+            continue
+        ratio = row['best_seconds'] / previous['best_seconds']
+        status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+        print(f"| {row['benchmark']:<16} | {row['audio_seconds']:>6g} s | {row['pairs']:>6} pairs "
+              f"| {previous['best_seconds']:>9.3f} -> {row['best_seconds']:>9.3f} s | x{ratio:>5.2f} | {status}")
+        if status != "ok":
+            regressions.append(row)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite on synthetic fixtures")
+    parser.add_argument("--output", required=True, help="JSON file of the results")
+    parser.add_argument("--fixtures", default=os.path.join(ROOT, "benchmarks", "fixtures_cache"),
+                        help="Directory of the generated fixtures, reused across runs")
+    parser.add_argument("--durations", default="1,10,60", help="Comma separated lengths (s) of the component benchmarks")
+    parser.add_argument("--pair_counts", default="10,1000,10000", help="Comma separated numbers of pairs of compute()")
+    parser.add_argument("--compute_seconds", type=float, default=1.0, help="Length of the files scored by compute()")
+    parser.add_argument("--metrics", default="mcd,gpe", help="Comma separated metrics of compute(): mcd, gpe")
+    parser.add_argument("--method", default="pyin", help="F0 estimator of GPE")
+    parser.add_argument("--num_workers", type=int, default=1, help="Number of processes of compute()")
+    parser.add_argument("--sr", type=int, default=22050, help="Sampling rate of wavefile")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark, the best one is compared")
+    parser.add_argument("--quick", action="store_true", help="1 and 10 s, 10 and 100 pairs, 1 run")
+    parser.add_argument("--baseline", default=None, help="JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Slowdown over the baseline reported as a regression")
+    args = parser.parse_args()
+    if args.quick:
+        args.durations, args.pair_counts, args.repeat = "1,10", "10,100", 1
+    args.metrics = parse_list(args.metrics, str)
+
+    dtw([[0.0]], [[0.0]], metric='log_spec_dB')  # JIT warm-up, not part of any timing
+    rows = []
+    for seconds in parse_list(args.durations, float):
+        root = os.path.join(args.fixtures, f"{seconds:g}s")
+        rows += component_benchmarks(root, write_fixtures(root, seconds, 1, args.sr), seconds, args)
+
+    root = os.path.join(args.fixtures, f"{args.compute_seconds:g}s")
+    pair_counts = parse_list(args.pair_counts, int)
+    full_mapper = json.load(open(write_fixtures(root, args.compute_seconds, max(pair_counts), args.sr)))
+    for num_pairs in pair_counts:
+        mapper_path = write_mapper(root, dict(list(full_mapper.items())[:num_pairs]))
+        rows += compute_benchmarks(root, mapper_path, num_pairs, args.compute_seconds, args)
+
+    report = {'environment': environment(), 'arguments': vars(args), 'results': rows}
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] {len(rows)} benchmarks written to {args.output}")
+
+    if args.baseline is not None and compare(rows, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
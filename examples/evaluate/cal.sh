@@ -0,0 +1,4 @@
+python examples/evaluate/evaluate.py \
+        --dataroot data/audio \
+        --datapairs data/mapper.json \
+        --use_dtw 1
@@ -0,0 +1,85 @@
+import argparse
+import os
+
+from tts_metrics.evaluator import Evaluator, share_world_f0
+from tts_metrics.gpe import GPEConfig
+from tts_metrics.mcd import MCDConfig
+
+def parse_and_config():
+    """Parse arguments and set confirguration parameters.
+    """
+    parser = argparse.ArgumentParser(
+        description="MCD, GPE, VDE and FFE from one WORLD analysis per file"
+        "(see detail in tts_metrics/evaluator.py)"
+    )
+    
+    parser.add_argument(
+        "--dataroot",
+        default="./data/",
+        help="Root dir of pairs exist in JSON",
+    )
+    parser.add_argument(
+        "--datapairs",
+        default="./data/data_pairs.json",
+        help="path to JSON file contains information of pairs",
+    )
+    
+    parser.add_argument(
+        "--use_dtw",
+        type=int,
+        default=0,
+        help="Flag to add Dynamic time warping phase before calculating metrics. 1 to turn on and 0 for vice versa"
+    )
+    
+    parser.add_argument(
+        "--sr",
+        type=int,
+        default=22050,
+        help="Sampling rate of wavefile"
+    )
+    parser.add_argument(
+        "--method",
+        type=str,
+        default='dio',
+        help="F0 estimator of GPE, 'dio' reads the F0 of the WORLD analysis of MCD"
+    )
+    
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of processes scoring pairs in parallel"
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="JSONL journal of per-pair results, rerun with the same path to resume an interrupted run"
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Export per-pair results to <name>_mcd.<ext> and <name>_gpe.<ext> (.csv, .npz or .parquet)"
+    )
+    
+    return parser.parse_args()
+
+def evaluate(args, configs):
+    evaluator = Evaluator(dataroot=args.dataroot,
+                          data_mapper_path=args.datapairs,
+                          metric_configs=configs,
+                          num_workers=args.num_workers,
+                          journal_path=args.journal)
+    results = evaluator.compute()
+    if args.output is not None:
+        root, extension = os.path.splitext(args.output)
+        for metric, result in zip(["mcd", "gpe"], results):
+            result.save(f"{root}_{metric}{extension}")
+    
+if __name__ == "__main__":
+    args = parse_and_config()
+    configs = [MCDConfig(use_dtw=bool(args.use_dtw), sampling_rate=args.sr),
+               GPEConfig(use_dtw=bool(args.use_dtw), sampling_rate=args.sr, method=args.method)]
+    if args.method == 'dio':
+        share_world_f0(*configs)
+    print(f'[!] Evaluation using DTW is set to {bool(args.use_dtw)}')
+    evaluate(args, configs)
@@ -1,10 +1,8 @@
 import argparse
 import logging
 import os
-import yaml
 
-from tts_metrics.gpe import GPE, GPEConfig
-import librosa
+from tts_metrics.gpe import GPE, GPEConfig, FMAX_C7, FMIN_C2
 
 def parse_and_config():
     """Parse arguments and set confirguration parameters.
@@ -36,7 +34,7 @@ def parse_and_config():
         "--method",
         type=str,
         default='pyin',
-        help="Number of MFCCs coefficient to be extracted"
+        help="F0 estimator: pyin, yin, dio, harvest, rapt or swipe"
     )
     
     parser.add_argument(
@@ -48,13 +46,13 @@ def parse_and_config():
     parser.add_argument(
         "--fmin",
         type=float,
-        default=librosa.note_to_hz('C2'),
+        default=FMIN_C2,
         help="Minimum frequency to be estimated"
     )
     parser.add_argument(
         "--fmax",
         type=float,
-        default=librosa.note_to_hz('C7'),
+        default=FMAX_C7,
         help="Maximum frequency to be estimated"
     )
     parser.add_argument(
@@ -65,21 +63,50 @@ def parse_and_config():
     )
     
     
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of processes scoring pairs in parallel"
+    )
+    parser.add_argument(
+        "--streaming",
+        type=int,
+        default=0,
+        help="Flag to read audio block by block with bounded memory, for long-form files. 1 to turn on, needs --use_dtw 0"
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="JSONL journal of per-pair results, rerun with the same path to resume an interrupted run"
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Export per-pair results to this .csv, .npz or .parquet file"
+    )
+    
     return parser.parse_args()
 
 def compute_GPE(args, config):
     gpe = GPE(dataroot=args.dataroot,
                          data_mapper_path=args.datapairs,
                          metric_config=config,
-                         name="DTW-GPE")
-    gpe.compute()
+                         name="DTW-GPE",
+                         num_workers=args.num_workers,
+                         journal_path=args.journal)
+    results = gpe.compute()
+    if args.output is not None:
+        results.save(args.output)
     
 if __name__ == "__main__":
     args = parse_and_config()
     config = GPEConfig(use_dtw=bool(args.use_dtw),
+                           method=args.method,
                            sampling_rate=args.sr,
                            fmin=args.fmin,
                            fmax=args.fmax,
-                           frame_length=args.frame_length)
+                           frame_length=args.frame_length,
+                           streaming=bool(args.streaming))
     print(f'[!] GPE using DTW is set to {config.use_dtw}')
     compute_GPE(args, config)
\ No newline at end of file
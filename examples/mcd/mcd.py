@@ -1,12 +1,9 @@
 import argparse
 import logging
 import os
-import yaml
 
 from tts_metrics.mcd import MCD, MCDConfig
 
-import librosa
-
 def parse_and_config():
     """Parse arguments and set confirguration parameters.
     """
@@ -53,6 +50,29 @@ def parse_and_config():
         help="Flag toggle using MFCCs or mel ceptral"
     )
     
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of processes scoring pairs in parallel"
+    )
+    parser.add_argument(
+        "--streaming",
+        type=int,
+        default=0,
+        help="Flag to read audio block by block with bounded memory, for long-form files. 1 to turn on, needs --use_dtw 0"
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="JSONL journal of per-pair results, rerun with the same path to resume an interrupted run"
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Export per-pair results to this .csv, .npz or .parquet file"
+    )
+    
     return parser.parse_args()
 
 def compute_MCD(args, config):
@@ -60,11 +80,15 @@ def compute_MCD(args, config):
                          data_mapper_path=args.datapairs,
                          metric_config=mcd_config,
                          use_mfcc=bool(args.use_mfcc),
-                         name="DTW-MCD")
-    mcd_calculator.compute()
+                         name="DTW-MCD",
+                         num_workers=args.num_workers,
+                         journal_path=args.journal)
+    results = mcd_calculator.compute()
+    if args.output is not None:
+        results.save(args.output)
     
 if __name__ == "__main__":
     args = parse_and_config()
-    mcd_config = MCDConfig(use_dtw=bool(args.use_dtw), K = args.K)
+    mcd_config = MCDConfig(use_dtw=bool(args.use_dtw), K = args.K, streaming=bool(args.streaming))
     print(f'[!] MCD using DTW is set to {mcd_config.use_dtw}')
     compute_MCD(args, mcd_config)
\ No newline at end of file
@@ -40,7 +40,6 @@ requirements = {
         "g2p_en",
         "dataclasses",
         "pyopenjtalk",
-        "fastdtw",
         "pyworld",
         "pysptk"
     ],
@@ -49,15 +48,15 @@ requirements = {
         "pytest>=3.3.0",
         "hacking>=1.1.0",
     ],
+    # only benchmarks/dtw_benchmark.py compares against it
+    "benchmark": ["fastdtw"],
 }
 
 
 # @signofthefour: update console script for easy workflow
 entry_points = {
     "console_scripts": [
-        "tts-metrics-mcd=tensorflow_tts.bin.preprocess:preprocess",
-        "tensorflow-tts-compute-statistics=tensorflow_tts.bin.preprocess:compute_statistics",
-        "tensorflow-tts-normalize=tensorflow_tts.bin.preprocess:normalize",
+        "tts-metrics=tts_metrics.cli:main",
     ]
 }
 
@@ -109,5 +108,5 @@ with open("README.md", "r") as fh:
     setup_requires=setup_requires,
     tests_require=tests_require,
     extras_require=extras_require,
-    # entry_points=entry_points,
+    entry_points=entry_points,
 )
\ No newline at end of file
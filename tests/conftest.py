@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+# synthetic speech of the benchmarks, no external data needed
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def fixture_pairs(tmp_path_factory):
+    """(dataroot, mapper path) of 3 synthetic pairs of 1 s at 22050 Hz
+    """
+    pytest.importorskip("soundfile")
+    from fixtures import write_fixtures
+
+    root = str(tmp_path_factory.mktemp("audio"))
+    return root, write_fixtures(root, seconds=1.0, num_pairs=3)
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip("soundfile")
+pytest.importorskip("librosa")
+
+from tts_metrics.utils.audio_cache import WaveformCache
+
+SR = 16000
+
+
+def write_wav(path, seconds=0.5, sr=SR, seed=0):
+    wav = 0.1 * np.random.default_rng(seed).standard_normal(int(seconds * sr))
+    sf.write(str(path), wav.astype(np.float32), sr)
+    return str(path)
+
+
+def test_second_load_is_a_memory_hit(tmp_path):
+    path = write_wav(tmp_path / "a.wav")
+    cache = WaveformCache()
+    first = cache.load(path, sr=SR)
+    assert cache.load(path, sr=SR) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not first.flags.writeable
+
+
+def test_least_recently_used_is_evicted_at_the_byte_cap(tmp_path):
+    paths = [write_wav(tmp_path / f"{i}.wav", seed=i) for i in range(3)]
+    # room for two waveforms of 0.5 s at 16 kHz in float32
+    cache = WaveformCache(max_bytes=2 * 8000 * 4)
+    cache.load(paths[0], sr=SR)
+    cache.load(paths[1], sr=SR)
+    cache.load(paths[0], sr=SR)
+    cache.load(paths[2], sr=SR)
+    assert cache.current_bytes <= cache.max_bytes
+    cached = {key[0] for key in cache._entries}
+    assert cached == {os.path.abspath(paths[0]), os.path.abspath(paths[2])}
+    cache.load(paths[1], sr=SR)
+    assert cache.misses == 4
+
+
+def test_changed_file_is_decoded_again(tmp_path):
+    path = write_wav(tmp_path / "a.wav")
+    cache = WaveformCache()
+    first = cache.load(path, sr=SR)
+    # same size, new mtime
+    write_wav(path, seed=1)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    second = cache.load(path, sr=SR)
+    assert cache.misses == 2 and not np.array_equal(first, second)
+    # new size
+    write_wav(path, seconds=0.25, seed=1)
+    assert len(cache.load(path, sr=SR)) == SR // 4
+    assert cache.misses == 3
+
+
+def test_every_sampling_rate_has_its_own_entry(tmp_path):
+    path = write_wav(tmp_path / "a.wav")
+    cache = WaveformCache()
+    native = cache.load(path, sr=SR)
+    resampled = cache.load(path, sr=8000)
+    assert (len(native), len(resampled)) == (SR // 2, 4000)
+    assert cache.load(path, sr=8000) is resampled and cache.load(path, sr=SR) is native
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_disk_store_is_reused_by_a_new_cache(tmp_path):
+    path = write_wav(tmp_path / "a.wav")
+    first = WaveformCache(cache_dir=str(tmp_path / "store")).load(path, sr=8000)
+    cache = WaveformCache(cache_dir=str(tmp_path / "store"))
+    np.testing.assert_array_equal(cache.load(path, sr=8000), first)
+    assert (cache.disk_hits, cache.misses) == (1, 0)
+
+
+def test_stats_report_entries_bytes_and_counts(tmp_path):
+    path = write_wav(tmp_path / "a.wav")
+    cache = WaveformCache()
+    cache.load(path, sr=SR)
+    cache.load(path, sr=SR)
+    assert cache.stats() == {'entries': 1, 'bytes': 8000 * 4, 'hits': 1, 'disk_hits': 0, 'misses': 1}
@@ -0,0 +1,35 @@
+import argparse
+
+import pytest
+
+from tts_metrics import cli
+
+
+@pytest.mark.parametrize("argv", [
+    ["run", "all", "--datapairs", "pairs.json", "--output", "out.npz", "--reference_corpus", "corpus"],
+    ["stats", "stats.json", "--reference_corpus", "corpus"],
+    ["merge", "--output", "out.npz", "shard.npz", "--reference_corpus", "corpus"],
+])
+def test_reference_corpus_is_rejected_where_unused(argv, capsys):
+    with pytest.raises(SystemExit) as error:
+        cli.main(argv)
+    assert error.value.code != 0
+    assert "reference_corpus" in str(error.value.code) + capsys.readouterr().err
+
+
+def test_reference_corpus_is_a_metric_option(capsys):
+    with pytest.raises(SystemExit):
+        cli.main(["run", "--help"])
+    help_text = capsys.readouterr().out
+    assert help_text.index("mcd and gpe:") < help_text.rindex("--reference_corpus REFERENCE_CORPUS")
+
+
+@pytest.mark.parametrize("options, shared", [([], True), (["--method", "dio"], True), (["--sr", "16000"], True),
+                                             (["--method", "yin"], False), (["--fmin", "60"], False)])
+def test_all_shares_the_world_f0_by_default(options, shared):
+    from tts_metrics.evaluator import Evaluator
+
+    parser = argparse.ArgumentParser()
+    cli.add_run_parser(parser.add_subparsers())
+    configs = cli._metric_configs(parser.parse_args(["run", "all", *options]))
+    assert Evaluator(None, None, configs).shares_f0() == shared
@@ -0,0 +1,103 @@
+import itertools
+
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+from tts_metrics.utils.dtw import (_accumulate_numpy, _accumulate_python, band_cost, band_limits, cost_matrix, dtw,
+                                   log_spec_dB_const)
+
+
+def exact_dtw(x, y, scale=1.0):
+    # textbook unconstrained DTW, steps (1, 0), (0, 1), (1, 1)
+    x, y = np.asarray(x, dtype=np.float64).reshape(len(x), -1), np.asarray(y, dtype=np.float64).reshape(len(y), -1)
+    acc = np.full((len(x) + 1, len(y) + 1), np.inf)
+    acc[0, 0] = 0.0
+    for i, j in itertools.product(range(1, len(x) + 1), range(1, len(y) + 1)):
+        cost = scale * np.linalg.norm(x[i - 1] - y[j - 1])
+        acc[i, j] = cost + min(acc[i - 1, j], acc[i, j - 1], acc[i - 1, j - 1])
+    return acc[-1, -1]
+
+
+def assert_valid_path(path_x, path_y, n, m):
+    assert (path_x[0], path_y[0]) == (0, 0)
+    assert (path_x[-1], path_y[-1]) == (n - 1, m - 1)
+    steps = set(zip(np.diff(path_x).tolist(), np.diff(path_y).tolist()))
+    assert steps <= {(1, 0), (0, 1), (1, 1)}
+
+
+def path_cost(x, y, path_x, path_y, scale=1.0):
+    x, y = np.asarray(x).reshape(len(x), -1), np.asarray(y).reshape(len(y), -1)
+    return scale * np.linalg.norm(x[path_x] - y[path_y], axis=1).sum()
+
+
+@pytest.mark.parametrize("n, m", [(1, 1), (1, 2), (1, 7), (1, 40), (7, 1), (40, 1), (2, 30), (30, 2)])
+@pytest.mark.parametrize("band", [None, 0, 1, 3, 10])
+def test_degenerate_lengths_match_exact_dtw(n, m, band):
+    rng = np.random.default_rng(n * 100 + m)
+    x, y = rng.standard_normal((n, 3)), rng.standard_normal((m, 3))
+    distance, path_x, path_y = dtw(x, y, band=band)
+    assert np.isfinite(distance)
+    assert distance == pytest.approx(exact_dtw(x, y), rel=1e-12)
+    assert_valid_path(path_x, path_y, n, m)
+    assert distance == pytest.approx(path_cost(x, y, path_x, path_y), rel=1e-12)
+
+
+@pytest.mark.parametrize("n, m", [(12, 12), (20, 33), (41, 17)])
+def test_unbanded_and_wide_band_match_exact_dtw(n, m):
+    rng = np.random.default_rng(n * m)
+    x, y = rng.standard_normal((n, 4)), rng.standard_normal((m, 4))
+    expected = exact_dtw(x, y, log_spec_dB_const)
+    for band in (None, max(n, m)):
+        distance, path_x, path_y = dtw(x, y, metric='log_spec_dB', band=band)
+        assert distance == pytest.approx(expected, rel=1e-12)
+        assert_valid_path(path_x, path_y, n, m)
+
+
+@pytest.mark.parametrize("n, m", [(20, 33), (41, 17), (50, 50)])
+@pytest.mark.parametrize("band", [0, 2, 5])
+def test_band_is_an_upper_bound_with_a_reachable_end(n, m, band):
+    rng = np.random.default_rng(n + m + band)
+    x, y = rng.standard_normal(n), rng.standard_normal(m)
+    distance, path_x, path_y = dtw(x, y, band=band)
+    assert exact_dtw(x, y) <= distance + 1e-9 < np.inf
+    assert_valid_path(path_x, path_y, n, m)
+    lo, hi = band_limits(n, m, band)
+    assert np.all((path_y >= lo[path_x]) & (path_y < hi[path_x]))
+
+
+@pytest.mark.parametrize("n, m, band", [(1, 30, 2), (30, 1, 2), (25, 40, 3), (40, 25, None)])
+def test_numpy_fallback_matches_loop_kernel(n, m, band):
+    rng = np.random.default_rng(7)
+    x, y = rng.standard_normal((n, 2)), rng.standard_normal((m, 2))
+    lo, hi = band_limits(n, m, band)
+    cost = band_cost(x, y, lo, hi)
+    np.testing.assert_array_equal(_accumulate_numpy(cost, lo, hi), _accumulate_python(cost, lo, hi))
+
+
+@pytest.mark.parametrize("n, m, band", [(60, 90, 3), (90, 60, 0), (200, 210, 20)])
+def test_band_cost_holds_the_band_of_the_full_matrix(n, m, band):
+    rng = np.random.default_rng(n + m)
+    x, y = rng.standard_normal((n, 3)), rng.standard_normal((m, 3))
+    lo, hi = band_limits(n, m, band)
+    cost = band_cost(x, y, lo, hi, metric='log_spec_dB', block_rows=16)
+    assert cost.shape == (n, (hi - lo).max()) and cost.shape[1] < m
+    full = cost_matrix(x, y, metric='log_spec_dB')
+    for i in range(n):
+        np.testing.assert_array_equal(cost[i, :hi[i] - lo[i]], full[i, lo[i]:hi[i]])
+        assert np.all(np.isinf(cost[i, hi[i] - lo[i]:]))
+
+
+def test_banded_memory_does_not_grow_with_the_matrix():
+    # 30 s pairs at 5 ms frames: the full matrix alone would be 300 MB
+    tracemalloc = pytest.importorskip("tracemalloc")
+    rng = np.random.default_rng(0)
+    x, y = rng.standard_normal((6000, 24)), rng.standard_normal((6300, 24))
+    dtw(x[:10], y[:10], band=2)  # compile the kernels outside the measure
+    tracemalloc.start()
+    distance, path_x, path_y = dtw(x, y, metric='log_spec_dB', band=20)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert np.isfinite(distance)
+    assert peak < 20 * 1024 ** 2
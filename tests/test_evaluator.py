@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyworld")
+pytest.importorskip("pysptk")
+pytest.importorskip("librosa")
+
+from tts_metrics.evaluator import Evaluator
+from tts_metrics.gpe import GPE, GPEConfig
+from tts_metrics.mcd import MCD, MCDConfig
+
+
+def assert_same_results(expected, actual):
+    expected, actual = expected.to_columns(), actual.to_columns()
+    assert list(expected['ref_file']) == list(actual['ref_file'])
+    for key in ('mcd', 'gpe', 'vde', 'ffe', 'num_frames'):
+        if key in expected:
+            np.testing.assert_allclose(actual[key], expected[key], rtol=1e-9, atol=1e-12, err_msg=key)
+
+
+@pytest.mark.parametrize("gpe_config", [GPEConfig(method='dio'), GPEConfig(method='yin')], ids=['dio', 'yin'])
+def test_evaluator_equals_standalone_metrics(fixture_pairs, gpe_config):
+    dataroot, mapper = fixture_pairs
+    evaluator = Evaluator(dataroot, mapper, [MCDConfig(), gpe_config])
+    assert not evaluator.shares_f0()
+    mcd_results, gpe_results = evaluator.compute()
+    assert_same_results(MCD(dataroot, mapper, MCDConfig(), use_mfcc=False, name="MCD").compute(), mcd_results)
+    assert_same_results(GPE(dataroot, mapper, gpe_config, "GPE").compute(), gpe_results)
+
+
+def test_evaluator_shared_f0_equals_standalone_gpe(fixture_pairs):
+    # a 5 ms hop at 16 kHz and the WORLD F0 range: GPE reads the F0 of the shared analysis
+    dataroot, mapper = fixture_pairs
+    mcd_config = MCDConfig(sampling_rate=16000)
+    gpe_config = GPEConfig(method='dio', fmin=71.0, fmax=800.0, frame_length=320, sampling_rate=16000)
+    evaluator = Evaluator(dataroot, mapper, [mcd_config, gpe_config])
+    assert evaluator.shares_f0()
+    mcd_results, gpe_results = evaluator.compute()
+    assert_same_results(MCD(dataroot, mapper, mcd_config, use_mfcc=False, name="MCD").compute(), mcd_results)
+    assert_same_results(GPE(dataroot, mapper, gpe_config, "GPE").compute(), gpe_results)
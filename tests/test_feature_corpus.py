@@ -0,0 +1,48 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from tts_metrics.utils.feature_corpus import FeatureCorpus
+
+
+def features(seed, dim=3):
+    rng = np.random.default_rng(seed)
+    return {f"spk/{i}.wav": rng.standard_normal((int(rng.integers(1, 50)), dim)) for i in range(5)}
+
+
+def test_packed_features_read_back(tmp_path):
+    items = features(0)
+    corpus = FeatureCorpus.write(str(tmp_path), items.items(), params={'kind': 'mcep'})
+    assert len(corpus) == len(items) and corpus.params == {'kind': 'mcep'}
+    for reopened in (corpus, FeatureCorpus(str(tmp_path)), pickle.loads(pickle.dumps(corpus))):
+        for utt_id, feature in items.items():
+            assert utt_id in reopened
+            np.testing.assert_array_equal(reopened.get(utt_id), feature)
+
+
+def test_missing_utterance_is_none(tmp_path):
+    corpus = FeatureCorpus.write(str(tmp_path), features(0).items())
+    assert "spk/missing.wav" not in corpus
+    assert corpus.get("spk/missing.wav") is None
+    empty = FeatureCorpus.write(str(tmp_path / "empty"), [])
+    assert len(empty) == 0 and empty.get("spk/0.wav") is None
+
+
+def test_rewrite_leaves_open_readers_and_failed_writes_alone(tmp_path):
+    old, new = features(0), features(1)
+    reader = FeatureCorpus.write(str(tmp_path), old.items())
+    rewritten = FeatureCorpus.write(str(tmp_path), new.items())
+    for utt_id in old:
+        np.testing.assert_array_equal(reader.get(utt_id), old[utt_id])
+        np.testing.assert_array_equal(rewritten.get(utt_id), new[utt_id])
+
+    def failing():
+        yield "spk/0.wav", np.zeros((4, 3))
+        yield "spk/1.wav", np.zeros((4, 2))
+    files = sorted(os.listdir(tmp_path))
+    with pytest.raises(ValueError, match="spk/1.wav"):
+        FeatureCorpus.write(str(tmp_path), failing())
+    assert sorted(os.listdir(tmp_path)) == files
+    np.testing.assert_array_equal(FeatureCorpus(str(tmp_path)).get("spk/0.wav"), new["spk/0.wav"])
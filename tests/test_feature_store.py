@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from tts_metrics.utils.feature_store import FeatureStore
+
+
+@pytest.fixture
+def audio(tmp_path):
+    for name, content in (("a.wav", b"audio a"), ("b.wav", b"audio b")):
+        (tmp_path / name).write_bytes(content)
+    (tmp_path / "copy").mkdir()
+    (tmp_path / "copy" / "a.wav").write_bytes(b"audio a")
+    return tmp_path
+
+
+def extractor(calls, value):
+    def extract():
+        calls.append(value)
+        return np.full((4, 3), value, dtype=np.float64)
+    return extract
+
+
+def test_same_content_and_params_is_a_hit(audio, tmp_path):
+    store, calls = FeatureStore(str(tmp_path / "store")), []
+    first = store.get_or_compute(str(audio / "a.wav"), 'mcep', {'alpha': 0.65}, extractor(calls, 1.0))
+    # another path with the same content shares the entry
+    second = store.get_or_compute(str(audio / "copy" / "a.wav"), 'mcep', {'alpha': 0.65}, extractor(calls, 2.0))
+    np.testing.assert_array_equal(second, first)
+    assert calls == [1.0] and (store.hits, store.misses) == (1, 1)
+
+
+def test_changed_params_kind_or_audio_is_a_miss(audio, tmp_path):
+    store, calls = FeatureStore(str(tmp_path / "store")), []
+    store.get_or_compute(str(audio / "a.wav"), 'mcep', {'alpha': 0.65}, extractor(calls, 1.0))
+    store.get_or_compute(str(audio / "a.wav"), 'mcep', {'alpha': 0.42}, extractor(calls, 2.0))
+    store.get_or_compute(str(audio / "a.wav"), 'mfcc', {'alpha': 0.65}, extractor(calls, 3.0))
+    store.get_or_compute(str(audio / "b.wav"), 'mcep', {'alpha': 0.65}, extractor(calls, 4.0))
+    assert calls == [1.0, 2.0, 3.0, 4.0] and store.hits == 0
+    # same name, new content
+    (audio / "a.wav").write_bytes(b"audio a, re-synthesized")
+    store.get_or_compute(str(audio / "a.wav"), 'mcep', {'alpha': 0.65}, extractor(calls, 5.0))
+    assert calls[-1] == 5.0
+
+
+def test_interrupted_put_leaves_no_file(audio, tmp_path, monkeypatch):
+    store = FeatureStore(str(tmp_path / "store"))
+    key = store.make_key(str(audio / "a.wav"), 'mcep', {})
+
+    def save_half(f, feature, allow_pickle=False):
+        f.write(b"\x93NUMPY partial")
+        raise KeyboardInterrupt
+    monkeypatch.setattr(np, "save", save_half)
+    with pytest.raises(KeyboardInterrupt):
+        store.put(key, np.zeros(3))
+    monkeypatch.undo()
+    assert key not in store and store.get(key) is None
+    assert [name for _, _, names in os.walk(store.root) for name in names] == []
+    store.put(key, np.arange(3.0))
+    np.testing.assert_array_equal(store.get(key), np.arange(3.0))
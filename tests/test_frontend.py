@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+pysptk = pytest.importorskip("pysptk")
+pytest.importorskip("pyworld")
+librosa = pytest.importorskip("librosa")
+
+from tts_metrics.utils.frontend import batch_mfccs, power_to_mcep, world_envelope
+
+SR = 22050
+
+
+@pytest.fixture(scope="module")
+def wavs():
+    from fixtures import synthetic_speech
+
+    # different lengths, so the batch is padded
+    return [synthetic_speech(seconds, sr=SR, f0=f0, seed=seed)
+            for seconds, f0, seed in [(0.7, 120.0, 0), (1.0, 210.0, 1), (0.45, 95.0, 2)]]
+
+
+def test_power_to_mcep_is_the_sptk_mcep(wavs):
+    _, sp = world_envelope(wavs[0], SR)
+    expected = np.stack([pysptk.sptk.mcep(frame, order=24, alpha=0.65, maxiter=0, etype=1, eps=1.0E-8,
+                                          min_det=0.0, itype=3) for frame in sp])
+    np.testing.assert_allclose(power_to_mcep(sp, mcep_size=24, alpha=0.65), expected, rtol=1e-10, atol=1e-12)
+
+
+def test_batched_mfccs_are_the_ones_of_every_waveform(wavs):
+    for mfccs, wav in zip(batch_mfccs(wavs, sample_rate=SR, n_mfcc=13), wavs):
+        expected = librosa.feature.mfcc(y=wav, sr=SR, n_mfcc=13, dct_type=2, norm='ortho', lifter=0, hop_length=1024)
+        assert mfccs.shape == expected.shape
+        np.testing.assert_array_equal(mfccs, expected)
@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import REPO_ROOT
+
+# heavy dependencies, imported on first use only
+HEAVY_MODULES = ('numba', 'pyworld', 'pysptk', 'librosa', 'torch', 'scipy', 'soundfile', 'soxr', 'fastdtw')
+
+# over the bare interpreter: numpy alone is ~0.1 s, an eager librosa/numba import is several times this
+IMPORT_BUDGET_SECONDS = 0.3
+
+ENV = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+
+
+def imported_heavy_modules(statement):
+    code = f"import sys, json\n{statement}\nprint(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env=ENV, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("statement", [
+    "import tts_metrics",
+    "import tts_metrics.mcd, tts_metrics.gpe",
+    "import tts_metrics.mcd, tts_metrics.gpe, tts_metrics.evaluator",
+    "import tts_metrics.cli, tts_metrics.server, tts_metrics.stats",
+])
+def test_import_does_not_load_heavy_dependencies(statement):
+    assert imported_heavy_modules(statement) == []
+
+
+def test_cli_help_does_not_load_heavy_dependencies():
+    statement = ("from tts_metrics import cli\n"
+                 "try:\n    cli.main(['run', '--help'])\nexcept SystemExit:\n    pass")
+    assert imported_heavy_modules(statement) == []
+
+
+def best_time(code, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env=ENV, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_import_time():
+    # the interpreter alone is the baseline
+    elapsed = best_time("import tts_metrics.mcd, tts_metrics.gpe") - best_time("pass")
+    assert elapsed < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from tts_metrics.base import BaseMetric
+from tts_metrics.utils.journal import ScoreJournal
+from tts_metrics.utils.manifest import write_manifest
+
+
+class SizeMetric(BaseMetric):
+    """Scores a pair by the sizes of its files, counting the pairs it really scores"""
+    scored = []
+
+    def score_pair(self, ref_file, syn_file):
+        SizeMetric.scored.append((ref_file, syn_file))
+        sizes = [os.path.getsize(os.path.join(self.dataroot, wavefile)) for wavefile in (ref_file, syn_file)]
+        return float(sizes[1] - sizes[0]), sizes[0]
+
+    def compute(self):
+        return self.score_pairs(list(self.data_mapper.items()))
+
+
+@pytest.fixture
+def dataroot(tmp_path):
+    pairs = []
+    for i in range(6):
+        (tmp_path / f"ref{i}.wav").write_bytes(b"r" * (10 + i))
+        (tmp_path / f"syn{i}.wav").write_bytes(b"s" * (20 + 2 * i))
+        pairs.append((f"ref{i}.wav", f"syn{i}.wav"))
+    write_manifest(str(tmp_path / "pairs.jsonl"), pairs)
+    SizeMetric.scored = []
+    return tmp_path
+
+
+def make_metric(dataroot, config="a"):
+    metric = SizeMetric(str(dataroot), str(dataroot / "pairs.jsonl"), config, "size",
+                        journal_path=str(dataroot / "journal.jsonl"))
+    metric.progress = False
+    return metric
+
+
+def test_resume_skips_journaled_pairs(dataroot):
+    first = make_metric(dataroot).compute()
+    assert len(SizeMetric.scored) == 6
+    SizeMetric.scored = []
+    assert make_metric(dataroot).compute() == first
+    assert SizeMetric.scored == []
+
+
+def test_changed_audio_or_config_is_scored_again(dataroot):
+    make_metric(dataroot).compute()
+    SizeMetric.scored = []
+    (dataroot / "syn2.wav").write_bytes(b"s" * 99)
+    results = make_metric(dataroot).compute()
+    assert SizeMetric.scored == [("ref2.wav", "syn2.wav")]
+    assert results[2] == (99.0 - 12, 12)
+    SizeMetric.scored = []
+    make_metric(dataroot, config="b").compute()
+    assert len(SizeMetric.scored) == 6
+
+
+def test_interrupted_run_resumes_where_it_stopped(dataroot):
+    metric = make_metric(dataroot)
+    with metric.scoring_session():
+        scores = metric.iter_scores(list(metric.data_mapper.items()))
+        next(scores), next(scores)
+        scores.close()
+    # a crash in the middle of a write leaves a cut line
+    with open(dataroot / "journal.jsonl", "a") as f:
+        f.write('{"ref": "ref2.wav", "syn": "sy')
+    SizeMetric.scored = []
+    make_metric(dataroot).compute()
+    assert SizeMetric.scored == [(f"ref{i}.wav", f"syn{i}.wav") for i in range(2, 6)]
+
+
+def test_journal_entries_are_keyed_by_params(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    inputs = [[1, 2], [3, 4]]
+    with ScoreJournal(path, {'config': 1}) as journal:
+        journal.append("r.wav", "s.wav", inputs, (1.5, 10))
+    with ScoreJournal(path, {'config': 1}) as journal:
+        assert len(journal) == 1
+        assert journal.get("r.wav", "s.wav", inputs) == (1.5, 10)
+        assert journal.get("r.wav", "s.wav", [[1, 2], [3, 5]]) is None
+    with ScoreJournal(path, {'config': 2}) as journal:
+        assert len(journal) == 0
+    with open(path) as f:
+        assert [json.loads(line)['result'] for line in f] == [[1.5, 10]]
@@ -0,0 +1,94 @@
+import json
+import pickle
+
+import pytest
+
+from tts_metrics.base import shard_pairs
+from tts_metrics.utils.manifest import Manifest, iter_json_object, write_manifest
+
+NUM_PAIRS = 1001
+
+
+def make_pairs(num_pairs=NUM_PAIRS):
+    pairs = [(f"spk{i % 7}/ref_{i:05d}.wav", f"step_5000/syn_{i:05d}.wav") for i in range(num_pairs)]
+    # escapes and non-ASCII take the slow paths of the parsers
+    pairs[3] = ('quote "d"\\ref.wav', "syné.wav")
+    return pairs
+
+
+@pytest.fixture(params=["pairs.jsonl", "pairs.tsv", "pairs.json"])
+def manifest_path(request, tmp_path):
+    path = str(tmp_path / request.param)
+    pairs = make_pairs()
+    if path.endswith(".tsv"):
+        pairs[3] = ("quote_ref.wav", "syné.wav")  # no tabs or newlines in TSV
+    write_manifest(path, pairs)
+    return path, pairs
+
+
+def test_reads_every_pair_in_order(manifest_path):
+    path, pairs = manifest_path
+    manifest = Manifest(path)
+    assert list(manifest.items()) == pairs
+    assert list(manifest) == [ref_file for ref_file, _ in pairs]
+    assert len(manifest) == len(pairs)
+
+
+@pytest.mark.parametrize("num_shards", [1, 2, 3, 7, 13, NUM_PAIRS + 10])
+def test_shards_are_disjoint_and_cover_every_pair(manifest_path, num_shards):
+    path, pairs = manifest_path
+    shards = [list(Manifest(path, shard_index, num_shards).items()) for shard_index in range(num_shards)]
+    seen = [pair for shard in shards for pair in shard]
+    assert len(seen) == len(pairs)
+    assert sorted(seen) == sorted(pairs)
+    for shard in shards:
+        # every shard keeps the file order
+        positions = [pairs.index(pair) for pair in shard]
+        assert positions == sorted(positions)
+
+
+@pytest.mark.parametrize("num_shards", [3, 7])
+def test_json_stride_shards_match_shard_pairs(tmp_path, num_shards):
+    path = str(tmp_path / "mapper.json")
+    pairs = make_pairs()
+    write_manifest(path, pairs)
+    mapper = dict(pairs)
+    for shard_index in range(num_shards):
+        assert list(Manifest(path, shard_index, num_shards).items()) == \
+            list(shard_pairs(mapper, shard_index, num_shards).items())
+
+
+def test_byte_range_shards_of_lines_with_comments_and_header(tmp_path):
+    path = tmp_path / "pairs.tsv"
+    lines = ["ref\tsyn", "# a comment", ""] + [f"r{i}.wav\ts{i}.wav" for i in range(50)] + ["", "# end"]
+    path.write_text("\n".join(lines) + "\n")
+    shards = [list(Manifest(str(path), i, 4).items()) for i in range(4)]
+    assert [pair for shard in shards for pair in shard] == [(f"r{i}.wav", f"s{i}.wav") for i in range(50)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_iter_json_object_matches_json_load(tmp_path, chunk_size):
+    mapper = dict(make_pairs(200))
+    text = json.dumps(mapper, indent=2, ensure_ascii=False)
+    path = tmp_path / "mapper.json"
+    path.write_text(text, encoding="utf-8")
+    with open(path, encoding="utf-8") as f:
+        assert list(iter_json_object(f, chunk_size)) == list(mapper.items())
+
+
+def test_pickles_as_its_path(tmp_path):
+    path = str(tmp_path / "pairs.jsonl")
+    write_manifest(path, make_pairs())
+    manifest = Manifest(path, 2, 5)
+    copy = pickle.loads(pickle.dumps(manifest))
+    assert len(pickle.dumps(manifest)) < 1024
+    assert list(copy.items()) == list(manifest.items())
+
+
+def test_invalid_shards_and_splits(tmp_path):
+    path = str(tmp_path / "mapper.json")
+    write_manifest(path, make_pairs(10))
+    with pytest.raises(ValueError):
+        Manifest(path, 3, 3)
+    with pytest.raises(ValueError):
+        Manifest(path, split='bytes')
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from tts_metrics.mcd import batch_mcd, frame_log_spec_dB_dist, log_spec_dB_dist
+from tts_metrics.utils.dtw import dtw
+
+
+def random_cepstra(seed, num_pairs=5, dim=25):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 120, size=(num_pairs, 2))
+    return ([rng.normal(size=(n, dim)) for n, _ in lengths],
+            [rng.normal(size=(m, dim)) for _, m in lengths])
+
+
+def reference_mcd(cep_1, cep_2, use_dtw):
+    # the per-frame loop batch_mcd replaces
+    cep_1, cep_2 = cep_1[:, 1:], cep_2[:, 1:]
+    if use_dtw:
+        _, path_1, path_2 = dtw(cep_1, cep_2, metric='log_spec_dB')
+    else:
+        path_1 = path_2 = np.arange(min(len(cep_1), len(cep_2)))
+    total = sum(log_spec_dB_dist(cep_1[i], cep_2[j]) for i, j in zip(path_1, path_2))
+    return total / len(path_1), len(path_1), total
+
+
+def test_frame_distances_equal_the_per_frame_ones():
+    x, y = np.random.default_rng(0).normal(size=(2, 3, 40, 24))
+    expected = [[log_spec_dB_dist(x[b, t], y[b, t]) for t in range(40)] for b in range(3)]
+    np.testing.assert_allclose(frame_log_spec_dB_dist(x, y), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("use_dtw", [False, True])
+def test_batch_mcd_equals_the_per_frame_loop(use_dtw):
+    ceps_1, ceps_2 = random_cepstra(1)
+    distances, num_frames, corpus_mcd = batch_mcd(ceps_1, ceps_2, use_dtw=use_dtw)
+    expected = [reference_mcd(cep_1, cep_2, use_dtw) for cep_1, cep_2 in zip(ceps_1, ceps_2)]
+    np.testing.assert_allclose(distances, [mcd for mcd, _, _ in expected], rtol=1e-10)
+    np.testing.assert_array_equal(num_frames, [n for _, n, _ in expected])
+    total_frames = sum(n for _, n, _ in expected)
+    assert corpus_mcd == pytest.approx(sum(total for _, _, total in expected) / total_frames, rel=1e-10)
+
+
+def test_batch_mcd_of_no_pairs():
+    distances, num_frames, corpus_mcd = batch_mcd([], [])
+    assert len(distances) == len(num_frames) == 0 and corpus_mcd == 0
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+
+from tts_metrics.utils.pitch import yin
+
+SR = 22050
+PARAMS = dict(sr=SR, fmin=65.0, fmax=2093.0, frame_length=1024, hop_length=256)
+
+
+def tone_then_noise(level):
+    # 0.5 s of a 150 Hz harmonic tone, then 0.5 s of white noise at the same level
+    t = np.arange(SR // 2) / SR
+    tone = sum(np.sin(2 * np.pi * 150.0 * k * t) / k for k in range(1, 6))
+    noise = np.random.default_rng(0).standard_normal(SR // 2)
+    wav = np.concatenate([tone / np.abs(tone).max(), noise / np.abs(noise).max()])
+    return (level * wav).astype(np.float32)
+
+
+@pytest.mark.parametrize("center", [True, False])
+def test_yin_f0_is_the_one_of_librosa(center):
+    wav = tone_then_noise(0.5)
+    f0, voiced = yin(wav, center=center, **PARAMS)
+    expected = librosa.yin(wav, center=center, fmin=PARAMS['fmin'], fmax=PARAMS['fmax'], sr=SR,
+                           frame_length=PARAMS['frame_length'], hop_length=PARAMS['hop_length'])
+    assert f0.shape == voiced.shape == expected.shape
+    np.testing.assert_allclose(f0[voiced], expected[voiced], rtol=1e-5)
+    assert np.all(f0[~voiced] == 0)
+
+
+def test_yin_voicing_follows_periodicity_not_level():
+    # loud noise is unvoiced, a quiet tone is voiced
+    for level in (0.5, 0.02):
+        f0, voiced = yin(tone_then_noise(level), **PARAMS)
+        half = len(voiced) // 2
+        assert voiced[2:half - 2].all()
+        assert not voiced[half + 2:-2].any()
+        np.testing.assert_allclose(f0[2:half - 2], 150.0, rtol=0.01)
+
+
+def test_yin_silence_is_unvoiced():
+    f0, voiced = yin(np.zeros(SR, dtype=np.float32), **PARAMS)
+    assert not voiced.any() and not f0.any()
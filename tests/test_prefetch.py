@@ -0,0 +1,47 @@
+import threading
+import time
+
+from tts_metrics.utils.prefetch import PrefetchConfig, Prefetcher
+
+
+def test_results_come_back_in_order():
+    # later items finish first
+    def fetch(item):
+        time.sleep(0.002 * (10 - item))
+        return item * item
+
+    prefetcher = Prefetcher(fetch, range(10), PrefetchConfig(depth=4, num_threads=4), nbytes=lambda result: 0)
+    assert list(prefetcher) == [(item, item * item) for item in range(10)]
+    assert prefetcher.requests == 10
+
+
+def test_finished_items_are_capped_by_memory():
+    started, lock = [0], threading.Lock()
+
+    def fetch(item):
+        with lock:
+            started[0] += 1
+        return item
+
+    # room for 3 finished items of 100 bytes, depth alone would allow 10
+    prefetcher = Prefetcher(fetch, range(20), PrefetchConfig(depth=10, max_bytes=250, num_threads=2),
+                            nbytes=lambda result: 100)
+    for received, (item, _) in enumerate(prefetcher, start=1):
+        with lock:
+            assert started[0] - received <= 3
+        # slow scoring: every started item is finished at the next check
+        time.sleep(0.01)
+    assert prefetcher.peak_bytes <= 400
+
+
+def test_starvation_is_reported():
+    def fetch(item):
+        time.sleep(0.02)
+        return item
+
+    prefetcher = Prefetcher(fetch, range(5), PrefetchConfig(depth=1, num_threads=1), nbytes=lambda result: 0)
+    assert [item for item, _ in prefetcher] == list(range(5))
+    # scoring takes no time, so every item is waited for
+    assert (prefetcher.starved, prefetcher.requests) == (5, 5)
+    assert prefetcher.wait_seconds > 0
+    assert "5/5 pairs not ready" in prefetcher.summary()
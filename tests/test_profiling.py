@@ -0,0 +1,69 @@
+import pickle
+import time
+
+import pytest
+
+from tts_metrics.utils import profiling
+from tts_metrics.utils.profiling import Profiler
+
+
+@pytest.fixture
+def shared_profiler():
+    # the process-wide profiler the library records to, restored afterwards
+    previous = profiling.get_profiler()
+    profiler = Profiler(enabled=True)
+    profiling.set_profiler(profiler)
+    yield profiler
+    profiling.set_profiler(previous)
+
+
+def record(profiler):
+    with profiler.timer('decode'):
+        time.sleep(0.01)
+    with profiler.timer('decode'):
+        pass
+    profiler.count('decoded_bytes', 100)
+    profiler.count('decoded_bytes', 28)
+    profiler.cache_access('waveform_cache', True)
+    profiler.cache_access('waveform_cache', True)
+    profiler.cache_access('waveform_cache', False)
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    record(profiler)
+    profile = profiler.to_dict()
+    assert (profile['stages'], profile['counters'], profile['cache_hit_rates']) == ({}, {}, {})
+    assert profiler.drain() is None
+
+
+def test_enabled_profiler_reports_stages_counters_and_hit_rates():
+    profiler = Profiler(enabled=True)
+    record(profiler)
+    profile = profiler.to_dict()
+    assert profile['stages']['decode']['calls'] == 2
+    assert profile['stages']['decode']['seconds'] >= 0.01
+    assert profile['counters'] == {'decoded_bytes': 128, 'waveform_cache.hits': 2, 'waveform_cache.misses': 1}
+    assert profile['cache_hit_rates'] == {'waveform_cache': pytest.approx(2 / 3)}
+
+
+def test_module_functions_record_to_the_shared_profiler(shared_profiler):
+    with profiling.timer('pitch'):
+        profiling.count('pitch_frames', 3)
+        profiling.cache_access('reference_corpus', False)
+    profile = shared_profiler.to_dict()
+    assert profile['stages']['pitch']['calls'] == 1
+    assert profile['counters'] == {'pitch_frames': 3, 'reference_corpus.misses': 1}
+
+
+def test_worker_snapshots_merge_into_the_parent():
+    parent = Profiler(enabled=True)
+    worker = pickle.loads(pickle.dumps(parent))
+    assert worker.enabled and worker.to_dict()['counters'] == {}
+    record(worker)
+    record(parent)
+    parent.merge(worker.drain())
+    assert worker.drain() == {'stages': {}, 'counters': {}}
+    profile = parent.to_dict()
+    assert profile['stages']['decode']['calls'] == 4
+    assert profile['counters']['decoded_bytes'] == 256
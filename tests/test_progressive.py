@@ -0,0 +1,45 @@
+import numpy as np
+
+from tts_metrics.base import BaseMetric
+from tts_metrics.results import MetricResults
+from tts_metrics.utils.manifest import write_manifest
+
+
+class IndexMetric(BaseMetric):
+    """Scores pair i by a value read from its name, nan for unvoiced ones"""
+
+    def score_pair(self, ref_file, syn_file):
+        value = ref_file.rsplit("_", 1)[1]
+        return (float('nan') if value == "nan" else float(value)), 100
+
+    def make_results(self, pairs, scores):
+        return MetricResults("GPE", pairs, {'gpe': [value for value, _ in scores]}, [frames for _, frames in scores])
+
+    def compute(self):
+        return self.make_results(list(self.data_mapper.items()), self.score_pairs(list(self.data_mapper.items())))
+
+
+def make_metric(tmp_path, values):
+    pairs = [(f"ref{i}_{value}", f"syn{i}") for i, value in enumerate(values)]
+    write_manifest(str(tmp_path / "pairs.jsonl"), pairs)
+    return IndexMetric(str(tmp_path), str(tmp_path / "pairs.jsonl"), None, "GPE")
+
+
+def test_progressive_stops_once_the_interval_is_narrow(tmp_path):
+    values = np.random.default_rng(0).normal(0.2, 0.01, 1000).round(6)
+    results = make_metric(tmp_path, values).compute_progressive(0.01, chunk_size=50)
+    assert 30 <= len(results) < 1000
+    assert abs(results.utterance_mean['gpe'] - values.mean()) < 0.01
+
+
+def test_nan_values_do_not_block_the_stop(tmp_path):
+    # every other pair has no voiced frames: its GPE is nan and left out of the interval
+    values = ["nan" if i % 2 else f"{0.2 + 0.001 * (i % 7):.3f}" for i in range(1000)]
+    results = make_metric(tmp_path, values).compute_progressive(0.01, chunk_size=50)
+    assert len(results) < 1000
+
+
+def test_undefined_interval_is_not_converged(tmp_path, capsys):
+    results = make_metric(tmp_path, ["nan"] * 100).compute_progressive(0.01, chunk_size=20, min_pairs=20)
+    assert len(results) == 100
+    assert capsys.readouterr().out.count("[WARNING] No confidence interval for gpe") == 1
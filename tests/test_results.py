@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from tts_metrics.results import MetricResults
+
+
+@pytest.fixture
+def results():
+    # a NaN GPE (no voiced frame) and a path that needs quoting in CSV
+    pairs = [("ref/a.wav", "syn/a.wav"), ("ref/b, take 2.wav", "syn/b.wav"), ("ref/c.wav", "syn/c.wav")]
+    metrics = {'gpe': [0.125, float('nan'), 1 / 3], 'vde': [0.0, 0.5, 0.1]}
+    return MetricResults("GPE", pairs, metrics, [120, 0, 37])
+
+
+def assert_round_trip(expected, actual):
+    assert list(actual.ref_files) == list(expected.ref_files)
+    assert list(actual.syn_files) == list(expected.syn_files)
+    assert list(actual.metrics) == list(expected.metrics)
+    for key in expected.metrics:
+        np.testing.assert_array_equal(actual[key], expected[key])
+    np.testing.assert_array_equal(actual.num_frames, expected.num_frames)
+    assert actual.num_frames.dtype == np.int64
+
+
+@pytest.mark.parametrize("extension", [".csv", ".npz"])
+def test_save_and_load_round_trip(results, tmp_path, extension):
+    path = str(tmp_path / f"results{extension}")
+    results.save(path)
+    assert_round_trip(results, MetricResults.load(path))
+
+
+def test_parquet_round_trip_keeps_the_name(results, tmp_path):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "results.parquet")
+    results.save(path)
+    loaded = MetricResults.load(path)
+    assert_round_trip(results, loaded)
+    assert loaded.name == "GPE"
+
+
+def test_unknown_extension_is_rejected(results, tmp_path):
+    with pytest.raises(ValueError, match="Unknown results format"):
+        results.save(str(tmp_path / "results.json"))
+    with pytest.raises(ValueError, match="Unknown results format"):
+        MetricResults.load(str(tmp_path / "results.json"))
@@ -0,0 +1,153 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyworld")
+pytest.importorskip("pysptk")
+pytest.importorskip("librosa")
+
+from tts_metrics.mcd import MCD, MCDConfig
+from tts_metrics.utils.prefetch import PrefetchConfig
+
+
+class RecordingMCD(MCD):
+    """MCD recording the windows given to prepare_pairs and the files missing features when each pair is scored"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.windows, self.unprepared = [], 0
+
+    def prepare_pairs(self, pairs):
+        self.windows.append(list(pairs))
+        super().prepare_pairs(pairs)
+
+    def score_pair(self, ref_file, syn_file):
+        self.unprepared += len(list(self.missing_features((ref_file, syn_file))))
+        return super().score_pair(ref_file, syn_file)
+
+
+@pytest.fixture
+def pairs_root(fixture_pairs, tmp_path):
+    # a fresh feature store for every test, over the shared audio
+    dataroot, mapper = fixture_pairs
+    with open(mapper) as f:
+        pairs = list(json.load(f).items()) * 3
+    # the 3 pairs three times over: windows share files with the ones before them
+    root = tmp_path / "audio"
+    root.mkdir()
+    for name in os.listdir(dataroot):
+        if name.endswith(".wav"):
+            os.symlink(os.path.join(dataroot, name), root / name)
+    lines = [json.dumps({'ref': ref, 'syn': syn}) for ref, syn in pairs]
+    (root / "pairs.jsonl").write_text("\n".join(lines) + "\n")
+    return str(root), str(root / "pairs.jsonl")
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 4])
+@pytest.mark.parametrize("prefetch", [None, PrefetchConfig(depth=3, num_threads=2)], ids=["serial", "prefetch"])
+def test_windows_are_prepared_before_they_are_scored(pairs_root, batch_size, prefetch):
+    dataroot, manifest = pairs_root
+    metric = RecordingMCD(dataroot, manifest, MCDConfig(batch_size=batch_size), use_mfcc=False, name="MCD",
+                          prefetch=prefetch)
+    metric.progress = False
+    results = metric.compute()
+    pairs = list(metric.data_mapper.items())
+    assert metric.windows == [pairs[start:start + batch_size] for start in range(0, len(pairs), batch_size)]
+    if batch_size > 1:
+        assert metric.unprepared == 0
+
+    expected = MCD(dataroot, manifest, MCDConfig(batch_size=1), use_mfcc=False, name="MCD",
+                   mceps_outdir="mceps_expected").compute()
+    np.testing.assert_allclose(results.metrics['mcd'], expected.metrics['mcd'], rtol=1e-9)
+
+
+@pytest.mark.parametrize("metric_name", ["mcd", "gpe"])
+def test_pool_results_equal_serial_results_in_order(pairs_root, metric_name):
+    from tts_metrics.gpe import GPE, GPEConfig
+
+    dataroot, manifest = pairs_root
+
+    def run(num_workers):
+        if metric_name == "mcd":
+            # a feature store per run, so the pool extracts rather than reads the serial features
+            metric = MCD(dataroot, manifest, MCDConfig(), use_mfcc=False, name="MCD", num_workers=num_workers,
+                         mceps_outdir=f"mceps_{num_workers}")
+        else:
+            metric = GPE(dataroot, manifest, GPEConfig(method='dio'), "GPE", num_workers=num_workers)
+        metric.progress = False
+        return metric.compute()
+
+    serial, pooled = run(1), run(2)
+    np.testing.assert_array_equal(pooled.ref_files, serial.ref_files)
+    np.testing.assert_array_equal(pooled.syn_files, serial.syn_files)
+    np.testing.assert_array_equal(pooled.num_frames, serial.num_frames)
+    for key, values in serial.metrics.items():
+        np.testing.assert_allclose(pooled.metrics[key], values, rtol=1e-12)
+
+
+@pytest.mark.parametrize("metric_name", ["mcd", "gpe"])
+def test_scores_of_arrays_equal_scores_of_files(fixture_pairs, tmp_path, metric_name):
+    from tts_metrics.gpe import GPE, GPEConfig
+    from tts_metrics.utils.audio_cache import load_wav
+
+    dataroot, mapper = fixture_pairs
+    with open(mapper) as f:
+        pairs = list(json.load(f).items())
+    if metric_name == "mcd":
+        metric = MCD(dataroot, mapper, MCDConfig(), use_mfcc=False, name="MCD", mceps_outdir=str(tmp_path / "mceps"))
+    else:
+        metric = GPE(dataroot, mapper, GPEConfig(method='dio'), "GPE")
+    metric.progress = False
+    expected = metric.compute()
+
+    refs, syns = [[load_wav(os.path.join(dataroot, wavefile), sr=22050) for wavefile in side] for side in zip(*pairs)]
+    ids = [ref for ref, _ in pairs]
+    in_memory = metric.score_arrays(refs, syns, ids=ids)
+    np.testing.assert_array_equal(in_memory.ref_files, expected.ref_files)
+    np.testing.assert_array_equal(in_memory.num_frames, expected.num_frames)
+    for key, values in expected.metrics.items():
+        np.testing.assert_allclose(in_memory.metrics[key], values, rtol=1e-12)
+    for i, (ref, syn) in enumerate(zip(refs, syns)):
+        score = metric.score_array(ref, syn)
+        assert score[-1] == expected.num_frames[i]
+        np.testing.assert_allclose(score[:-1], [values[i] for values in expected.metrics.values()], rtol=1e-12)
+
+
+def test_systems_scored_together_equal_systems_scored_apart(fixture_pairs, tmp_path, monkeypatch):
+    import librosa
+    from tts_metrics.gpe import GPE, GPEConfig
+    from tts_metrics.utils import audio_cache
+
+    dataroot, mapper = fixture_pairs
+    with open(mapper) as f:
+        refs, syns = zip(*json.load(f).items())
+    systems = {'a': dict(zip(refs, syns)),
+               'b': dict(zip(refs, syns[1:] + syns[:1])),
+               'c': dict(zip(refs, syns[2:] + syns[:2]))}
+
+    def gpe(mapper_path=None):
+        metric = GPE(dataroot, mapper_path, GPEConfig(method='dio'), "GPE")
+        metric.progress = False
+        return metric
+
+    expected = {}
+    for system, pairs in systems.items():
+        (tmp_path / f"{system}.json").write_text(json.dumps(pairs))
+        expected[system] = gpe(str(tmp_path / f"{system}.json")).compute()
+
+    # room for two waveforms of about 1 s: a reference stays cached only while its pairs follow each other
+    monkeypatch.setattr(audio_cache, "_default_cache", audio_cache.WaveformCache(max_bytes=2 * 24000 * 4))
+    decoded = []
+    load = librosa.load
+    monkeypatch.setattr(librosa, "load", lambda path, **kwargs: decoded.append(os.path.basename(path)) or load(path, **kwargs))
+    together = gpe().score_systems(systems)
+    assert sorted(together) == sorted(systems)
+    assert [decoded.count(ref) for ref in refs] == [1] * len(refs), decoded
+    for system, results in together.items():
+        assert results.name == f"GPE/{system}"
+        np.testing.assert_array_equal(results.ref_files, expected[system].ref_files)
+        np.testing.assert_array_equal(results.syn_files, expected[system].syn_files)
+        np.testing.assert_array_equal(results.num_frames, expected[system].num_frames)
+        for key, values in expected[system].metrics.items():
+            np.testing.assert_array_equal(results.metrics[key], values)
@@ -0,0 +1,74 @@
+import contextlib
+import os
+
+import pytest
+
+from tts_metrics.mcd import MCD
+from tts_metrics.server import ScoringServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "served" / "audio").mkdir(parents=True)
+    scoring = ScoringServer(str(tmp_path / "served" / "audio"), root=str(tmp_path / "served"), max_metrics=2)
+    yield scoring
+    scoring.close()
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    # config -> open sessions of the MCDs built by the server, without starting any pool
+    opened = {}
+
+    @contextlib.contextmanager
+    def scoring_session(metric):
+        key = metric.config.frame_period
+        opened[key] = opened.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            opened[key] -= 1
+    monkeypatch.setattr(MCD, "scoring_session", scoring_session)
+    return opened
+
+
+def request(config, **kwargs):
+    return dict({'metric': 'mcd', 'config': {'frame_period': config}}, **kwargs)
+
+
+def test_metrics_are_evicted_least_recently_used_first(server, sessions):
+    for frame_period in (5.0, 10.0, 5.0, 15.0):
+        server.get_metric(server.request_key(request(frame_period)))
+    # 10 ms was the least recently used when 15 ms came in
+    assert sessions == {5.0: 1, 10.0: 0, 15.0: 1}
+    assert server.health()['metrics'] == 2
+    server.close()
+    assert sessions == {5.0: 0, 10.0: 0, 15.0: 0}
+
+
+def test_requests_cannot_leave_the_root(server, tmp_path):
+    (tmp_path / "outside").mkdir()
+    os.symlink(tmp_path / "outside", tmp_path / "served" / "link")
+    for path in ("..", "../outside", str(tmp_path / "outside"), "link"):
+        with pytest.raises(ValueError, match="outside"):
+            server.request_key(request(5.0, dataroot=path))
+        with pytest.raises(ValueError, match="outside"):
+            server.request_key(request(5.0, reference_corpus=path))
+    for pair in (["../../etc/passwd", "syn.wav"], ["ref.wav", str(tmp_path / "outside" / "syn.wav")]):
+        with pytest.raises(ValueError, match="outside"):
+            server.score(request(5.0, pairs=[pair]))
+
+
+def test_request_dataroots_resolve_to_one_key(server, tmp_path):
+    default = server.request_key(request(5.0))
+    assert server.request_key(request(5.0, dataroot="audio")) == default
+    assert server.request_key(request(5.0, dataroot=str(tmp_path / "served" / "audio" / "."))) == default
+
+
+def test_health_reports_the_waveform_cache(server, monkeypatch):
+    from tts_metrics.utils import audio_cache
+
+    monkeypatch.setattr(audio_cache, "_default_cache", audio_cache.WaveformCache())
+    health = server.health()
+    assert health['status'] == 'ok' and health['metrics'] == 0
+    assert health['waveform_cache'] == {'entries': 0, 'bytes': 0, 'hits': 0, 'disk_hits': 0, 'misses': 0}
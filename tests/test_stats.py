@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from tts_metrics.results import MetricResults
+from tts_metrics.stats import OnlineAggregate, Reservoir, RunningStats
+
+
+def make_scores(num_pairs, seed=0):
+    rng = np.random.default_rng(seed)
+    return {'mcd': rng.gamma(4.0, 1.5, num_pairs), 'ffe': rng.beta(1.0, 20.0, num_pairs)}, \
+        rng.integers(50, 800, num_pairs)
+
+
+def aggregate_of(metrics, num_frames, start, stop, reservoir_size=100, seed=0):
+    return OnlineAggregate("MCD", ['mcd', 'ffe'], reservoir_size, seed).update(
+        {key: values[start:stop] for key, values in metrics.items()}, num_frames[start:stop])
+
+
+def test_running_stats_merge_equals_one_stream():
+    rng = np.random.default_rng(1)
+    values, weights = rng.normal(3.0, 2.0, 1000), rng.integers(1, 100, 1000)
+    whole = RunningStats().update(values, weights)
+    merged = RunningStats()
+    for start in range(0, 1000, 137):
+        merged.merge(RunningStats().update(values[start:start + 137], weights[start:start + 137]))
+    assert merged.count == 1000
+    assert merged.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert merged.variance == pytest.approx(values.var(ddof=1), rel=1e-10)
+    assert merged.weighted_mean == pytest.approx(np.average(values, weights=weights), rel=1e-12)
+    assert merged.weighted_variance == pytest.approx(whole.weighted_variance, rel=1e-10)
+    assert (merged.min, merged.max) == (values.min(), values.max())
+
+
+def test_shard_aggregates_merge_into_the_full_run():
+    metrics, num_frames = make_scores(1000)
+    full = aggregate_of(metrics, num_frames, 0, 1000)
+    shards = [aggregate_of(metrics, num_frames, start, start + 250, seed=start) for start in range(0, 1000, 250)]
+    merged = OnlineAggregate.combine(shards)
+    assert len(merged) == len(full) == 1000
+    assert len(merged.reservoir) == 100
+    assert merged.total_frames == full.total_frames == num_frames.sum()
+    for key in ('mcd', 'ffe'):
+        assert merged.utterance_mean[key] == pytest.approx(full.utterance_mean[key], rel=1e-12)
+        assert merged.frame_weighted[key] == pytest.approx(full.frame_weighted[key], rel=1e-12)
+        assert merged.std[key] == pytest.approx(full.std[key], rel=1e-10)
+    # combine leaves its inputs untouched
+    assert len(shards[0]) == 250
+
+
+def test_aggregate_of_results_matches_metric_results():
+    metrics, num_frames = make_scores(300)
+    pairs = [(f"ref{i}.wav", f"syn{i}.wav") for i in range(300)]
+    results = MetricResults("MCD", pairs, metrics, num_frames)
+    aggregate = results.stats(reservoir_size=50)
+    for key in ('mcd', 'ffe'):
+        assert aggregate.utterance_mean[key] == pytest.approx(results.utterance_mean[key], rel=1e-12)
+        assert aggregate.frame_weighted[key] == pytest.approx(results.frame_weighted[key], rel=1e-12)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    metrics, num_frames = make_scores(200)
+    aggregate = aggregate_of(metrics, num_frames, 0, 200, reservoir_size=20)
+    path = str(tmp_path / "stats.json")
+    aggregate.save(path)
+    loaded = OnlineAggregate.load(path)
+    assert loaded.to_dict() == aggregate.to_dict()
+    empty = OnlineAggregate("GPE", ['gpe'])
+    assert OnlineAggregate.from_dict(empty.to_dict()).to_dict() == empty.to_dict()
+
+
+@pytest.mark.parametrize("sizes", [(100, 900), (500, 500), (5, 995)])
+def test_merged_reservoir_is_uniform_over_both_streams(sizes):
+    # rows of the first stream are 0, of the second 1: a uniform sample holds them in proportion
+    fractions = []
+    for seed in range(200):
+        first = Reservoir(50, 1, seed).update(np.zeros(sizes[0]), np.ones(sizes[0], dtype=np.int64))
+        second = Reservoir(50, 1, seed + 1000).update(np.ones(sizes[1]), np.ones(sizes[1], dtype=np.int64))
+        merged = first.merge(second)
+        assert len(merged) == 50 and merged.seen == sum(sizes)
+        fractions.append(merged.values.mean())
+    assert np.mean(fractions) == pytest.approx(sizes[1] / sum(sizes), abs=0.02)
+
+
+def test_reservoir_is_uniform_over_the_stream():
+    counts = np.zeros(100)
+    for seed in range(400):
+        reservoir = Reservoir(10, 1, seed)
+        for start in range(0, 100, 7):
+            rows = np.arange(start, min(start + 7, 100))
+            reservoir.update(rows, np.ones(len(rows), dtype=np.int64))
+        counts[reservoir.values[:, 0].astype(int)] += 1
+    # every row kept with probability 10 / 100
+    assert counts.sum() == 4000
+    assert counts[:50].sum() / counts.sum() == pytest.approx(0.5, abs=0.03)
+
+
+def test_confidence_intervals_cover_the_mean():
+    metrics, num_frames = make_scores(2000, seed=3)
+    aggregate = aggregate_of(metrics, num_frames, 0, 2000, reservoir_size=500)
+    for method in ('bootstrap', 'normal'):
+        low, high = aggregate.confidence_intervals(0.95, method=method)['mcd']['utterance_mean']
+        assert low < aggregate.utterance_mean['mcd'] < high
+
+
+def test_reservoirs_of_different_sizes_merge_into_the_smaller():
+    for small, large in ((Reservoir(10, 1, 0), Reservoir(50, 1, 1)), (Reservoir(50, 1, 0), Reservoir(10, 1, 1))):
+        small.update(np.zeros(100), np.ones(100, dtype=np.int64))
+        large.update(np.ones(1000), np.ones(1000, dtype=np.int64))
+        merged = small.merge(large)
+        assert merged.size == len(merged) == 10 and merged.seen == 1100
+
+
+def test_non_finite_values_are_left_out_and_counted():
+    # GPE of pairs without voiced frames is nan
+    metrics, num_frames = make_scores(200)
+    metrics['ffe'][::10] = np.nan
+    finite = np.isfinite(metrics['ffe'])
+    aggregate = aggregate_of(metrics, num_frames, 0, 100).merge(aggregate_of(metrics, num_frames, 100, 200))
+    stats = aggregate.stats['ffe']
+    assert (stats.count, stats.nonfinite) == (180, 20)
+    assert aggregate.utterance_mean['ffe'] == pytest.approx(metrics['ffe'][finite].mean(), rel=1e-12)
+    assert aggregate.frame_weighted['ffe'] == pytest.approx(
+        np.average(metrics['ffe'][finite], weights=num_frames[finite]), rel=1e-12)
+    assert np.isfinite(aggregate.std['ffe'])
+    for method in ('bootstrap', 'normal'):
+        intervals = aggregate.confidence_intervals(0.95, method=method)['ffe']
+        assert np.all(np.isfinite(intervals['utterance_mean']))
+    assert np.all(np.isfinite(aggregate.confidence_intervals(0.95)['ffe']['frame_weighted']))
+    # MetricResults agrees
+    results = MetricResults("GPE", [(f"ref{i}.wav", f"syn{i}.wav") for i in range(200)], metrics, num_frames)
+    assert results.utterance_mean['ffe'] == pytest.approx(aggregate.utterance_mean['ffe'], rel=1e-12)
+    assert results.frame_weighted['ffe'] == pytest.approx(aggregate.frame_weighted['ffe'], rel=1e-12)
+    assert "20 pairs without a finite value" in aggregate.summary()
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("librosa")
+
+from tts_metrics.gpe import GPE, GPEConfig
+
+
+@pytest.fixture(scope="module")
+def long_file(tmp_path_factory):
+    # 8 s, so small blocks put many block edges inside the file
+    from fixtures import synthetic_speech
+    import soundfile as sf
+
+    root = str(tmp_path_factory.mktemp("long"))
+    sf.write(os.path.join(root, "long.wav"), synthetic_speech(8.0, sr=16000, seed=3), 16000)
+    return root
+
+
+def pitch(root, method, **kwargs):
+    gpe = GPE(root, None, GPEConfig(method=method, sampling_rate=16000, use_dtw=False, **kwargs), "GPE")
+    return gpe.estimate_pitch("long.wav")
+
+
+def test_streamed_yin_is_the_whole_file_one(long_file):
+    whole = pitch(long_file, "yin")
+    streamed = pitch(long_file, "yin", streaming=True, stream_block_frames=64, stream_context_frames=32)
+    np.testing.assert_allclose(streamed[0], whole[0], rtol=1e-5)
+    np.testing.assert_array_equal(streamed[1], whole[1])
+
+
+@pytest.mark.parametrize("method, module", [("dio", "pyworld"), ("swipe", "pysptk")])
+def test_streamed_f0_differs_only_at_the_end_of_the_file(long_file, method, module):
+    pytest.importorskip(module)
+    whole = pitch(long_file, method)
+    streamed = pitch(long_file, method, streaming=True, stream_block_frames=64, stream_context_frames=32)
+    assert len(streamed[0]) == len(whole[0])
+    np.testing.assert_allclose(streamed[0][:-2], whole[0][:-2], rtol=1e-5)
+
+
+def test_streaming_with_unbanded_dtw_is_rejected(long_file):
+    from tts_metrics.mcd import MCD, MCDConfig
+
+    with pytest.raises(ValueError, match="dtw_band"):
+        GPE(long_file, None, GPEConfig(streaming=True), "GPE")
+    with pytest.raises(ValueError, match="dtw_band"):
+        MCD(long_file, None, MCDConfig(streaming=True), use_mfcc=False, name="MCD")
+    MCD(long_file, None, MCDConfig(streaming=True, dtw_band=20), use_mfcc=False, name="MCD")
+
+
+def test_streamed_mcd_of_an_empty_file_is_nan(long_file):
+    from tts_metrics.mcd import MCD, MCDConfig
+    import soundfile as sf
+
+    sf.write(os.path.join(long_file, "empty.wav"), np.zeros(0, dtype=np.float32), 16000)
+    mcd = MCD(long_file, None, MCDConfig(streaming=True, use_dtw=False, sampling_rate=16000), use_mfcc=False, name="MCD")
+    value, num_frames = mcd.mcd_streaming("long.wav", "empty.wav")
+    assert np.isnan(value) and num_frames == 0
@@ -0,0 +1,29 @@
+"""Metrics of speech processing works
+
+Metric classes are imported on first access, so `import tts_metrics` stays cheap.
+"""
+import importlib
+
+_LAZY_ATTRS = {
+    'MCD': 'tts_metrics.mcd',
+    'MCDConfig': 'tts_metrics.mcd',
+    'GPE': 'tts_metrics.gpe',
+    'GPEConfig': 'tts_metrics.gpe',
+    'Evaluator': 'tts_metrics.evaluator',
+    'MetricResults': 'tts_metrics.results',
+    'OnlineAggregate': 'tts_metrics.stats',
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module 'tts_metrics' has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
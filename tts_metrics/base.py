@@ -1,5 +1,56 @@
 import abc
-import json
+import os
+import math
+import contextlib
+import dataclasses
+import itertools
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
+from tts_metrics.stats import OnlineAggregate
+from tts_metrics.utils.audio_cache import get_waveform_cache, set_waveform_cache
+from tts_metrics.utils.feature_corpus import FeatureCorpus
+from tts_metrics.utils.journal import ScoreJournal
+from tts_metrics.utils.lazy import lazy_import
+from tts_metrics.utils.manifest import Manifest
+from tts_metrics.utils.prefetch import Prefetcher
+from tts_metrics.utils.sampling import progressive_order
+from tts_metrics.utils.profiling import cache_access, count, get_profiler, set_profiler
+
+tqdm = lazy_import('tqdm')
+
+_worker_metric = None
+
+
+def _init_worker(metric, waveform_cache, profiler):
+    """Runs once in every pool process: keep the metric around for all its chunks
+    """
+    global _worker_metric
+    _worker_metric = metric
+    set_waveform_cache(waveform_cache)
+    set_profiler(profiler)
+
+
+def _score_in_worker(pair):
+    # what the worker profiled for this pair goes back with its result, None when profiling is off
+    return _worker_metric.score_pair(*pair), get_profiler().drain()
+
+
+def _loaded_nbytes(loaded):
+    return sum(wav.nbytes for _, _, wav in loaded)
+
+
+def shard_pairs(data_mapper, shard_index=0, num_shards=1):
+    """Keep every `num_shards`-th pair of `data_mapper`, starting at `shard_index`
+
+    Striding (rather than contiguous ranges) spreads long and short files over
+    all shards; the shards of one mapper are disjoint and cover it.
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+    return {ref_file: syn_file for i, (ref_file, syn_file) in enumerate(data_mapper.items())
+            if i % num_shards == shard_index}
+
 
 class BaseMetric(metaclass=abc.ABCMeta):
 
@@ -7,28 +58,421 @@ class BaseMetric(metaclass=abc.ABCMeta):
                  dataroot,
                  data_mapper_path,
                  metric_config,
-                 name):
+                 name,
+                 num_workers=1,
+                 chunksize=None,
+                 journal_path=None,
+                 shard_index=0,
+                 num_shards=1,
+                 prefetch=None):
         """Base metric - interface for all metric class in project
 
         Args:
-            dataroot (str): path to root dir of paths in data_mapper
-            data_mapper_path (str): path to data_mapper (format is depend on metric)
+            dataroot (str): path to root dir of paths in data_mapper, None to score arrays only
+            data_mapper_path (str): path to data_mapper, a JSON dict, JSONL or TSV manifest read lazily
+                (see Manifest), None to score arrays only
             config (dataclass/custom class): provide hyperparams of 
             name (str): Name of metric
+            num_workers (int, optional): number of processes scoring pairs, 1 scores serially. Defaults to 1.
+            chunksize (int, optional): pairs submitted to a worker at once. Defaults to None (~4 chunks per worker).
+            journal_path (str, optional): JSONL journal of per-pair results, a restarted run skips
+                the pairs already journaled with unchanged inputs. Defaults to None (no journal).
+            shard_index (int, optional): shard of the mapper scored by this instance, see Manifest. Defaults to 0.
+            num_shards (int, optional): number of shards the mapper is split into. Defaults to 1.
+            prefetch (PrefetchConfig, optional): read and decode the next pairs in background threads
+                while scoring serially. Defaults to None (no prefetch).
         """
         
         self.dataroot = dataroot
-        self.data_mapper = json.load(open(data_mapper_path))
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        # pairs are read from the file whenever they are iterated, never held
+        self.data_mapper = {}
+        if data_mapper_path is not None:
+            self.data_mapper = Manifest(data_mapper_path, shard_index, num_shards)
         self.metric_config = metric_config
         self.name = name
+        self.num_workers = num_workers
+        self.chunksize = chunksize
+        self.journal_path = journal_path
+        self.prefetch = prefetch
+        self.prefetcher = None
+        self.reference_corpus = None
+        self._executor = None
+        self._journal = None
+        self._resumed = 0
+        self.progress = True # progress bar while scoring
         
     def get_metric_name(self):
         """Return metric name
         """
         return self.name
+
+    def score_pair(self, ref_file, syn_file):
+        """Score a single (reference, synthesized) pair
+
+        Must be picklable work: it runs in pool processes when num_workers > 1.
+        """
+        raise NotImplementedError
+
+    def score_array(self, ref, syn, sr=None, features=False):
+        """Score a single pair held in memory, with the extraction and distances of score_pair
+
+        Args:
+            ref (np.ndarray): reference waveform, or its features when `features`
+            syn (np.ndarray): synthesized waveform, or its features when `features`
+            sr (int, optional): sampling rate of the waveforms, resampled to the one of the config
+                when different. Defaults to None (already at it).
+            features (bool, optional): `ref` and `syn` are features as get_features returns them. Defaults to False.
+        """
+        raise NotImplementedError
+
+    def score_arrays(self, refs, syns, sr=None, features=False, ids=None):
+        """Score pairs held in memory, no dataroot, mapper or file involved
+
+        Args:
+            refs (iterable): reference waveforms (or features), see score_array
+            syns (iterable): synthesized waveforms (or features), in the order of `refs`
+            sr (int, optional): sampling rate of the waveforms. Defaults to None (the one of the config).
+            features (bool, optional): inputs are features instead of waveforms. Defaults to False.
+            ids (list, optional): name of every pair in the results. Defaults to None (its index).
+
+        Returns:
+            MetricResults: as compute returns them (one per config for Evaluator)
+        """
+        refs, syns = list(refs), list(syns)
+        if len(refs) != len(syns):
+            raise ValueError(f"Got {len(refs)} reference and {len(syns)} synthesized arrays")
+        ids = [str(i) for i in range(len(refs))] if ids is None else [str(i) for i in ids]
+        scores = [self.score_array(ref, syn, sr=sr, features=features) for ref, syn in zip(refs, syns)]
+        return self.make_results([(pair_id, pair_id) for pair_id in ids], scores)
+
+    def make_results(self, pairs, scores):
+        """Results of `pairs` from their score_pair results
+        """
+        raise NotImplementedError
+
+    def compute_stats(self, reservoir_size=1000, seed=0, chunk_size=1024):
+        """Score every pair of the mapper into constant-memory aggregates instead of per pair results
+
+        Pairs are read from the manifest, scored (in one process pool for the
+        whole run) and go through make_results `chunk_size` at a time, then
+        are dropped once added to the aggregates, see OnlineAggregate.
+
+        Args:
+            reservoir_size (int, optional): pairs sampled for the bootstrap confidence intervals. Defaults to 1000.
+            seed (int, optional): seed of the sampling. Defaults to 0.
+            chunk_size (int, optional): scores held at once. Defaults to 1024.
+
+        Returns:
+            OnlineAggregate: as compute returns MetricResults (one per config for Evaluator)
+        """
+        # results of no pair give the names and metrics of the aggregates
+        empty = self.make_results([], [])
+        aggregates = [OnlineAggregate(results.name, results.metrics, reservoir_size, seed)
+                      for results in (empty if isinstance(empty, list) else [empty])]
+        pairs = iter(self.data_mapper.items())
+        with self.scoring_session():
+            for chunk in iter(lambda: list(itertools.islice(pairs, chunk_size)), []):
+                results = self.make_results(chunk, self.score_pairs(chunk))
+                for aggregate, chunk_results in zip(aggregates, results if isinstance(results, list) else [results]):
+                    aggregate.update_results(chunk_results)
+        for aggregate in aggregates:
+            print(aggregate.summary())
+        return aggregates if isinstance(empty, list) else aggregates[0]
+
+    def compute_progressive(self, half_width, confidence=0.95, stratify=None, chunk_size=64, min_pairs=30, seed=0):
+        """Score pairs in random order until the confidence intervals of the means are narrow enough
+
+        An estimate for ranking checkpoints, at a fraction of the cost of
+        compute: pairs go through score_pairs and make_results `chunk_size` at
+        a time, in the order of progressive_order, and the running utterance
+        means are reported with their normal intervals (corrected for sampling
+        without replacement, so they close once every pair is scored). Scoring
+        stops as soon as every targeted interval is within `half_width`.
+
+        Args:
+            half_width (float or dict): target half-width of the intervals, for every metric or per metric
+                key (e.g. {'mcd': 0.05}, other keys are not waited for)
+            confidence (float, optional): level of the intervals. Defaults to 0.95.
+            stratify (callable or str, optional): speaker of a reference file, see speaker_function.
+                Defaults to None (uniform order).
+            chunk_size (int, optional): pairs scored between two checks. Defaults to 64.
+            min_pairs (int, optional): pairs scored before stopping, the normal interval is unreliable on
+                fewer. Defaults to 30.
+            seed (int, optional): seed of the order. Defaults to 0.
+
+        Returns:
+            MetricResults: of the pairs scored (one per config for Evaluator)
+        """
+        empty = self.make_results([], [])
+        aggregates = [OnlineAggregate(results.name, results.metrics, seed=seed)
+                      for results in (empty if isinstance(empty, list) else [empty])]
+        keys = [key for aggregate in aggregates for key in aggregate.keys]
+        targets = half_width if isinstance(half_width, dict) else dict.fromkeys(keys, half_width)
+        unknown = set(targets) - set(keys)
+        if unknown:
+            raise ValueError(f"Unknown metrics {sorted(unknown)}, expected some of {keys}")
+        pairs = progressive_order(self.data_mapper.items(), stratify, seed)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        scored, scores = [], []
+        undefined = set()
+        # one line per chunk instead of a progress bar per chunk
+        progress, self.progress = self.progress, False
+        try:
+            with self.scoring_session():
+                for start in range(0, len(pairs), chunk_size):
+                    chunk = pairs[start:start + chunk_size]
+                    chunk_scores = self.score_pairs(chunk)
+                    results = self.make_results(chunk, chunk_scores)
+                    for aggregate, chunk_results in zip(aggregates, results if isinstance(results, list) else [results]):
+                        aggregate.update_results(chunk_results)
+                    scored += chunk
+                    scores += chunk_scores
+                    n = len(scored)
+                    correction = math.sqrt((len(pairs) - n) / (len(pairs) - 1)) if len(pairs) > 1 else 0.0
+                    means = {key: value for aggregate in aggregates for key, value in aggregate.utterance_mean.items()}
+                    widths = {key: z * value * correction
+                              for aggregate in aggregates for key, value in aggregate.stderr.items()}
+                    print(f"[INFO] {n}/{len(pairs)} pairs: "
+                          + ", ".join(f"{key} {means[key]:.4f} +/- {widths[key]:.4f}" for key in keys))
+                    # an interval without two finite values (GPE of unvoiced pairs) is not converged
+                    for key in targets:
+                        if n >= min_pairs and math.isnan(widths[key]) and key not in undefined:
+                            undefined.add(key)
+                            print(f"[WARNING] No confidence interval for {key} after {n} pairs "
+                                  f"(fewer than 2 finite values), scoring on")
+                    if n >= min_pairs and all(widths[key] <= target for key, target in targets.items()):
+                        break
+        finally:
+            self.progress = progress
+        if len(scored) < len(pairs):
+            print(f"[INFO] Target half-width reached after {len(scored)} of {len(pairs)} pairs "
+                  f"({100 * len(scored) / len(pairs):.1f} %)")
+        results = self.make_results(scored, scores)
+        for result in (results if isinstance(results, list) else [results]):
+            print(result.summary())
+        return results
+
+    def feature_params(self):
+        """Parameters of the reference features of this metric, recorded in a FeatureCorpus
+        """
+        raise NotImplementedError
+
+    def set_reference_corpus(self, corpus):
+        """Read features of the files packed in `corpus` from it instead of extracting them
+
+        Worker processes map the corpus file again, so its pages are shared by
+        all of them through the OS page cache.
+
+        Args:
+            corpus (str or FeatureCorpus): corpus directory, or opened corpus
+        """
+        if not isinstance(corpus, FeatureCorpus):
+            corpus = FeatureCorpus(corpus)
+        if corpus.params != self.feature_params():
+            raise ValueError(f"Corpus {corpus.root} holds features extracted with {corpus.params}, "
+                             f"this metric needs {self.feature_params()}")
+        self.reference_corpus = corpus
+
+    def score_systems(self, systems):
+        """Score the synthesized files of several systems against the same references, in one pass
+
+        The pairs of all systems go through a single score_pairs (one process
+        pool, one journal), ordered so the pairs of a reference follow each
+        other and its audio and features stay in the caches. Pair a reference
+        corpus (set_reference_corpus) to not extract the references at all.
+
+        Args:
+            systems (dict): system name -> mapper {ref_file: syn_file}, or path to its manifest. Sharded
+                as the mapper of the metric. syn_file can be absolute, for systems outside dataroot.
+
+        Returns:
+            dict: system name -> make_results of its pairs, in the order of its mapper, named "<name>/<system>"
+        """
+        mappers = {}
+        for system, mapper in systems.items():
+            if isinstance(mapper, str):
+                mapper = Manifest(mapper, self.shard_index, self.num_shards)
+            else:
+                mapper = shard_pairs(mapper, self.shard_index, self.num_shards)
+            mappers[system] = list(mapper.items())
+
+        by_reference = {}
+        for system, pairs in mappers.items():
+            for i, (ref_file, syn_file) in enumerate(pairs):
+                by_reference.setdefault(ref_file, []).append((system, i, syn_file))
+        tagged = [(system, i, (ref_file, syn_file))
+                  for ref_file, entries in by_reference.items() for system, i, syn_file in entries]
+        scores = {system: [None] * len(pairs) for system, pairs in mappers.items()}
+        for (system, i, _), score in zip(tagged, self.iter_scores([pair for _, _, pair in tagged])):
+            scores[system][i] = score
+
+        outputs = {}
+        for system, pairs in mappers.items():
+            results = self.make_results(pairs, scores[system])
+            for system_results in (results if isinstance(results, list) else [results]):
+                system_results.name = f"{system_results.name}/{system}"
+            outputs[system] = results
+        return outputs
+
+    def journal_params(self):
+        """Everything besides the audio that changes the score of a pair, see ScoreJournal
+        """
+        return {'metric': type(self).__name__, 'config': repr(self.metric_config)}
+
+    def prefetch_files(self, ref_file, syn_file):
+        """(path, sampling rate) of the audio score_pair will decode, loaded ahead when prefetching
+
+        Files whose features are already stored should be left out. Defaults to none.
+        """
+        return []
+
+    def prepare_pairs(self, pairs):
+        """Runs before a window of `pairs` is scored serially, e.g. to extract the features of many files at once
+
+        Serial runs call it on consecutive windows of prepare_window() pairs,
+        inside the progress bar and with the prefetcher reading the next
+        window meanwhile. Pool workers score one pair at a time and skip it.
+        Defaults to nothing.
+        """
+
+    def prepare_window(self):
+        """Pairs given to prepare_pairs at once. Defaults to 1
+        """
+        return 1
+
+    def _prefetch_window(self, pairs):
+        loaded = []
+        # a file shared by pairs of the window (e.g. a reference of several systems) is read once
+        files = dict.fromkeys(file for pair in pairs for file in self.prefetch_files(*pair))
+        for path, sr in files:
+            try:
+                loaded.append((path, sr, get_waveform_cache().load(path, sr)))
+            except Exception:
+                # only a warm-up: score_pair loads the file again and reports the error
+                pass
+        return loaded
+
+    def score_pairs(self, pairs):
+        """Score every pair, in a process pool when num_workers > 1
+
+        With a journal, pairs already journaled are not scored again and every
+        new result is appended to it as soon as it comes back.
+
+        Args:
+            pairs (iterable): (ref_file, syn_file) tuples
+
+        Returns:
+            list: score_pair result of each pair, in the order of `pairs`
+        """
+        return list(self.iter_scores(pairs))
+
+    def iter_scores(self, pairs):
+        """score_pairs as a generator: results come out in the order of `pairs` as soon as they are known
+        """
+        pairs = list(pairs)
+        if self.journal_path is None:
+            yield from self._score(pairs)
+            return
+        if self._journal is None:
+            with self.scoring_session():
+                yield from self.iter_scores(pairs)
+            return
+
+        journal = self._journal
+        inputs = [journal.fingerprint(os.path.join(self.dataroot, ref_file), os.path.join(self.dataroot, syn_file))
+                  for ref_file, syn_file in pairs]
+        results = [journal.get(ref_file, syn_file, pair_inputs)
+                   for (ref_file, syn_file), pair_inputs in zip(pairs, inputs)]
+        for result in results:
+            cache_access('journal', result is not None)
+        todo = [i for i, result in enumerate(results) if result is None]
+        self._resumed += len(pairs) - len(todo)
+        scored = self._score([pairs[i] for i in todo])
+        for i, result in enumerate(results):
+            if result is None:
+                result = next(scored)
+                journal.append(*pairs[i], inputs[i], result)
+            yield result
+
+    def _score(self, pairs):
+        # yields score_pair results in the order of `pairs`, as they come back
+        if self.num_workers <= 1 or len(pairs) <= 1:
+            yield from self._score_serially(pairs)
+            return
+
+        if self._executor is None:
+            with self.scoring_session():
+                yield from self._score(pairs)
+            return
+        chunksize = self.chunksize or max(1, len(pairs) // (self.num_workers * 4))
+        # map keeps the input order, so aggregates match the serial path exactly
+        for score, profile in tqdm.tqdm(self._executor.map(_score_in_worker, pairs, chunksize=chunksize),
+                                        total=len(pairs), disable=not self.progress):
+            get_profiler().merge(profile)
+            count('pairs')
+            yield score
+
+    def _score_serially(self, pairs):
+        # windows of prepare_window() pairs: prepare_pairs runs on one while the prefetcher reads the next
+        size = max(self.prepare_window(), 1)
+        windows = [pairs[start:start + size] for start in range(0, len(pairs), size)]
+        if self.prefetch is None:
+            items = ((window, []) for window in windows)
+        else:
+            config = self.prefetch
+            if size > 1:
+                # the window being scored and the next ones holding `depth` pairs, at least one
+                config = dataclasses.replace(config, depth=1 + -(-config.depth // size))
+            self.prefetcher = Prefetcher(self._prefetch_window, windows, config, nbytes=_loaded_nbytes)
+            items = iter(self.prefetcher)
+        with tqdm.tqdm(total=len(pairs), disable=not self.progress) as progress_bar:
+            for window, loaded in items:
+                # the cache may have evicted a prefetched waveform since, put it back before use
+                for path, sr, wav in loaded:
+                    get_waveform_cache().prime(path, sr, wav)
+                self.prepare_pairs(window)
+                for ref_file, syn_file in window:
+                    count('pairs')
+                    yield self.score_pair(ref_file, syn_file)
+                    progress_bar.update()
+        if self.prefetch is not None:
+            print(self.prefetcher.summary(unit='windows' if size > 1 else 'pairs'))
+
+    @contextlib.contextmanager
+    def scoring_session(self):
+        """Keep the journal and the process pool open for every score_pairs call in the block, instead of one per call
+
+        Opens only what is configured (journal_path, num_workers > 1) and not open yet.
+        """
+        with contextlib.ExitStack() as stack:
+            if self.journal_path is not None and self._journal is None:
+                self._journal = stack.enter_context(ScoreJournal(self.journal_path, self.journal_params()))
+                self._resumed = 0
+                stack.callback(self._close_journal)
+            if self.num_workers > 1 and self._executor is None:
+                self._executor = stack.enter_context(
+                    ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_worker,
+                                        initargs=(self, get_waveform_cache(), get_profiler())))
+                stack.callback(setattr, self, '_executor', None)
+            yield
+
+    def _close_journal(self):
+        if self._resumed:
+            print(f"[INFO] Resumed from {self.journal_path}: {self._resumed} pairs already scored")
+        self._journal = None
+
+    def __getstate__(self):
+        # sent to worker processes: the pool and prefetch threads stay in the parent
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_journal'] = None
+        state['prefetcher'] = None
+        return state
     
     @abc.abstractmethod
     def compute(self):
         """Compute metric value
         """
-        pass
\ No newline at end of file
+        pass
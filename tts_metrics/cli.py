@@ -0,0 +1,374 @@
+"""`tts-metrics` command line: score a mapper, one shard at a time, and merge the shards
+
+    tts-metrics run mcd --dataroot data/audio --datapairs data/mapper.json \
+        --shard-index 3 --num-shards 16 --output results/mcd_003.npz
+    tts-metrics merge --output results/mcd.parquet results/mcd_*.npz
+
+Reference features can be packed once into a memory-mapped corpus:
+
+    tts-metrics pack --dataroot data/audio --datapairs data/mapper.json --output corpus/ref_mcep
+    tts-metrics run mcd ... --reference_corpus corpus/ref_mcep
+
+and several systems scored against them in one pass, one output per system:
+
+    tts-metrics run mcd --dataroot data --reference_corpus corpus/ref_mcep \
+        --systems sys_a=data/sys_a.json sys_b=data/sys_b.json --output results/mcd.npz
+
+Large runs can keep constant-memory aggregates instead of per-pair results,
+merged and compared with confidence intervals:
+
+    tts-metrics run mcd ... --stats stats/mcd_003.json
+    tts-metrics stats stats/mcd_*.json --output stats/mcd.json --compare stats/baseline.json
+
+or stop early, on a random sample, once the intervals are narrow enough:
+
+    tts-metrics run mcd ... --target_half_width 0.05 --stratify "^([^/]+)/" --output results/mcd_sample.npz
+"""
+import argparse
+import os
+import sys
+
+METRICS = ('mcd', 'gpe', 'all')
+
+
+def add_run_parser(subparsers):
+    parser = subparsers.add_parser("run", help="Score the pairs of a mapper (or one shard of it)")
+    parser.add_argument("metric", choices=METRICS,
+                        help="'all' scores MCD and GPE/VDE/FFE from one WORLD analysis per file, F0 included "
+                             "unless --method, --fmin or --fmax ask for another estimate")
+    parser.add_argument("--dataroot", default="./data/", help="Root dir of pairs exist in JSON")
+    parser.add_argument("--datapairs", default=None,
+                        help="Manifest of pairs: JSON {reference: synthesized}, JSONL or TSV, read lazily")
+    parser.add_argument("--systems", nargs="+", default=None, metavar="NAME=MAPPER",
+                        help="Mappers of several systems with the same references, scored in one pass instead of "
+                             "--datapairs; outputs are suffixed with _<NAME>")
+    parser.add_argument("--output", default=None,
+                        help="Per-pair results (.csv, .npz or .parquet); 'all' writes <name>_mcd.<ext> and <name>_gpe.<ext>")
+    parser.add_argument("--stats", default=None,
+                        help="JSON of the aggregates (mean, variance, reservoir sample), read by `stats`; 'all' writes "
+                             "<name>_mcd.json and <name>_gpe.json. Without --output no per-pair result is kept")
+    parser.add_argument("--reservoir_size", type=int, default=1000, help="Pairs sampled for bootstrap confidence intervals")
+    parser.add_argument("--target_half_width", nargs="+", default=None, metavar="[KEY=]WIDTH",
+                        help="Score pairs in random order until the confidence interval of every mean (or of the "
+                             "given keys, e.g. mcd=0.05 ffe=0.01) is within WIDTH")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Level of the --target_half_width intervals")
+    parser.add_argument("--stratify", default=None,
+                        help="Regex of the speaker in reference paths (its first group), spread evenly over the "
+                             "--target_half_width order")
+    parser.add_argument("--shard-index", type=int, default=0, help="Shard scored by this job, in [0, num-shards)")
+    parser.add_argument("--num-shards", type=int, default=1, help="Number of shards the mapper is split into")
+    parser.add_argument("--use_dtw", type=int, default=1,
+                        help="Flag to add Dynamic time warping phase before scoring. 1 to turn on and 0 for vice versa")
+    parser.add_argument("--dtw_band", type=int, default=None, help="Sakoe-Chiba radius of the DTW in frames")
+    parser.add_argument("--sr", type=int, default=22050, help="Sampling rate of wavefile")
+    parser.add_argument("--streaming", type=int, default=0,
+                        help="Flag to read audio block by block with bounded memory, for long-form files. 1 to turn on, "
+                             "needs --dtw_band or --use_dtw 0")
+    parser.add_argument("--num_workers", type=int, default=1, help="Number of processes scoring pairs in parallel")
+    parser.add_argument("--journal", default=None,
+                        help="JSONL journal of per-pair results, rerun with the same path to resume an interrupted run")
+    parser.add_argument("--prefetch_depth", type=int, default=0,
+                        help="Pairs read and decoded ahead in background threads when num_workers is 1, 0 to turn off")
+    parser.add_argument("--prefetch_max_mb", type=float, default=256, help="Decoded audio held by prefetched pairs, in MiB")
+    parser.add_argument("--prefetch_threads", type=int, default=2, help="Threads reading and decoding prefetched pairs")
+    parser.add_argument("--profile", default=None,
+                        help="JSON file of the time spent per stage (decode, resample, features, pitch, dtw, aggregate), "
+                             "counters and cache hit rates")
+
+    mcd = parser.add_argument_group("mcd")
+    mcd.add_argument("--use_mfcc", type=int, default=0, help="Flag toggle using MFCCs or mel ceptral")
+    mcd.add_argument("--K", type=int, default=None, help="Number of MFCCs coefficient to be extracted")
+    mcd.add_argument("--envelope", default=None, help="Spectral envelope of the mel cepstrum: world (CheapTrick) or stft")
+    mcd.add_argument("--batch_size", type=int, default=None, help="Files analysed together by the batched front-end")
+
+    gpe = parser.add_argument_group("gpe")
+    gpe.add_argument("--method", default=None,
+                     help="F0 estimator: pyin, yin, dio, harvest, rapt or swipe. Defaults to pyin, and for 'all' to "
+                          "the dio of the WORLD analysis")
+    gpe.add_argument("--fmin", type=float, default=None, help="Minimum frequency to be estimated")
+    gpe.add_argument("--fmax", type=float, default=None, help="Maximum frequency to be estimated")
+    gpe.add_argument("--frame_length", type=int, default=None, help="Window size in another word")
+
+    # 'all' extracts both sides from one WORLD analysis and has no reference set to read
+    reference = parser.add_argument_group("mcd and gpe")
+    reference.add_argument("--reference_corpus", default=None,
+                           help="Corpus written by `pack` for the same metric, read instead of extracting the references")
+    parser.set_defaults(func=run)
+
+
+def add_pack_parser(subparsers):
+    parser = subparsers.add_parser("pack", help="Pack features of the reference side into a memory-mapped corpus")
+    parser.add_argument("metric", nargs="?", choices=('mcd', 'gpe'), default='mcd',
+                        help="Features packed: mel cepstrum/MFCCs of MCD or pitch tracks of GPE. Defaults to mcd")
+    parser.add_argument("--dataroot", default="./data/", help="Root dir of pairs exist in JSON")
+    parser.add_argument("--datapairs", required=True, help="path to JSON file contains information of pairs")
+    parser.add_argument("--output", required=True, help="Corpus directory")
+    parser.add_argument("--sr", type=int, default=22050, help="Sampling rate of wavefile")
+    parser.add_argument("--use_mfcc", type=int, default=0, help="Flag toggle using MFCCs or mel ceptral")
+    parser.add_argument("--K", type=int, default=None, help="Number of MFCCs coefficient to be extracted")
+    parser.add_argument("--envelope", default=None, help="Spectral envelope of the mel cepstrum: world (CheapTrick) or stft")
+    parser.add_argument("--method", default=None, help="F0 estimator: pyin, yin, dio, harvest, rapt or swipe")
+    parser.add_argument("--fmin", type=float, default=None, help="Minimum frequency to be estimated")
+    parser.add_argument("--fmax", type=float, default=None, help="Maximum frequency to be estimated")
+    parser.add_argument("--frame_length", type=int, default=None, help="Window size in another word")
+    parser.set_defaults(func=pack)
+
+
+def add_stats_parser(subparsers):
+    parser = subparsers.add_parser("stats", help="Merge aggregates or results of shards, with confidence intervals")
+    parser.add_argument("inputs", nargs="+", help="Aggregates written by `run --stats`, or per-pair results")
+    parser.add_argument("--output", default=None, help="JSON of the merged aggregates")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Level of the confidence intervals")
+    parser.add_argument("--compare", default=None,
+                        help="Aggregates (or results) of another run, e.g. a baseline checkpoint: "
+                             "prints the difference of means with its confidence interval")
+    parser.add_argument("--reservoir_size", type=int, default=1000, help="Pairs sampled from per-pair results")
+    parser.set_defaults(func=stats)
+
+
+def add_serve_parser(subparsers):
+    parser = subparsers.add_parser("serve", help="Score requests in a long-lived process with warm caches, see tts_metrics.server")
+    parser.add_argument("--http", default=None, help="host:port to listen on, e.g. 127.0.0.1:8765")
+    parser.add_argument("--socket", default=None, help="Unix socket path to listen on")
+    parser.add_argument("--dataroot", default="./data/", help="Root dir of the paths of requests")
+    parser.add_argument("--root", default=None,
+                        help="Dir every path of a request must resolve into (default: --dataroot)")
+    parser.add_argument("--reference_corpus", nargs="*", default=[], metavar="METRIC=CORPUS",
+                        help="Corpora written by `pack`, e.g. mcd=corpus/ref_mcep gpe=corpus/ref_pitch")
+    parser.add_argument("--num_workers", type=int, default=1, help="Processes of every metric, kept between requests")
+    parser.add_argument("--max_wait_ms", type=float, default=5.0, help="Time a request waits for others to be batched with")
+    parser.add_argument("--max_batch_pairs", type=int, default=1024, help="Pairs scored in one batch")
+    parser.add_argument("--max_metrics", type=int, default=8,
+                        help="Configurations kept warm at once, the least recently used one is closed")
+    parser.add_argument("--cache_mb", type=float, default=2048, help="Decoded audio kept in memory, in MiB")
+    parser.set_defaults(func=serve)
+
+
+def add_merge_parser(subparsers):
+    parser = subparsers.add_parser("merge", help="Combine per-shard results into one file with corpus aggregates")
+    parser.add_argument("inputs", nargs="+", help="Per-shard results written by `run`")
+    parser.add_argument("--output", required=True, help="Merged results (.csv, .npz or .parquet)")
+    parser.add_argument("--name", default=None, help="Name of the merged results. Defaults to the one of the inputs or of --output")
+    parser.set_defaults(func=merge)
+
+
+def _config_kwargs(args, *names):
+    # options left unset keep the defaults of the config dataclass
+    return {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+
+
+def _metric_configs(args):
+    """(MCDConfig, GPEConfig) of `run` options
+
+    For 'all', GPE defaults to the dio of the shared WORLD analysis (see
+    share_world_f0) unless another estimator or F0 range is asked for.
+    """
+    from tts_metrics.evaluator import share_world_f0
+    from tts_metrics.gpe import GPEConfig
+    from tts_metrics.mcd import MCDConfig
+
+    common = dict(use_dtw=bool(args.use_dtw), dtw_band=args.dtw_band, sampling_rate=args.sr)
+    mcd_config = MCDConfig(streaming=bool(args.streaming), **common,
+                           **_config_kwargs(args, 'K', 'envelope', 'batch_size'))
+    gpe_config = GPEConfig(streaming=bool(args.streaming), **common,
+                           **_config_kwargs(args, 'method', 'fmin', 'fmax', 'frame_length'))
+    if args.metric == 'all' and args.method in (None, 'dio') and args.fmin is None and args.fmax is None:
+        share_world_f0(mcd_config, gpe_config)
+    return mcd_config, gpe_config
+
+
+def run(args):
+    # imported here, so `--help` and `merge` do not pay for the metrics
+    from tts_metrics.evaluator import Evaluator
+    from tts_metrics.gpe import GPE
+    from tts_metrics.mcd import MCD
+    from tts_metrics.utils.prefetch import PrefetchConfig
+    from tts_metrics.utils.profiling import Profiler, set_profiler
+
+    if args.output is None and args.stats is None:
+        raise SystemExit("tts-metrics run: one of --output or --stats is required")
+    if (args.datapairs is None) == (args.systems is None):
+        raise SystemExit("tts-metrics run: exactly one of --datapairs or --systems is required")
+    if args.systems is not None and args.target_half_width is not None:
+        raise SystemExit("tts-metrics run: --target_half_width scores one mapper, not --systems")
+    if args.metric not in ('mcd', 'gpe') and args.reference_corpus is not None:
+        raise SystemExit(f"tts-metrics run: --reference_corpus is for mcd and gpe, '{args.metric}' reads its "
+                         f"features from one WORLD analysis")
+    systems = None
+    if args.systems is not None:
+        systems = dict(system.split("=", 1) for system in args.systems)
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler(enabled=True)
+        set_profiler(profiler)
+    mcd_config, gpe_config = _metric_configs(args)
+    prefetch = None
+    if args.prefetch_depth > 0:
+        prefetch = PrefetchConfig(depth=args.prefetch_depth, max_bytes=int(args.prefetch_max_mb * 1024 ** 2),
+                                  num_threads=args.prefetch_threads)
+    shard = dict(num_workers=args.num_workers, journal_path=args.journal,
+                 shard_index=args.shard_index, num_shards=args.num_shards, prefetch=prefetch)
+
+    if args.metric == 'mcd':
+        metric = MCD(args.dataroot, args.datapairs, mcd_config, use_mfcc=bool(args.use_mfcc), name="MCD",
+                     reference_corpus=args.reference_corpus, **shard)
+    elif args.metric == 'gpe':
+        metric = GPE(args.dataroot, args.datapairs, gpe_config, "GPE", reference_corpus=args.reference_corpus, **shard)
+    else:
+        metric = Evaluator(args.dataroot, args.datapairs, [mcd_config, gpe_config], **shard)
+
+    if systems is not None:
+        # every system in one pass, the outputs of each suffixed with its name
+        runs = [(f"_{system}", results) for system, results in metric.score_systems(systems).items()]
+        for _, results in runs:
+            for result in _as_list(results):
+                print(result.summary())
+        runs = [(suffix, results, _stats(results, args)) for suffix, results in runs]
+    elif args.target_half_width is not None:
+        results = metric.compute_progressive(_half_width(args.target_half_width), args.confidence, args.stratify)
+        runs = [("", results, _stats(results, args))]
+    elif args.output is not None:
+        results = metric.compute()
+        runs = [("", results, _stats(results, args))]
+    else:
+        # aggregates only: per-pair scores are dropped as they are added
+        runs = [("", [], _as_list(metric.compute_stats(args.reservoir_size)))]
+
+    for suffix, results, aggregates in runs:
+        for path, result in zip(_output_paths(args.output, args.metric, suffix), _as_list(results)):
+            _makedirs(path)
+            result.save(path)
+            print(f"[INFO] Shard {args.shard_index}/{args.num_shards}: {len(result)} pairs written to {path}")
+        for path, aggregate in zip(_output_paths(args.stats, args.metric, suffix), aggregates):
+            _makedirs(path)
+            aggregate.save(path)
+            print(f"[INFO] Shard {args.shard_index}/{args.num_shards}: aggregates of {len(aggregate)} pairs written to {path}")
+
+    if profiler is not None:
+        print(profiler.summary())
+        profiler.report(args.profile)
+
+
+def _as_list(results):
+    # Evaluator returns one item per config, the other metrics a single one
+    return results if isinstance(results, list) else [results]
+
+
+def _half_width(values):
+    # "0.05" for every metric, or "mcd=0.05 ffe=0.01"
+    if len(values) == 1 and "=" not in values[0]:
+        return float(values[0])
+    return {key: float(width) for key, width in (value.split("=", 1) for value in values)}
+
+
+def _stats(results, args):
+    if args.stats is None:
+        return []
+    return [result.stats(args.reservoir_size) for result in _as_list(results)]
+
+
+def _output_paths(path, metric, suffix=""):
+    if path is None:
+        return []
+    root, extension = os.path.splitext(path)
+    if metric != 'all':
+        return [f"{root}{suffix}{extension}"]
+    return [f"{root}{suffix}_{name}{extension}" for name in ("mcd", "gpe")]
+
+
+def _makedirs(path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+def _load_aggregate(path, reservoir_size):
+    from tts_metrics.results import MetricResults
+    from tts_metrics.stats import OnlineAggregate
+
+    if os.path.splitext(path)[1].lower() == '.json':
+        return OnlineAggregate.load(path)
+    return MetricResults.load(path).stats(reservoir_size)
+
+
+def pack(args):
+    from tts_metrics.gpe import GPE, GPEConfig
+    from tts_metrics.mcd import MCD, MCDConfig
+
+    if args.metric == 'gpe':
+        metric = GPE(args.dataroot, args.datapairs,
+                     GPEConfig(sampling_rate=args.sr, **_config_kwargs(args, 'method', 'fmin', 'fmax', 'frame_length')),
+                     "GPE")
+    else:
+        metric = MCD(args.dataroot, args.datapairs,
+                     MCDConfig(sampling_rate=args.sr, **_config_kwargs(args, 'K', 'envelope')),
+                     use_mfcc=bool(args.use_mfcc), name="MCD")
+    corpus = metric.build_reference_corpus(args.output)
+    print(f"[INFO] {len(corpus)} utterances packed into {args.output}")
+
+
+def merge(args):
+    from tts_metrics.results import MetricResults
+
+    results = MetricResults.concatenate([MetricResults.load(path) for path in args.inputs], name=args.name)
+    if results.name is None:
+        results.name = os.path.splitext(os.path.basename(args.output))[0]
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    results.save(args.output)
+    print(results.summary())
+
+
+def stats(args):
+    from tts_metrics.stats import OnlineAggregate
+
+    aggregate = OnlineAggregate.combine(_load_aggregate(path, args.reservoir_size) for path in args.inputs)
+    if aggregate.name is None:
+        aggregate.name = os.path.splitext(os.path.basename(args.inputs[0]))[0]
+    print(aggregate.summary(args.confidence))
+    if args.output is not None:
+        _makedirs(args.output)
+        aggregate.save(args.output)
+    if args.compare is not None:
+        other = _load_aggregate(args.compare, args.reservoir_size)
+        for key, (difference, low, high) in aggregate.compare(other, args.confidence).items():
+            verdict = "significant" if low > 0 or high < 0 else "not significant"
+            print(f"[INFO] {key}: {aggregate.name} - {other.name or args.compare} = {difference} "
+                  f"({args.confidence:.0%} CI [{low}, {high}], {verdict})")
+
+
+def serve(args):
+    from tts_metrics.server import ScoringServer, make_server
+    from tts_metrics.utils.audio_cache import WaveformCache, set_waveform_cache
+
+    if (args.http is None) == (args.socket is None):
+        raise SystemExit("tts-metrics serve: exactly one of --http or --socket is required")
+    set_waveform_cache(WaveformCache(max_bytes=int(args.cache_mb * 1024 ** 2)))
+    scoring = ScoringServer(args.dataroot, dict(corpus.split("=", 1) for corpus in args.reference_corpus),
+                            num_workers=args.num_workers, max_wait_ms=args.max_wait_ms,
+                            max_batch_pairs=args.max_batch_pairs, root=args.root, max_metrics=args.max_metrics)
+    scoring.warm_up()
+    server = make_server(scoring, http=args.http, socket_path=args.socket)
+    print(f"[INFO] Serving on {args.http or 'unix:' + args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scoring.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="tts-metrics", description="Metrics of speech processing works")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_run_parser(subparsers)
+    add_pack_parser(subparsers)
+    add_merge_parser(subparsers)
+    add_stats_parser(subparsers)
+    add_serve_parser(subparsers)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+""" MCD, GPE, VDE and FFE in a single pass
+Every file is decoded once and analysed once with WORLD: the spectral envelope
+feeds MCD, and the F0 track feeds GPE/VDE/FFE when it is the one GPE would
+estimate itself.
+"""
+import os
+
+import numpy as np
+
+from tts_metrics.base import BaseMetric
+from tts_metrics.gpe import GPE, GPEConfig, align_pitch, error_rates
+from tts_metrics.mcd import MCDConfig, batch_mcd
+from tts_metrics.results import MetricResults
+from tts_metrics.utils.audio_cache import load_wav, to_waveform
+from tts_metrics.utils.data_utils import WORLD_F0_CEIL, WORLD_F0_FLOOR, extract_world
+from tts_metrics.utils.feature_store import FeatureStore
+from tts_metrics.utils.pitch import get_f0_estimator
+from tts_metrics.utils.profiling import count, timer
+
+
+def share_world_f0(mcd_config, gpe_config):
+    """Set `gpe_config` to the dio of the WORLD analysis of `mcd_config`, so Evaluator.shares_f0 holds
+
+    GPE gets method 'dio', the F0 range of the analysis and a hop of the
+    frame period, rounded to whole samples: the frame period of `mcd_config`
+    is set to that hop (4.99 ms instead of 5 ms at 22050 Hz).
+    """
+    hop_length = max(1, round(mcd_config.sampling_rate * mcd_config.frame_period / 1000.0))
+    mcd_config.frame_period = 1000.0 * hop_length / mcd_config.sampling_rate
+    gpe_config.method = 'dio'
+    gpe_config.fmin, gpe_config.fmax = WORLD_F0_FLOOR, WORLD_F0_CEIL
+    gpe_config.hop_length = hop_length
+    return mcd_config, gpe_config
+
+
+class Evaluator(BaseMetric):
+    """Score MCD and GPE/VDE/FFE of every pair from one decode and one WORLD analysis per file
+
+    The WORLD analysis is the one of the MCD metric (extract_mcep), so MCD
+    scores are the ones of MCD.compute(). GPE reads its F0 (dio + stonemask)
+    only when that is the track GPE.compute() would estimate: method 'dio',
+    the F0 range of the analysis and a hop of `frame_period`, see shares_f0.
+    Otherwise GPE runs its own estimator on the same decoded waveform, and
+    its scores are the ones of GPE.compute() too.
+
+    Args:
+        dataroot (str): path to root dir of paths in data_mapper, None to score arrays only
+        data_mapper_path (str): path to JSON {reference: synthesized}, None to score arrays only
+        metric_configs (list): at most one MCDConfig and one GPEConfig, at the same sampling rate
+        name (str, optional): Name of the run. Defaults to "Evaluator".
+        num_workers (int, optional): number of processes scoring pairs. Defaults to 1.
+        journal_path (str, optional): JSONL journal of per-pair results. Defaults to None.
+        world_outdir (str, optional): feature store of WORLD features, under dataroot. Defaults to 'world'.
+        shard_index (int, optional): shard of the mapper scored by this instance. Defaults to 0.
+        num_shards (int, optional): number of shards the mapper is split into. Defaults to 1.
+        prefetch (PrefetchConfig, optional): decode the next pairs in background threads. Defaults to None.
+    """
+    def __init__(self, dataroot, data_mapper_path, metric_configs, name="Evaluator", num_workers=1,
+                 journal_path=None, world_outdir='world', shard_index=0, num_shards=1, prefetch=None):
+        metric_configs = list(metric_configs)
+        super().__init__(dataroot, data_mapper_path, metric_configs, name, num_workers=num_workers,
+                         journal_path=journal_path, shard_index=shard_index, num_shards=num_shards,
+                         prefetch=prefetch)
+        for config in metric_configs:
+            if not isinstance(config, (MCDConfig, GPEConfig)):
+                raise TypeError(f"Evaluator takes MCDConfig and GPEConfig, got {type(config).__name__}")
+        mcd_configs = [config for config in metric_configs if isinstance(config, MCDConfig)]
+        gpe_configs = [config for config in metric_configs if isinstance(config, GPEConfig)]
+        if len(mcd_configs) > 1 or len(gpe_configs) > 1 or not metric_configs:
+            raise ValueError("Evaluator takes at most one MCDConfig and one GPEConfig, and at least one of them")
+        self.mcd_config = mcd_configs[0] if mcd_configs else None
+        if self.mcd_config is not None and self.mcd_config.envelope != 'world':
+            raise ValueError(f"Evaluator shares one WORLD analysis, MCDConfig.envelope must be 'world', "
+                             f"got {self.mcd_config.envelope!r}")
+        self.gpe_config = gpe_configs[0] if gpe_configs else None
+        self.metric_order = ['mcd' if isinstance(config, MCDConfig) else 'gpe' for config in metric_configs]
+
+        sampling_rates = {config.sampling_rate for config in metric_configs}
+        if len(sampling_rates) > 1:
+            raise ValueError(f"One decode per file needs a single sampling rate, got {sorted(sampling_rates)}")
+        self.sampling_rate = sampling_rates.pop()
+        self.feature_store = None
+        if self.dataroot is not None:
+            self.feature_store = FeatureStore(os.path.join(self.dataroot, world_outdir))
+
+    def world_params(self):
+        """Parameters of the shared WORLD analysis, see extract_world
+        """
+        params = dict(SAMPLING_RATE=self.sampling_rate)
+        if self.mcd_config is not None:
+            # the F0 range of extract_mcep: it shapes the envelope, so it is not GPE's
+            params.update(alpha=self.mcd_config.alpha, fft_size=self.mcd_config.fft_size,
+                          mcep_size=self.mcd_config.mcep_size, FRAME_PERIOD=self.mcd_config.frame_period)
+        else:
+            params.update(FRAME_PERIOD=self.gpe_frame_period(), f0_floor=self.gpe_config.fmin,
+                          f0_ceil=self.gpe_config.fmax)
+        return params
+
+    def gpe_frame_period(self):
+        # hop of the GPE estimators, in ms
+        frame_length = int(self.gpe_config.frame_length)
+        return 1000.0 * (self.gpe_config.hop_length or frame_length // 4) / self.sampling_rate
+
+    def shares_f0(self):
+        """Whether GPE reads the F0 of the shared WORLD analysis instead of running its estimator
+
+        Only when the analysis is the dio GPE would run: same F0 range and a
+        frame period equal to the GPE hop.
+        """
+        if self.gpe_config is None or self.gpe_config.method != 'dio':
+            return False
+        params = self.world_params()
+        return (params.get('f0_floor', WORLD_F0_FLOOR) == self.gpe_config.fmin
+                and params.get('f0_ceil', WORLD_F0_CEIL) == self.gpe_config.fmax
+                and params['FRAME_PERIOD'] == self.gpe_frame_period())
+
+    def prefetch_files(self, ref_file, syn_file):
+        if self.feature_store is None:
+            return []
+        files = []
+        for wavefile in (ref_file, syn_file):
+            filepath = os.path.join(self.dataroot, wavefile)
+            features_stored = self.feature_store.make_key(filepath, 'world', self.world_params()) in self.feature_store
+            # GPE decodes the file even when the WORLD features are stored, unless it shares their F0
+            if not features_stored or (self.gpe_config is not None and not self.shares_f0()):
+                files.append((filepath, self.sampling_rate))
+        return files
+
+    def get_features(self, wavefile):
+        """Return (F0 [t], mel cepstrum [t, mcep_size + 1]) of `wavefile` (relative to dataroot)
+        """
+        filepath = os.path.join(self.dataroot, wavefile)
+
+        def extract():
+            f0, mgc = self.features_from_wav(load_wav(filepath, sr=self.sampling_rate))
+            return np.concatenate([f0[:, None], mgc], axis=1)
+
+        if self.feature_store is None:
+            features = extract()
+        else:
+            features = self.feature_store.get_or_compute(filepath, 'world', self.world_params(), extract)
+        return features[:, 0], features[:, 1:]
+
+    def features_from_wav(self, wav):
+        """Return (F0 [t], mel cepstrum [t, mcep_size + 1]) of a waveform at the config sampling rate
+        """
+        return extract_world(wav, **self.world_params())
+
+    def estimate_pitch(self, wavefile, f0):
+        """Return (pitch, voiced_flag) of `wavefile`, from its WORLD `f0` when GPE shares it
+        """
+        if self.shares_f0():
+            return f0, f0 > 0
+        # the waveform cache still holds the file decoded for the WORLD analysis
+        return self.pitch_from_wav(load_wav(os.path.join(self.dataroot, wavefile), sr=self.sampling_rate))
+
+    def pitch_from_wav(self, wav):
+        """Return (pitch, voiced_flag) of a waveform with the estimator of `GPEConfig.method`
+        """
+        frame_length = int(self.gpe_config.frame_length)
+        estimator = get_f0_estimator(self.gpe_config.method)
+        with timer('pitch'):
+            pitch, voiced_flag = estimator(wav, sr=self.sampling_rate, fmin=self.gpe_config.fmin,
+                                           fmax=self.gpe_config.fmax, frame_length=frame_length,
+                                           hop_length=self.gpe_config.hop_length or frame_length // 4)
+        count('pitch_frames', len(pitch))
+        return pitch, voiced_flag
+
+    def score_pair(self, ref_file, syn_file):
+        """Return (mcd, mcd frames) and/or (GPE, VDE, FFE, gpe frames), MCD first
+        """
+        f0_1, mcep_1 = self.get_features(ref_file)
+        f0_2, mcep_2 = self.get_features(syn_file)
+        pitch_1 = pitch_2 = None
+        if self.gpe_config is not None:
+            pitch_1, pitch_2 = self.estimate_pitch(ref_file, f0_1), self.estimate_pitch(syn_file, f0_2)
+        return self.score_features(mcep_1, mcep_2, pitch_1, pitch_2)
+
+    def score_array(self, ref, syn, sr=None, features=False):
+        """Scores of score_pair for two waveforms, or two (F0, mel cepstrum) as get_features returns when `features`
+
+        From features, GPE must share the WORLD F0 (see shares_f0): other estimators run on the waveform.
+        """
+        if features:
+            if self.gpe_config is not None and not self.shares_f0():
+                raise ValueError("GPE from WORLD features needs method 'dio' with the F0 range and frame period "
+                                 "of the WORLD analysis, see Evaluator.shares_f0")
+            wavs = (None, None)
+            (f0_1, mcep_1), (f0_2, mcep_2) = ref, syn
+        else:
+            wavs = [to_waveform(wav, sr, self.sampling_rate) for wav in (ref, syn)]
+            (f0_1, mcep_1), (f0_2, mcep_2) = [self.features_from_wav(wav) for wav in wavs]
+        pitch_1 = pitch_2 = None
+        if self.gpe_config is not None:
+            pitch_1, pitch_2 = [(f0, f0 > 0) if self.shares_f0() else self.pitch_from_wav(wav)
+                                for f0, wav in zip((f0_1, f0_2), wavs)]
+        return self.score_features(mcep_1, mcep_2, pitch_1, pitch_2)
+
+    def score_features(self, mcep_1, mcep_2, pitch_1=None, pitch_2=None):
+        """Scores of score_pair from mel cepstra and (pitch, voiced_flag) tracks
+        """
+        scores = ()
+        if self.mcd_config is not None:
+            distances, num_frames, _ = batch_mcd([mcep_1], [mcep_2], use_dtw=self.mcd_config.use_dtw,
+                                                 dtw_band=self.mcd_config.dtw_band)
+            scores += (distances[0], num_frames[0])
+        if self.gpe_config is not None:
+            counts = GPE.error_counts(*align_pitch(*pitch_1, *pitch_2, use_dtw=self.gpe_config.use_dtw,
+                                                   dtw_band=self.gpe_config.dtw_band))
+            scores += (*error_rates(*counts), counts[3])
+        return scores
+
+    def compute(self):
+        """Score every pair of the mapper
+
+        Returns:
+            list: one MetricResults per config, in the order of `metric_configs`
+        """
+        pairs = list(self.data_mapper.items())
+        results = self.make_results(pairs, self.score_pairs(pairs))
+        for result in results:
+            print(result.summary())
+        return results
+
+    def make_results(self, pairs, scores):
+        """Return one MetricResults per config, in the order of `metric_configs`
+        """
+        results = {}
+        column = 0
+        with timer('aggregate'):
+            if self.mcd_config is not None:
+                results['mcd'] = MetricResults("MCD", pairs, {'mcd': [score[0] for score in scores]},
+                                               [score[1] for score in scores])
+                column = 2
+            if self.gpe_config is not None:
+                results['gpe'] = MetricResults("GPE", pairs,
+                                               {'gpe': [score[column] for score in scores],
+                                                'vde': [score[column + 1] for score in scores],
+                                                'ffe': [score[column + 2] for score in scores]},
+                                               [score[column + 3] for score in scores])
+        return [results[metric] for metric in self.metric_order]
@@ -5,104 +5,238 @@ Speech Communication, 50(3):203-214, 2008.
 """
 import os
 from dataclasses import dataclass
+from typing import Optional
 
 import json
-import librosa
 import numpy as np
-from tqdm import tqdm
-from scipy.spatial.distance import euclidean
-from fastdtw import fastdtw
 
 from tts_metrics.base import BaseMetric
+from tts_metrics.results import MetricResults
+from tts_metrics.utils.audio_cache import load_wav, to_waveform
+from tts_metrics.utils.dtw import dtw
+from tts_metrics.utils.feature_corpus import FeatureCorpus
+from tts_metrics.utils.pitch import get_f0_estimator
+from tts_metrics.utils.profiling import cache_access, count, timer
+from tts_metrics.utils.streaming import stream_features
+
+# librosa.note_to_hz('C2') and librosa.note_to_hz('C7'), constant so importing needs no librosa
+FMIN_C2 = 65.40639132514966
+FMAX_C7 = 2093.004522404789
+
+def align_pitch(p1, v1, p2, v2, use_dtw=True, dtw_band=None):
+    """Align two (pitch, voiced_flag) tracks with DTW on pitch, or truncate them to the shorter one
+    """
+    if use_dtw:
+        distance, path_1, path_2 = dtw(p1, p2, metric='euclidean', band=dtw_band)
+        p1 = np.take(p1, path_1, axis=0)
+        v1 = np.take(v1, path_1, axis=0)
+        
+        p2 = np.take(p2, path_2, axis=0)
+        v2 = np.take(v2, path_2, axis=0)
+    else:
+        num_frames = min(len(p1), len(p2))
+        p1, v1 = p1[:num_frames], v1[:num_frames]
+        p2, v2 = p2[:num_frames], v2[:num_frames]
+    return p1, v1, p2, v2
+
+def error_rates(F0_err, both_voiced, voicing_err, num_frames):
+    """Return (GPE, VDE, FFE) rates from GPE.error_counts
+    """
+    GPE = F0_err / both_voiced
+    VDE = voicing_err / num_frames
+    FFE = (F0_err + voicing_err) / num_frames
+    return GPE, VDE, FFE
 
 @dataclass
 class GPEConfig:
     use_dtw: bool = True
-    method: str = 'pyin'
-    fmin: float = librosa.note_to_hz('C2')
-    fmax: float = librosa.note_to_hz('C7')
+    dtw_band: Optional[int] = None
+    method: str = 'pyin' # any key of tts_metrics.utils.pitch.F0_ESTIMATORS: pyin, yin, dio, harvest, rapt, swipe
+    fmin: float = FMIN_C2
+    fmax: float = FMAX_C7
     frame_length: int = 1024
+    hop_length: Optional[int] = None # frame_length // 4, as librosa.pyin
     sampling_rate: int = 22050
+    streaming: bool = False # read audio block by block, for long-form files; with use_dtw, needs dtw_band
+    stream_block_frames: int = 2048
+    stream_context_frames: int = 256 # frames around each block for Viterbi decoding/F0 tracking
 
 class GPE(BaseMetric):
-    def __init__(self, dataroot, data_mapper_path, metric_config:GPEConfig, name):
-        super().__init__(dataroot, data_mapper_path, metric_config, name)
+    def __init__(self, dataroot, data_mapper_path, metric_config:GPEConfig, name, num_workers=1, journal_path=None,
+                 shard_index=0, num_shards=1, prefetch=None, reference_corpus=None):
+        super().__init__(dataroot, data_mapper_path, metric_config, name, num_workers=num_workers,
+                         journal_path=journal_path, shard_index=shard_index, num_shards=num_shards,
+                         prefetch=prefetch)
         self.metric_config = metric_config
         self.dataroot = dataroot
-        self.pairs = json.load(open(data_mapper_path))
+        self.pairs = self.data_mapper
+        if metric_config.streaming and metric_config.use_dtw and metric_config.dtw_band is None:
+            raise ValueError("Streaming with DTW needs dtw_band: unbanded DTW holds both pitch tracks "
+                             "and their cost matrix whole, set dtw_band or use_dtw=False")
+        if reference_corpus is not None:
+            self.set_reference_corpus(reference_corpus)
+
+    def feature_params(self):
+        params = self.estimator_params()
+        return dict(kind='pitch', method=self.metric_config.method, sampling_rate=params.pop('sr'), **params)
+
+    def build_reference_corpus(self, root, wavefiles=None):
+        """Pack the (pitch, voiced_flag) tracks of `wavefiles` as [t, 2] frames into a FeatureCorpus under `root` and read from it
+
+        Args:
+            root (str): corpus directory
+            wavefiles (list, optional): files relative to dataroot. Defaults to None (reference side of the mapper).
+
+        Returns:
+            FeatureCorpus: the written corpus
+        """
+        if wavefiles is None:
+            wavefiles = list(self.pairs)
+        self.reference_corpus = None
+        items = ((wavefile, np.stack(self.estimate_pitch(wavefile), axis=1).astype(np.float64)) for wavefile in wavefiles)
+        self.reference_corpus = FeatureCorpus.write(root, items, params=self.feature_params())
+        return self.reference_corpus
+
+    def prefetch_files(self, ref_file, syn_file):
+        if self.metric_config.streaming:
+            return []
+        return [(os.path.join(self.dataroot, wavefile), self.metric_config.sampling_rate)
+                for wavefile in (ref_file, syn_file)
+                if self.reference_corpus is None or wavefile not in self.reference_corpus]
 
-    
     def estimate_pitch(self, wavefile, method='pyin', normalize_mean=None,
                    normalize_std=None, n_formants=1):
+        """Return (pitch, voiced_flag) of `wavefile` with the F0 estimator named by `metric_config.method`
+        """
+        if self.reference_corpus is not None:
+            track = self.reference_corpus.get(wavefile)
+            cache_access('reference_corpus', track is not None)
+            if track is not None:
+                return track[:, 0], track[:, 1].astype(bool)
+        if self.metric_config.streaming:
+            blocks = list(self.iter_pitch(wavefile))
+            return (np.concatenate([pitch for pitch, _ in blocks]),
+                    np.concatenate([voiced_flag for _, voiced_flag in blocks]))
 
-        if self.metric_config.method == 'pyin':
-            filepath = os.path.join(self.dataroot, wavefile)
-            snd, sr = librosa.load(filepath, sr=self.metric_config.sampling_rate)
-            (pitch, 
-             voiced_flag,
-             voiced_probs) = librosa.pyin(snd,
-                                          fmin=self.metric_config.fmin,
-                                          fmax=self.metric_config.fmax,
-                                          frame_length=self.metric_config.frame_length)
-
-            pitch = np.where(np.isnan(pitch), 0.0, pitch)
-            
-        else:
-            print("[!] Current version do not support another method"
-                  "\nPlease request the methods you want (your contribution are also welcome), many thanks!")
-            raise ValueError
+        filepath = os.path.join(self.dataroot, wavefile)
+        return self.pitch_from_wav(load_wav(filepath, sr=self.metric_config.sampling_rate))
 
+    def pitch_from_wav(self, wav):
+        """Return (pitch, voiced_flag) of a waveform at the config sampling rate
+        """
+        estimator = get_f0_estimator(self.metric_config.method)
+        with timer('pitch'):
+            pitch, voiced_flag = estimator(wav, **self.estimator_params())
+        count('pitch_frames', len(pitch))
         return pitch, voiced_flag
-    
-    def compute_gpe(self, wavefile1, wavefile2, is_logging=False):
-        # Compute pitch and voice flag of wavefiles
-        p1, v1 = self.estimate_pitch(wavefile1)
-        p2, v2 = self.estimate_pitch(wavefile2)
-        
-        if self.metric_config.use_dtw:
-            distance, path = fastdtw(p1, p2, dist=euclidean)
-            p1 = np.take(p1, [l[0] for l in path], axis=0)
-            v1 = np.take(v1, [l[0] for l in path], axis=0)
-            
-            p2 = np.take(p2, [l[1] for l in path], axis=0)
-            v2 = np.take(v2, [l[1] for l in path], axis=0)
-        else:
-            if len(p1) > len(p2):
-                p1 = p1[: len(p2)]
-                v1 = v1[: len(p2)]
-            else:
-                v2 = v2[: len(p1)]
 
+    def estimator_params(self):
+        frame_length = int(self.metric_config.frame_length)
+        return dict(sr=self.metric_config.sampling_rate,
+                    fmin=self.metric_config.fmin,
+                    fmax=self.metric_config.fmax,
+                    frame_length=frame_length,
+                    hop_length=self.metric_config.hop_length or frame_length // 4)
+
+    def iter_pitch(self, wavefile):
+        """Yield (pitch, voiced_flag) of `wavefile` block by block, in bounded memory
+
+        Frames line up with estimate_pitch on the whole file; every block is
+        decoded with `stream_context_frames` frames of context on each side.
+        The values are those of the whole file for pyin and yin only: dio,
+        harvest and swipe can differ on the last frames of the file, and rapt,
+        whose tracking is global, on a few frames anywhere.
+        """
+        estimator = get_f0_estimator(self.metric_config.method)
+        params = self.estimator_params()
+
+        def estimate(segment):
+            with timer('pitch'):
+                return np.stack(estimator(segment, center=False, **params))
+
+        blocks = stream_features(os.path.join(self.dataroot, wavefile), estimate, params['hop_length'],
+                                 sr=self.metric_config.sampling_rate, pad=params['frame_length'] // 2,
+                                 frame_length=params['frame_length'],
+                                 context_frames=self.metric_config.stream_context_frames,
+                                 block_frames=self.metric_config.stream_block_frames, time_axis=1)
+        for block in blocks:
+            count('pitch_frames', block.shape[1])
+            yield block[0], block[1].astype(bool)
+
+    @staticmethod
+    def error_counts(p1, v1, p2, v2):
+        """Return (gross pitch errors, both voiced, voicing errors, frames) of aligned tracks
+        """
         diff = np.abs(p1 - p2)
         diff = diff > 0.2 * p1
         
         both_voiced = v1.astype(np.int32) * v2.astype(np.int32)
         F0_err = diff.astype(np.int32) * both_voiced
+        voicing_err = np.not_equal(v1, v2).astype(np.int32)
+        return np.sum(F0_err), np.sum(both_voiced), np.sum(voicing_err), v1.shape[0]
+
+    def pitch_error_counts(self, pitch_1, pitch_2):
+        """error_counts of two (pitch, voiced_flag) tracks, aligned as configured
+        """
+        return self.error_counts(*align_pitch(*pitch_1, *pitch_2, use_dtw=self.metric_config.use_dtw,
+                                              dtw_band=self.metric_config.dtw_band))
+
+    def gpe_streaming(self, wavefile1, wavefile2):
+        """error_counts without DTW, accumulated block by block over both files
+        """
+        counts = np.zeros(4, dtype=np.int64)
+        for (p1, v1), (p2, v2) in zip(self.iter_pitch(wavefile1), self.iter_pitch(wavefile2)):
+            n = min(len(p1), len(p2))
+            counts += self.error_counts(p1[:n], v1[:n], p2[:n], v2[:n])
+        return tuple(counts)
+    
+    def compute_gpe(self, wavefile1, wavefile2, is_logging=False):
+        if self.metric_config.streaming and not self.metric_config.use_dtw:
+            F0_err, both_voiced, voicing_err, num_frames = self.gpe_streaming(wavefile1, wavefile2)
+        else:
+            # Compute pitch and voice flag of wavefiles
+            F0_err, both_voiced, voicing_err, num_frames = self.pitch_error_counts(
+                self.estimate_pitch(wavefile1), self.estimate_pitch(wavefile2))
         
-        GPE = np.sum(F0_err) / np.sum(both_voiced)
-        VDE = np.sum(np.not_equal(v1, v2).astype(np.int32)) / v1.shape[0]
-        FFE = ((np.sum(F0_err) + np.sum(np.not_equal(v1, v2).astype(np.int32))) / v1.shape[0])
+        GPE, VDE, FFE = error_rates(F0_err, both_voiced, voicing_err, num_frames)
 
         if is_logging:
             print(f"[INFO] GPE rate between {wavefile1} & {wavefile2} is: {GPE}")
             print(f"[INFO] VDE rate between {wavefile1} & {wavefile2} is: {VDE}")
             print(f"[INFO] FFE rate between {wavefile1} & {wavefile2} is: {FFE}")
-        return GPE, VDE, FFE, v1.shape[0]
+        return GPE, VDE, FFE, num_frames
         
+    def score_pair(self, ref_file, syn_file):
+        return self.compute_gpe(ref_file, syn_file)
+
+    def score_array(self, ref, syn, sr=None, features=False):
+        """(GPE, VDE, FFE, number of frames) of two waveforms, or of two (pitch, voiced_flag) tracks when `features`
+        """
+        if not features:
+            ref = self.pitch_from_wav(to_waveform(ref, sr, self.metric_config.sampling_rate))
+            syn = self.pitch_from_wav(to_waveform(syn, sr, self.metric_config.sampling_rate))
+        counts = self.pitch_error_counts(ref, syn)
+        return (*error_rates(*counts), counts[3])
+
+    def make_results(self, pairs, scores):
+        with timer('aggregate'):
+            return MetricResults(self.name or "GPE", pairs,
+                                 {'gpe': [score[0] for score in scores],
+                                  'vde': [score[1] for score in scores],
+                                  'ffe': [score[2] for score in scores]},
+                                 [score[3] for score in scores])
+
     def compute(self):
-        GPEs, VDEs, FFEs, total_frames = [], [], [], 0
-        for ref_file, syn_file in self.pairs.items():
-            GPE, VDE, FFE, num_frame = self.compute_gpe(ref_file, syn_file)
-            GPEs.append(GPE)
-            VDEs.append(VDE)
-            FFEs.append(FFE)
-            total_frames += num_frame
-        
-        GPE = sum(GPEs) / len(GPEs) * 100
-        VDE = sum(VDEs) / len(VDEs) * 100
-        FFE = sum(FFEs) / len(FFEs) * 100
-        print(f"[\t\t\t---MEASUREMENT RESULT OVER {total_frames} frames---\t\t\t]")
-        print(f"[INFO] average Gross Pitch Error (GPE): {GPE} %")
-        print(f"[INFO] average Voicing Decision Error (VDE): {VDE} %")
-        print(f"[INFO] average F0 Frame Error (FFE): {FFE} %")
-        return bool
\ No newline at end of file
+        """Score every pair of the mapper
+
+        Returns:
+            MetricResults: per pair 'gpe', 'vde' and 'ffe' rates and number of frames, with corpus aggregates
+        """
+        pairs = list(self.pairs.items())
+        results = self.make_results(pairs, self.score_pairs(pairs))
+        average = results.utterance_mean
+        print(f"[\t\t\t---MEASUREMENT RESULT OVER {results.total_frames} frames---\t\t\t]")
+        print(f"[INFO] average Gross Pitch Error (GPE): {average['gpe'] * 100} %")
+        print(f"[INFO] average Voicing Decision Error (VDE): {average['vde'] * 100} %")
+        print(f"[INFO] average F0 Frame Error (FFE): {average['ffe'] * 100} %")
+        return results
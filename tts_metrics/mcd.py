@@ -1,33 +1,101 @@
 import os
 import math
 from dataclasses import dataclass
+from typing import Optional
 
-from scipy.spatial.distance import euclidean
-from fastdtw import fastdtw
 import numpy as np
-from tqdm import tqdm
 
 from tts_metrics.base import BaseMetric
-from tts_metrics.utils.data_utils import get_mfccs, wav_to_mcep
-
-log_spec_dB_const = 10.0 / math.log(10.0) * math.sqrt(2.0)
+from tts_metrics.results import MetricResults
+from tts_metrics.utils.audio_cache import load_wav, to_waveform
+from tts_metrics.utils.data_utils import (extract_mcep, get_mfccs, mcep_store_params, mfcc_store_params, stream_mcep,
+                                          stream_mfccs, wav_to_mcep)
+from tts_metrics.utils.feature_corpus import FeatureCorpus
+from tts_metrics.utils.feature_store import FeatureStore
+from tts_metrics.utils.frontend import ENVELOPES, batch_mcep, batch_mfccs
+from tts_metrics.utils.dtw import dtw, log_spec_dB_const
+from tts_metrics.utils.profiling import cache_access, timer
 
 def log_spec_dB_dist(x, y):
     diff = x - y
     return log_spec_dB_const * math.sqrt(np.inner(diff, diff))
 
+def frame_log_spec_dB_dist(x, y):
+    """log_spec_dB_dist of every frame at once: [..., t, D] x [..., t, D] -> [..., t]
+    """
+    diff = np.asarray(x, dtype=np.float64) - y
+    return log_spec_dB_const * np.sqrt(np.einsum('...d,...d->...', diff, diff))
+
+def batch_mcd(ceps_1, ceps_2, use_dtw=False, dtw_band=None):
+    """MCD of many pairs in a single vectorized pass
+
+    Pairs are aligned (DTW or truncation to the shorter one), padded into one
+    [B, T_max, D] array and masked, so memory grows linearly with the length
+    of the utterances.
+
+    Args:
+        ceps_1 (list of np.ndarray): reference cepstra, each [t, D] with c0 in column 0
+        ceps_2 (list of np.ndarray): synthesized cepstra, each [t, D] with c0 in column 0
+        use_dtw (bool, optional): align pairs with DTW instead of truncating. Defaults to False.
+        dtw_band (int, optional): Sakoe-Chiba radius of the DTW. Defaults to None.
+
+    Returns:
+        tuple: (per pair MCD [B], per pair number of frames [B], frame-weighted corpus MCD)
+    """
+    if len(ceps_1) != len(ceps_2):
+        raise ValueError(f"Got {len(ceps_1)} reference and {len(ceps_2)} synthesized cepstra")
+    aligned_1, aligned_2 = [], []
+    for cep_1, cep_2 in zip(ceps_1, ceps_2):
+        cep_1, cep_2 = cep_1[:, 1:], cep_2[:, 1:]
+        if use_dtw:
+            _, path_1, path_2 = dtw(cep_1, cep_2, metric='log_spec_dB', band=dtw_band)
+            cep_1, cep_2 = cep_1[path_1], cep_2[path_2]
+        else:
+            num_frames = min(cep_1.shape[0], cep_2.shape[0])
+            cep_1, cep_2 = cep_1[:num_frames], cep_2[:num_frames]
+        aligned_1.append(cep_1)
+        aligned_2.append(cep_2)
+
+    num_frames = np.array([cep.shape[0] for cep in aligned_1], dtype=np.int64)
+    dim = aligned_1[0].shape[1] if aligned_1 else 0
+    padded_1 = np.zeros((len(aligned_1), num_frames.max(initial=0), dim))
+    padded_2 = np.zeros_like(padded_1)
+    for i, (cep_1, cep_2) in enumerate(zip(aligned_1, aligned_2)):
+        padded_1[i, :num_frames[i]] = cep_1
+        padded_2[i, :num_frames[i]] = cep_2
+    mask = np.arange(padded_1.shape[1])[None, :] < num_frames[:, None]
+
+    frame_distances = frame_log_spec_dB_dist(padded_1, padded_2) * mask
+    totals = frame_distances.sum(axis=1)
+    distances = totals / np.maximum(num_frames, 1)
+    corpus_mcd = totals.sum() / max(num_frames.sum(), 1)
+    return distances, num_frames, corpus_mcd
+
 
 @dataclass
 class MCDConfig:
     use_dtw: bool = True
+    dtw_band: Optional[int] = None # Sakoe-Chiba radius in frames, None for unconstrained DTW
     K: int = 14
     sampling_rate: int = 22050
+    hop_length: int = 1024
+    alpha: float = 0.65
+    fft_size: int = 512
+    mcep_size: int = 24
+    frame_period: float = 5.0
+    streaming: bool = False # read audio block by block, for long-form files; with use_dtw, needs dtw_band
+    stream_block_frames: int = 2048
+    envelope: str = 'world' # spectral envelope of the mel cepstrum: 'world' (CheapTrick) or 'stft' (periodogram)
+    batch_size: int = 32 # files analysed together by the batched front-end when scoring serially
 
-class MCD(BasedMetric):
+class MCD(BaseMetric):
     """Model to calculate MCD
     """
-    def __init__(self, dataroot, data_mapper_path, metric_config, use_mfcc=True, name=None, mfccs_outdir='mfccs', mceps_outdir='mceps'):
-        super().__init__(dataroot, data_mapper_path, metric_config, name)
+    def __init__(self, dataroot, data_mapper_path, metric_config, use_mfcc=True, name=None, mfccs_outdir='mfccs', mceps_outdir='mceps',
+                 num_workers=1, journal_path=None, shard_index=0, num_shards=1, reference_corpus=None, prefetch=None):
+        super().__init__(dataroot, data_mapper_path, metric_config, name, num_workers=num_workers,
+                         journal_path=journal_path, shard_index=shard_index, num_shards=num_shards,
+                         prefetch=prefetch)
         self.config = metric_config
         self.use_dtw = metric_config.use_dtw # Incase you don't have a ensurement show that ref and syn have same length, you should enable this flag
         self.data_pairs = self.data_mapper
@@ -36,30 +104,179 @@ class MCD(BasedMetric):
         self.K = metric_config.K
         self.sampling_rate = metric_config.sampling_rate
         self.use_mfcc = use_mfcc
-        
+        # features are stored under a hash of audio content + extraction params,
+        # so re-scoring against a fixed reference set only extracts the synthesized side
+        self.feature_store = None
+        if self.dataroot is not None:
+            self.feature_store = FeatureStore(os.path.join(self.dataroot, self.mfccs_outdir if self.use_mfcc else self.mceps_outdir))
+        if metric_config.envelope not in ENVELOPES:
+            raise ValueError(f"Unknown envelope {metric_config.envelope!r}, expected one of {ENVELOPES}")
+        if metric_config.streaming and metric_config.use_dtw and metric_config.dtw_band is None:
+            raise ValueError("Streaming with DTW needs dtw_band: unbanded DTW holds both feature sequences "
+                             "and their cost matrix whole, set dtw_band or use_dtw=False")
+        if reference_corpus is not None:
+            self.set_reference_corpus(reference_corpus)
+
+    def journal_params(self):
+        return dict(super().journal_params(), use_mfcc=self.use_mfcc)
+
+    def feature_params(self):
+        if self.use_mfcc:
+            return dict(kind='mfcc', sample_rate=self.sampling_rate, n_mfcc=self.K, hop_length=self.config.hop_length)
+        params = dict(kind='mcep', alpha=self.config.alpha, fft_size=self.config.fft_size, mcep_size=self.config.mcep_size,
+                      sampling_rate=self.sampling_rate, frame_period=self.config.frame_period)
+        if self.config.envelope != 'world':
+            params['envelope'] = self.config.envelope
+        return params
+
+    def build_reference_corpus(self, root, wavefiles=None):
+        """Pack the features of `wavefiles` into a FeatureCorpus under `root` and read from it
+
+        Args:
+            root (str): corpus directory
+            wavefiles (list, optional): files relative to dataroot. Defaults to None (reference side of the mapper).
+
+        Returns:
+            FeatureCorpus: the written corpus
+        """
+        if wavefiles is None:
+            wavefiles = list(self.data_pairs)
+        self.reference_corpus = None
+        self.extract_missing(wavefiles)
+        # frames first in the corpus, MFCCs are [K, t]
+        items = ((wavefile, self.get_features(wavefile).T if self.use_mfcc else self.get_features(wavefile))
+                 for wavefile in wavefiles)
+        self.reference_corpus = FeatureCorpus.write(root, items, params=self.feature_params())
+        return self.reference_corpus
+
+    def store_params(self):
+        """(kind, params) of the features of get_features in the feature store, see FeatureStore.make_key
+        """
+        if self.use_mfcc:
+            return 'mfcc', mfcc_store_params(sample_rate=self.sampling_rate, n_mfcc=self.K,
+                                             hop_length=self.config.hop_length)
+        return 'mcep', mcep_store_params(alpha=self.config.alpha, fft_size=self.config.fft_size,
+                                         mcep_size=self.config.mcep_size, SAMPLING_RATE=self.sampling_rate,
+                                         FRAME_PERIOD=self.config.frame_period, envelope=self.config.envelope)
+
+    def missing_features(self, wavefiles):
+        """Yield (wavefile, store key) of the files whose features are neither in the corpus nor in the store
+        """
+        kind, params = self.store_params()
+        for wavefile in wavefiles:
+            if self.reference_corpus is not None and wavefile in self.reference_corpus:
+                continue
+            # hashing the file for the key is itself a full read, memoized for get_features
+            key = self.feature_store.make_key(os.path.join(self.dataroot, wavefile), kind, params)
+            if key not in self.feature_store:
+                yield wavefile, key
+
+    def prefetch_files(self, ref_file, syn_file):
+        if self.config.streaming or self.feature_store is None:
+            return []
+        return [(os.path.join(self.dataroot, wavefile), self.sampling_rate)
+                for wavefile, _ in self.missing_features((ref_file, syn_file))]
+
+    def prepare_pairs(self, pairs):
+        self.extract_missing(dict.fromkeys(wavefile for pair in pairs for wavefile in pair))
+
+    def prepare_window(self):
+        # up to 2 * batch_size files, every batch full even when the references are stored already
+        return max(self.config.batch_size, 1)
+
+    def extract_missing(self, wavefiles):
+        """Put the features of `wavefiles` missing from the store in it, batch_size files at once through the batched front-end
+        """
+        if self.config.streaming or self.feature_store is None or self.config.batch_size <= 1:
+            return
+        missing = list(self.missing_features(wavefiles))
+        for start in range(0, len(missing), self.config.batch_size):
+            batch = missing[start:start + self.config.batch_size]
+            wavs = [load_wav(os.path.join(self.dataroot, wavefile), sr=self.sampling_rate) for wavefile, _ in batch]
+            for (_, key), feature in zip(batch, self.features_from_wavs(wavs)):
+                self.feature_store.put(key, feature)
+
+    def get_features(self, wavefile):
+        """Return MFCCs [K, t] or mel cepstrum [t, mcep_size + 1] of `wavefile` (relative to dataroot)
+        """
+        if self.reference_corpus is not None:
+            feature = self.reference_corpus.get(wavefile)
+            cache_access('reference_corpus', feature is not None)
+            if feature is not None:
+                return feature.T if self.use_mfcc else feature
+        filepath = os.path.join(self.dataroot, wavefile)
+        if self.use_mfcc:
+            return get_mfccs(filepath, sample_rate=self.sampling_rate, n_mfcc=self.K,
+                             hop_length=self.config.hop_length, feature_store=self.feature_store,
+                             streaming=self.config.streaming, block_frames=self.config.stream_block_frames)
+        return wav_to_mcep(filepath, alpha=self.config.alpha, fft_size=self.config.fft_size,
+                           mcep_size=self.config.mcep_size, SAMPLING_RATE=self.sampling_rate,
+                           FRAME_PERIOD=self.config.frame_period, feature_store=self.feature_store,
+                           streaming=self.config.streaming, block_frames=self.config.stream_block_frames,
+                           envelope=self.config.envelope)
+
+    def features_from_wav(self, wav):
+        """Return the features of a waveform at the config sampling rate, as get_features does for a file
+        """
         if self.use_mfcc:
-            self.mfccs_pairs = self.generate_mfcc() 
-            
+            return get_mfccs(y=wav, sample_rate=self.sampling_rate, n_mfcc=self.K, hop_length=self.config.hop_length)
+        return extract_mcep(wav, alpha=self.config.alpha, fft_size=self.config.fft_size,
+                            mcep_size=self.config.mcep_size, SAMPLING_RATE=self.sampling_rate,
+                            FRAME_PERIOD=self.config.frame_period, envelope=self.config.envelope)
+
+    def features_from_wavs(self, wavs):
+        """features_from_wav of many waveforms, through the batched front-end (same values)
+        """
+        features = []
+        for start in range(0, len(wavs), max(self.config.batch_size, 1)):
+            batch = wavs[start:start + max(self.config.batch_size, 1)]
+            if self.use_mfcc:
+                features += batch_mfccs(batch, sample_rate=self.sampling_rate, n_mfcc=self.K,
+                                        hop_length=self.config.hop_length)
+            else:
+                features += batch_mcep(batch, alpha=self.config.alpha, fft_size=self.config.fft_size,
+                                       mcep_size=self.config.mcep_size, SAMPLING_RATE=self.sampling_rate,
+                                       FRAME_PERIOD=self.config.frame_period, envelope=self.config.envelope)
+        return features
+
+    def iter_features(self, wavefile):
+        """Yield the cepstrum of `wavefile` as consecutive [t, D] blocks, in bounded memory
+        """
+        filepath = os.path.join(self.dataroot, wavefile)
+        if self.use_mfcc:
+            blocks = stream_mfccs(filepath, sample_rate=self.sampling_rate, n_mfcc=self.K,
+                                  hop_length=self.config.hop_length, block_frames=self.config.stream_block_frames)
+            return (block.T for block in blocks)
+        return stream_mcep(filepath, alpha=self.config.alpha, fft_size=self.config.fft_size,
+                           mcep_size=self.config.mcep_size, SAMPLING_RATE=self.sampling_rate,
+                           FRAME_PERIOD=self.config.frame_period, block_frames=self.config.stream_block_frames,
+                           envelope=self.config.envelope)
+
+    def mcd_streaming(self, ref_file, syn_file):
+        """MCD without DTW, accumulated block by block over both files
+
+        Same value as mcd_mcep/mcd_mfccs without DTW (frames truncated to the
+        shorter file), but neither the audio nor the features are held whole.
+        NaN when either file has no frame, as the whole-file path.
+        """
+        total, num_frames = 0.0, 0
+        for block_1, block_2 in zip(self.iter_features(ref_file), self.iter_features(syn_file)):
+            n = min(block_1.shape[0], block_2.shape[0])
+            total += np.sum(frame_log_spec_dB_dist(block_1[:n, 1:], block_2[:n, 1:]))
+            num_frames += n
+        if num_frames == 0:
+            return float('nan'), 0
+        return total / num_frames, num_frames
+
     def generate_mfcc(self):
-        """Generate and store file to folder
+        """Make sure features of every file in the mapper are in the feature store
             for further works, such as visualization
         """
-        os.makedirs(os.path.join(self.dataroot, self.mfccs_outdir), exist_ok=True)
-        
-        mfccs_pairs = {}
-        for ref_file in self.data_pairs:
-            ref_filename = os.path.splitext(os.path.basename(ref_file))[0] + '-mfcc.npy'
-            mfccs =  get_mfccs(os.path.join(self.dataroot, ref_file), n_mfcc=self.K)
-            np.save(os.path.join(self.dataroot, self.mfccs_outdir, ref_filename), mfccs)
-            
-            syn_filename = os.path.splitext(os.path.basename(self.data_pairs[ref_file]))[0] + '-mfcc.npy'
-            mfccs = get_mfccs(os.path.join(self.dataroot,self.data_pairs[ref_file]), n_mfcc=self.K)
-            np.save(os.path.join(self.dataroot, self.mfccs_outdir, syn_filename), mfccs)
-            
-            mfccs_pairs.update({ref_filename: syn_filename})
-        
-        return mfccs_pairs
-    
+        for ref_file, syn_file in self.data_pairs.items():
+            self.get_features(ref_file)
+            self.get_features(syn_file)
+        return dict(self.data_pairs.items())
+
     def mcd_mfccs(self, mfcc_1, mfcc_2, info=None):
         """calculate mcd between two input mel cepstral (MFCC is same)
         Actually, There something not work well there, you should use the mcep install util this comment is removed
@@ -70,19 +287,17 @@ class MCD(BasedMetric):
         """
         num_frame = 0
         if self.use_dtw:
-            distance, path = fastdtw(mfcc_1.T[:, 1:], mfcc_2.T[:, 1:], dist=log_spec_dB_dist)
-            mfcc_1 = np.take(mfcc_1, [l[0] for l in path], axis=1)
-            mfcc_2 = np.take(mfcc_2, [l[1] for l in path], axis=1)
-            num_frame = len(path)
+            distance, path_1, path_2 = dtw(mfcc_1.T[:, 1:], mfcc_2.T[:, 1:], metric='log_spec_dB', band=self.config.dtw_band)
+            mfcc_1 = np.take(mfcc_1, path_1, axis=1)
+            mfcc_2 = np.take(mfcc_2, path_2, axis=1)
+            num_frame = len(path_1)
         else:
             if mfcc_1.shape[1] < mfcc_2.shape[1]:
                 mfcc_2 = mfcc_2[:, :mfcc_1.shape[1]]
             else:
                 mfcc_1 = mfcc_1[:, :mfcc_2.shape[1]]
             num_frame = mfcc_1.shape[1]
-            distance = mfcc_1 - mfcc_2
-            distance = np.inner(distance[1:, ...], distance[1:, ...])
-            distance = np.sum(distance, axis=0, keepdims=False)
+            distance = np.sum(frame_log_spec_dB_dist(mfcc_1[1:].T, mfcc_2[1:].T))
         distance = distance / num_frame
         return distance, num_frame
     
@@ -98,50 +313,75 @@ class MCD(BasedMetric):
             _type_: _description_
         """
         if self.use_dtw:
-            distance, path = fastdtw(mcep_1[:, 1:], mcep_2[:, 1:], dist=log_spec_dB_dist)
-            mcep_1 = np.take(mcep_1[:, 1:], [l[0] for l in path], axis=0)
-            mcep_2 = np.take(mcep_2[:, 1:], [l[1] for l in path], axis=0)
-            num_frames = len(path)
+            distance, path_1, path_2 = dtw(mcep_1[:, 1:], mcep_2[:, 1:], metric='log_spec_dB', band=self.config.dtw_band)
+            mcep_1 = np.take(mcep_1[:, 1:], path_1, axis=0)
+            mcep_2 = np.take(mcep_2[:, 1:], path_2, axis=0)
+            num_frames = len(path_1)
         else:
-            if mcep_1.shape[0] > mcep_2.shape[0]:
-                mcep_1 = mcep_1[:mcep_2.shape[0], 1:]
-            else:
-                mcep_2 = mcep_2[:mcep_1.shape[0], 1:]
-            num_frames = mcep_1.shape[0]
-            distance = mcep_1 - mcep_2
-            distance = np.inner(distance, distance)
-            distance = np.sum(distance, axis=1, keepdims=False)
-            distance = np.sum(distance, axis=0, keepdims=False)
+            num_frames = min(mcep_1.shape[0], mcep_2.shape[0])
+            distance = np.sum(frame_log_spec_dB_dist(mcep_1[:num_frames, 1:], mcep_2[:num_frames, 1:]))
         distance = distance / num_frames
         return distance, num_frames
-                   
-    def compute_mcd(self):
+
+    def mcd_batch(self, feats_1, feats_2):
+        """MCD of many pairs at once, see batch_mcd
+
+        Args:
+            feats_1 (list of np.ndarray): reference features, as returned by get_features
+            feats_2 (list of np.ndarray): synthesized features, as returned by get_features
+
+        Returns:
+            tuple: (per pair MCD [B], per pair number of frames [B], frame-weighted corpus MCD)
+        """
         if self.use_mfcc:
-            distances = []
-            total_frames = 0
-            for ref_mel_file, syn_mel_file in tqdm(self.mfccs_pairs.items()):
-                mel_1 = np.load(os.path.join(self.dataroot, self.mfccs_outdir, ref_mel_file))
-                mel_2 = np.load(os.path.join(self.dataroot, self.mfccs_outdir, syn_mel_file))
-                distance, num_frames = self.mcd_mfccs(mel_1, mel_2, f"MCD between {ref_mel_file} & {syn_mel_file} is")
-                distances.append(distance)
-                total_frames += num_frames  
-            print(f"[INFO] MCD using MFCC return average value {sum(distances)/len(distances)} over {total_frames} frames")
-            return distance, total_frames
-        else:
-            distances = []
-            total_frames = 0
-            for ref_file, syn_file in tqdm(self.data_pairs.items()):
-                mcep_1 = wav_to_mcep(wavfile=os.path.join(self.dataroot, ref_file), 
-                                     target_directory=os.path.join(self.dataroot, self.mceps_outdir))
-                mcep_2 = wav_to_mcep(wavfile=os.path.join(self.dataroot, syn_file),
-                                     target_directory=os.path.join(self.dataroot, self.mceps_outdir))
-                distance, num_frames = self.mcd_mcep(mcep_1, mcep_2)
-                distances.append(distance)
-                total_frames += num_frames
-                print(f'[INFOR] MCD between {ref_file} and {syn_file} is: {distance}')
-            print(f"[INFO] MCD using MCEP return average value {sum(distances)/len(distances)} over {total_frames} frames")
-            print(f"[INFO] MCD using MCEP return per pair value is {distances} over {total_frames} frames")
-        return None
-    
+            # MFCCs are [K, t], batch_mcd works on frames first
+            feats_1 = [feat.T for feat in feats_1]
+            feats_2 = [feat.T for feat in feats_2]
+        return batch_mcd(feats_1, feats_2, use_dtw=self.use_dtw, dtw_band=self.config.dtw_band)
+
+    def score_features(self, feat_1, feat_2):
+        """Return (mcd, number of frames) of two features as returned by get_features
+        """
+        if self.use_mfcc:
+            return self.mcd_mfccs(feat_1, feat_2)
+        return self.mcd_mcep(feat_1, feat_2)
+
+    def score_pair(self, ref_file, syn_file):
+        if self.config.streaming and not self.use_dtw:
+            # DTW needs both sequences whole, only the extraction streams then
+            return self.mcd_streaming(ref_file, syn_file)
+        return self.score_features(self.get_features(ref_file), self.get_features(syn_file))
+
+    def score_array(self, ref, syn, sr=None, features=False):
+        if not features:
+            ref = self.features_from_wav(to_waveform(ref, sr, self.sampling_rate))
+            syn = self.features_from_wav(to_waveform(syn, sr, self.sampling_rate))
+        return self.score_features(ref, syn)
+
+    def score_arrays(self, refs, syns, sr=None, features=False, ids=None):
+        if not features:
+            # waveforms go through the batched front-end, then are scored as features
+            refs = self.features_from_wavs([to_waveform(wav, sr, self.sampling_rate) for wav in refs])
+            syns = self.features_from_wavs([to_waveform(wav, sr, self.sampling_rate) for wav in syns])
+        return super().score_arrays(refs, syns, features=True, ids=ids)
+
+    def make_results(self, pairs, scores):
+        with timer('aggregate'):
+            return MetricResults(self.name or "MCD", pairs,
+                                 {'mcd': [distance for distance, _ in scores]},
+                                 [num_frames for _, num_frames in scores])
+
+    def compute_mcd(self):
+        """Score every pair of the mapper
+
+        Returns:
+            MetricResults: per pair 'mcd' and number of frames, with corpus aggregates
+        """
+        pairs = list(self.data_pairs.items())
+        results = self.make_results(pairs, self.score_pairs(pairs))
+        print(f"[INFO] MCD using {'MFCC' if self.use_mfcc else 'MCEP'} return average value "
+              f"{results.utterance_mean['mcd']} over {results.total_frames} frames")
+        return results
+
     def compute(self):
         return self.compute_mcd()
\ No newline at end of file
@@ -0,0 +1,178 @@
+## per-pair results of a metric run and their corpus aggregates
+import os
+import csv
+import math
+
+import numpy as np
+
+from tts_metrics.stats import OnlineAggregate
+
+
+class MetricResults:
+    """Columnar results of a metric over a set of (reference, synthesized) pairs
+
+    Args:
+        name (str): name of the metric run
+        pairs (list): (ref_file, syn_file) of every pair
+        metrics (dict): metric name -> per pair values, in the order of `pairs`
+        num_frames (list): number of compared frames of every pair
+    """
+    def __init__(self, name, pairs, metrics, num_frames):
+        self.name = name
+        self.ref_files = np.array([ref_file for ref_file, _ in pairs], dtype=str)
+        self.syn_files = np.array([syn_file for _, syn_file in pairs], dtype=str)
+        self.metrics = {key: np.asarray(values, dtype=np.float64) for key, values in metrics.items()}
+        self.num_frames = np.asarray(num_frames, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.num_frames)
+
+    def __getitem__(self, key):
+        return self.metrics[key]
+
+    @property
+    def total_frames(self):
+        return int(self.num_frames.sum())
+
+    # fsum is exact whatever the order of the rows, so merged shards give the aggregates of a single run.
+    # Like OnlineAggregate, both leave out non-finite values (GPE of a pair without voiced frames).
+
+    @property
+    def utterance_mean(self):
+        """Average over pairs, every utterance counts the same
+        """
+        means = {}
+        for key, values in self.metrics.items():
+            values = values[np.isfinite(values)]
+            means[key] = math.fsum(values) / len(values) if len(values) else float('nan')
+        return means
+
+    @property
+    def frame_weighted(self):
+        """Average over pairs weighted by their number of frames
+        """
+        means = {}
+        for key, values in self.metrics.items():
+            finite = np.isfinite(values)
+            total = max(int(self.num_frames[finite].sum()), 1)
+            means[key] = math.fsum(values[finite] * self.num_frames[finite]) / total
+        return means
+
+    def stats(self, reservoir_size=1000, seed=0):
+        """Return the OnlineAggregate of these pairs, with variances and confidence intervals
+        """
+        return OnlineAggregate(self.name, self.metrics, reservoir_size, seed).update_results(self)
+
+    def summary(self):
+        lines = [f"[INFO] {self.name} over {len(self)} pairs, {self.total_frames} frames"]
+        utterance_mean, frame_weighted = self.utterance_mean, self.frame_weighted
+        for key in self.metrics:
+            lines.append(f"[INFO] {key}: utterance mean {utterance_mean[key]}, frame weighted {frame_weighted[key]}")
+        return "\n".join(lines)
+
+    def to_columns(self):
+        """Return every column as {name: np.ndarray}
+        """
+        columns = {'ref_file': self.ref_files, 'syn_file': self.syn_files}
+        columns.update(self.metrics)
+        columns['num_frames'] = self.num_frames
+        return columns
+
+    def to_csv(self, path):
+        columns = self.to_columns()
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*(column.tolist() for column in columns.values())))
+
+    def to_npz(self, path):
+        np.savez(path, **self.to_columns())
+
+    def to_parquet(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+        table = pa.table(self.to_columns())
+        if self.name is not None:
+            table = table.replace_schema_metadata({'name': self.name})
+        pq.write_table(table, path)
+
+    def save(self, path):
+        """Export to `path`, format picked from its extension (.csv, .npz or .parquet)
+        """
+        extension = os.path.splitext(path)[1].lower()
+        exporters = {'.csv': self.to_csv, '.npz': self.to_npz, '.parquet': self.to_parquet}
+        if extension not in exporters:
+            raise ValueError(f"Unknown results format {extension}, expected one of {tuple(exporters)}")
+        exporters[extension](path)
+
+    @classmethod
+    def from_columns(cls, columns, name=None):
+        """Build results from the columns of to_columns
+        """
+        columns = dict(columns)
+        pairs = list(zip(np.asarray(columns.pop('ref_file')).tolist(), np.asarray(columns.pop('syn_file')).tolist()))
+        num_frames = columns.pop('num_frames')
+        return cls(name, pairs, columns, num_frames)
+
+    @classmethod
+    def from_npz(cls, path, name=None):
+        """Load results written by to_npz
+        """
+        with np.load(path) as data:
+            return cls.from_columns({key: data[key] for key in data.files}, name)
+
+    @classmethod
+    def from_csv(cls, path, name=None):
+        """Load results written by to_csv
+        """
+        with open(path, newline='') as f:
+            rows = list(csv.reader(f))
+        header, rows = rows[0], rows[1:]
+        columns = {key: [row[i] for row in rows] for i, key in enumerate(header)}
+        return cls.from_columns(columns, name)
+
+    @classmethod
+    def from_parquet(cls, path, name=None):
+        """Load results written by to_parquet
+        """
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+        table = pq.read_table(path)
+        metadata = table.schema.metadata or {}
+        if name is None and b'name' in metadata:
+            name = metadata[b'name'].decode('utf-8')
+        return cls.from_columns({key: table.column(key).to_numpy() for key in table.column_names}, name)
+
+    @classmethod
+    def load(cls, path, name=None):
+        """Load results saved by save, format picked from the extension of `path`
+        """
+        extension = os.path.splitext(path)[1].lower()
+        loaders = {'.csv': cls.from_csv, '.npz': cls.from_npz, '.parquet': cls.from_parquet}
+        if extension not in loaders:
+            raise ValueError(f"Unknown results format {extension}, expected one of {tuple(loaders)}")
+        return loaders[extension](path, name)
+
+    @classmethod
+    def concatenate(cls, results, name=None):
+        """Stack the rows of several results, e.g. one per shard
+
+        Aggregates of the output are computed over all rows, so they are exactly
+        the ones of a single run over every pair.
+        """
+        results = list(results)
+        if not results:
+            raise ValueError("Nothing to concatenate")
+        keys = list(results[0].metrics)
+        for result in results[1:]:
+            if list(result.metrics) != keys:
+                raise ValueError(f"Cannot concatenate results with metrics {keys} and {list(result.metrics)}")
+        pairs = [pair for result in results for pair in zip(result.ref_files.tolist(), result.syn_files.tolist())]
+        metrics = {key: np.concatenate([result.metrics[key] for result in results]) for key in keys}
+        num_frames = np.concatenate([result.num_frames for result in results])
+        return cls(name if name is not None else results[0].name, pairs, metrics, num_frames)
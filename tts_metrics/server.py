@@ -0,0 +1,422 @@
+"""Long-lived scoring daemon: metrics, decoded audio and features stay warm between requests
+
+    tts-metrics serve --http 127.0.0.1:8765 --dataroot data/audio --reference_corpus mcd=corpus/ref_mcep
+    tts-metrics serve --socket /tmp/tts_metrics.sock --dataroot data/audio
+
+A request names a metric ('mcd', 'gpe' or 'all'), its config and (ref_file,
+syn_file) pairs relative to the dataroot; the response holds the per-pair
+columns of MetricResults. Requests arriving within `max_wait_ms` of each
+other are scored together: one batched extraction of the missing features
+and one pass of scoring, shared pairs scored once.
+
+    from tts_metrics.server import ScoringClient
+
+    client = ScoringClient("http://127.0.0.1:8765")
+    results = client.score("mcd", [("ref_1.wav", "step_5000/syn_1.wav")], config={'use_dtw': True})
+"""
+import importlib
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tts_metrics.results import MetricResults
+from tts_metrics.utils.audio_cache import get_waveform_cache
+
+METRICS = ('mcd', 'gpe', 'all')
+
+
+def results_to_dict(results):
+    # JSON form of MetricResults, read back by results_from_dict
+    columns = {key: value.tolist() for key, value in results.to_columns().items()}
+    return {'name': results.name, 'columns': columns}
+
+
+def results_from_dict(data):
+    return MetricResults.from_columns(data['columns'], data['name'])
+
+
+class RequestBatcher:
+    """Coalesce requests submitted from many threads into batches scored on one thread
+
+    The first request of a batch waits at most `max_wait` seconds for others;
+    requests with the same key (same metric and config) are then scored by a
+    single `score_batch(key, requests)` call, at most `max_batch_pairs` pairs at
+    once. Scoring on one thread also keeps the metrics, which are not thread
+    safe, to one caller.
+
+    Args:
+        score_batch (callable): (key, list of payloads) -> list of results, one per payload
+        max_wait (float, optional): seconds a request waits for others. Defaults to 0.005.
+        max_batch_pairs (int, optional): pairs scored in one call. Defaults to 1024.
+    """
+    def __init__(self, score_batch, max_wait=0.005, max_batch_pairs=1024):
+        self.score_batch = score_batch
+        self.max_wait = max_wait
+        self.max_batch_pairs = max_batch_pairs
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="tts-metrics-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, payload, num_pairs):
+        """Queue a request, return a Future of its result
+        """
+        future = Future()
+        self._queue.put((key, payload, num_pairs, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        # blocks for a first request, then takes whatever else arrives before the deadline
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch, num_pairs = [first], first[2]
+        deadline = time.monotonic() + self.max_wait
+        while num_pairs < self.max_batch_pairs:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+            num_pairs += item[2]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[0], []).append(item)
+            for key, items in groups.items():
+                self.batches += 1
+                self.requests += len(items)
+                try:
+                    results = self.score_batch(key, [payload for _, payload, _, _ in items])
+                except Exception:
+                    # one bad request must not fail the others: score them apart
+                    results = None
+                if results is not None:
+                    for (_, _, _, future), result in zip(items, results):
+                        future.set_result(result)
+                    continue
+                for _, payload, _, future in items:
+                    try:
+                        future.set_result(self.score_batch(key, [payload])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+
+
+class ScoringServer:
+    """Warm metrics behind a RequestBatcher, shared by the HTTP and Unix socket front-ends
+
+    Metrics are built on first use for every (metric, dataroot, config) and
+    kept warm, with their feature store, reference corpus and process pool,
+    up to `max_metrics` of them: the least recently used one is then closed.
+    The waveform cache is shared by all of them.
+
+    Every path of a request (dataroot, audio files, reference corpus) must
+    resolve, symbolic links followed, inside `root`: a client cannot make
+    the server read or write anywhere else.
+
+    Args:
+        dataroot (str): root dir of the paths of requests that give none
+        reference_corpus (dict, optional): metric ('mcd', 'gpe') -> corpus directory read by the metrics of
+            requests that name none. Defaults to None.
+        num_workers (int, optional): processes of every metric, kept open between batches. Defaults to 1.
+        max_wait_ms (float, optional): see RequestBatcher. Defaults to 5.
+        max_batch_pairs (int, optional): see RequestBatcher. Defaults to 1024.
+        root (str, optional): directory every path of a request must be in. Defaults to None (`dataroot`).
+        max_metrics (int, optional): metrics kept warm at once. Defaults to 8.
+    """
+    def __init__(self, dataroot, reference_corpus=None, num_workers=1, max_wait_ms=5.0, max_batch_pairs=1024,
+                 root=None, max_metrics=8):
+        self.root = os.path.realpath(root or dataroot)
+        self.dataroot = self.resolve(dataroot)
+        self.reference_corpus = reference_corpus or {}
+        self.num_workers = num_workers
+        self.max_metrics = max(max_metrics, 1)
+        self.started = time.time()
+        # key -> (metric, open scoring session), least recently used first
+        self._metrics = OrderedDict()
+        self.batcher = RequestBatcher(self._score_batch, max_wait=max_wait_ms / 1000.0,
+                                      max_batch_pairs=max_batch_pairs)
+
+    def resolve(self, path, base=None):
+        """Real path of `path` (relative to `base`, else to the root), ValueError when it is outside the root
+        """
+        resolved = os.path.realpath(os.path.join(base or self.root, path))
+        if os.path.commonpath([self.root, resolved]) != self.root:
+            raise ValueError(f"{path!r} is outside the directory served, {self.root}")
+        return resolved
+
+    def request_key(self, request):
+        """Requests with the same key share a metric and are batched together
+
+        Paths are resolved, so the key of a request only names directories inside the root.
+        """
+        if request.get('metric') not in METRICS:
+            raise ValueError(f"Unknown metric {request.get('metric')!r}, expected one of {METRICS}")
+        key = {key: request.get(key) for key in ('metric', 'config', 'gpe_config', 'use_mfcc')}
+        key['dataroot'] = self.resolve(request['dataroot']) if request.get('dataroot') else self.dataroot
+        key['reference_corpus'] = None
+        if request.get('reference_corpus'):
+            key['reference_corpus'] = self.resolve(request['reference_corpus'])
+        return json.dumps(key, sort_keys=True)
+
+    def get_metric(self, key):
+        """The metric of a request key, built on first use
+        """
+        if key in self._metrics:
+            self._metrics.move_to_end(key)
+            return self._metrics[key][0]
+        from tts_metrics.evaluator import Evaluator
+        from tts_metrics.gpe import GPE, GPEConfig
+        from tts_metrics.mcd import MCD, MCDConfig
+
+        request = json.loads(key)
+        dataroot = request['dataroot']
+        config = request['config'] or {}
+        corpus = request['reference_corpus'] or self.reference_corpus.get(request['metric'])
+        if request['metric'] == 'mcd':
+            metric = MCD(dataroot, None, MCDConfig(**config), use_mfcc=bool(request['use_mfcc']), name="MCD",
+                         num_workers=self.num_workers, reference_corpus=corpus)
+        elif request['metric'] == 'gpe':
+            metric = GPE(dataroot, None, GPEConfig(**config), "GPE", num_workers=self.num_workers,
+                         reference_corpus=corpus)
+        else:
+            gpe_config = dict({'method': 'dio'}, **(request['gpe_config'] or {}))
+            metric = Evaluator(dataroot, None, [MCDConfig(**config), GPEConfig(**gpe_config)],
+                               num_workers=self.num_workers)
+        metric.progress = False
+        # the process pool, when there is one, lives as long as the metric stays in the cache
+        session = metric.scoring_session()
+        session.__enter__()
+        self._metrics[key] = (metric, session)
+        while len(self._metrics) > self.max_metrics:
+            _, (_, evicted) = self._metrics.popitem(last=False)
+            evicted.__exit__(None, None, None)
+        return metric
+
+    def _score_batch(self, key, requests):
+        metric = self.get_metric(key)
+        # a pair asked by several requests is scored once
+        pairs = list(dict.fromkeys(tuple(pair) for request in requests for pair in request['pairs']))
+        scores = dict(zip(pairs, metric.score_pairs(pairs)))
+        responses = []
+        for request in requests:
+            request_pairs = [tuple(pair) for pair in request['pairs']]
+            results = metric.make_results(request_pairs, [scores[pair] for pair in request_pairs])
+            responses.append([results_to_dict(result) for result in (results if isinstance(results, list) else [results])])
+        return responses
+
+    def score(self, request, timeout=None):
+        """Score a request dict, blocking until its batch is done
+
+        Returns:
+            dict: {'results': [results_to_dict of every MetricResults]}
+        """
+        key = self.request_key(request)
+        dataroot = json.loads(key)['dataroot']
+        pairs = request.get('pairs') or []
+        for pair in pairs:
+            if len(pair) != 2:
+                raise ValueError(f"Pairs are [ref_file, syn_file], got {pair!r}")
+            for wavefile in pair:
+                self.resolve(wavefile, dataroot)
+        return {'results': self.batcher.submit(key, request, len(pairs)).result(timeout)}
+
+    def health(self):
+        return {'status': 'ok', 'uptime_seconds': time.time() - self.started, 'metrics': len(self._metrics),
+                'batches': self.batcher.batches, 'requests': self.batcher.requests,
+                'waveform_cache': get_waveform_cache().stats()}
+
+    def warm_up(self):
+        """Import the heavy dependencies and compile the DTW before the first request
+        """
+        from tts_metrics.utils.dtw import dtw
+
+        importlib.import_module('librosa')
+        dtw([[0.0]], [[0.0]], metric='log_spec_dB')
+
+    def close(self):
+        self.batcher.close()
+        while self._metrics:
+            _, (_, session) = self._metrics.popitem(last=False)
+            session.__exit__(None, None, None)
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    # POST /score with a JSON request, GET /health
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, self.server.scoring.health())
+        else:
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self._reply(200, self.server.scoring.score(request))
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self._reply(400, {'error': f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        # one line per request would drown the server output
+        pass
+
+
+class _SocketHandler(socketserver.StreamRequestHandler):
+    # one JSON request per line, one JSON response per line, any number per connection
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if request.get('command') == 'health':
+                    response = self.server.scoring.health()
+                else:
+                    response = self.server.scoring.score(request)
+            except Exception as e:
+                response = {'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(scoring, http=None, socket_path=None):
+    """Bind `scoring` to a localhost HTTP address ("host:port") or a Unix socket path
+
+    Returns:
+        socketserver.BaseServer: call serve_forever() on it
+    """
+    if (http is None) == (socket_path is None):
+        raise ValueError("Give exactly one of an HTTP address or a Unix socket path")
+    if http is not None:
+        host, port = http.rsplit(":", 1)
+        server = ThreadingHTTPServer((host, int(port)), _HTTPHandler)
+        server.daemon_threads = True
+    else:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _UnixServer(socket_path, _SocketHandler)
+    server.scoring = scoring
+    return server
+
+
+class ScoringClient:
+    """Client of a running server
+
+    Args:
+        address (str): "http://host:port" or "unix:/path/to/socket"
+        timeout (float, optional): seconds to wait for a response. Defaults to None (no limit).
+    """
+    def __init__(self, address, timeout=None):
+        self.address = address
+        self.timeout = timeout
+        self._socket = None
+        self._file = None
+
+    def _send(self, request):
+        if self.address.startswith("unix:"):
+            if self._socket is None:
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connection.settimeout(self.timeout)
+                try:
+                    connection.connect(self.address[len("unix:"):])
+                except OSError:
+                    connection.close()
+                    raise
+                self._socket, self._file = connection, connection.makefile('rwb')
+            self._file.write(json.dumps(request).encode('utf-8') + b"\n")
+            self._file.flush()
+            response = json.loads(self._file.readline())
+        else:
+            http_request = urllib.request.Request(f"{self.address.rstrip('/')}/score",
+                                                  data=json.dumps(request).encode('utf-8'),
+                                                  headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(http_request, timeout=self.timeout) as f:
+                    response = json.load(f)
+            except urllib.error.HTTPError as e:
+                response = json.load(e)
+        if 'error' in response:
+            raise RuntimeError(f"Server error: {response['error']}")
+        return response
+
+    def score(self, metric, pairs, config=None, use_mfcc=False, gpe_config=None, dataroot=None, reference_corpus=None):
+        """Score (ref_file, syn_file) pairs on the server
+
+        Args:
+            metric (str): 'mcd', 'gpe' or 'all'
+            pairs (list): (ref_file, syn_file) relative to the dataroot of the server (or `dataroot`)
+            config (dict, optional): fields of MCDConfig ('mcd', 'all') or GPEConfig ('gpe'). Defaults to None.
+            use_mfcc (bool, optional): MCD on MFCCs. Defaults to False.
+            gpe_config (dict, optional): fields of the GPEConfig of 'all'. Defaults to None (method 'dio').
+            dataroot (str, optional): root of the paths, inside the root of the server. Defaults to None (its dataroot).
+            reference_corpus (str, optional): corpus of the references, inside the root of the server. Defaults to None.
+
+        Returns:
+            MetricResults: as compute returns them (one per config for 'all')
+        """
+        request = {'metric': metric, 'pairs': [list(pair) for pair in pairs], 'config': config,
+                   'use_mfcc': use_mfcc, 'gpe_config': gpe_config, 'dataroot': dataroot,
+                   'reference_corpus': reference_corpus}
+        results = [results_from_dict(data) for data in self._send(request)['results']]
+        return results if metric == 'all' else results[0]
+
+    def health(self):
+        if self.address.startswith("unix:"):
+            return self._send({'command': 'health'})
+        with urllib.request.urlopen(f"{self.address.rstrip('/')}/health", timeout=self.timeout) as f:
+            return json.load(f)
+
+    def close(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
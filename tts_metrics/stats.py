@@ -0,0 +1,383 @@
+## constant-memory corpus statistics of a metric run, mergeable across workers and shards
+import json
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+CI_METHODS = ('bootstrap', 'normal')
+
+
+class RunningStats:
+    """Count, mean and variance of a stream of values, unweighted and weighted by frames
+
+    Batches are reduced with NumPy, then folded in with the pairwise update of
+    Chan et al. (Welford's update for a batch of one), so the state is a few
+    floats whatever the number of values, and two states merge into the one
+    of the concatenated streams (up to rounding). Non-finite values (GPE of a
+    pair without voiced frames) are left out of every statistic and counted
+    in `nonfinite`.
+    """
+    def __init__(self):
+        self.count = 0
+        self.nonfinite = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.weight = 0.0
+        self.weighted_mean = 0.0
+        self.weighted_m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values, weights):
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+        finite = np.isfinite(values)
+        self.nonfinite += int(len(values) - finite.sum())
+        values, weights = values[finite], weights[finite]
+        if not len(values):
+            return self
+        batch = RunningStats()
+        batch.count = len(values)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.weight = float(weights.sum())
+        if batch.weight > 0:
+            batch.weighted_mean = float((weights * values).sum() / batch.weight)
+            batch.weighted_m2 = float((weights * (values - batch.weighted_mean) ** 2).sum())
+        batch.min, batch.max = float(values.min()), float(values.max())
+        return self.merge(batch)
+
+    def merge(self, other):
+        """Fold the state of `other` in, as if its values had been added to this one
+        """
+        self.nonfinite += other.nonfinite
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        weight = self.weight + other.weight
+        if weight > 0:
+            delta = other.weighted_mean - self.weighted_mean
+            self.weighted_mean += delta * other.weight / weight
+            self.weighted_m2 += other.weighted_m2 + delta ** 2 * self.weight * other.weight / weight
+        self.count, self.weight = count, weight
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance over utterances
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else float('nan')
+
+    @property
+    def weighted_variance(self):
+        """Variance of the values weighted by frames (frames are not independent, see OnlineAggregate)
+        """
+        return self.weighted_m2 / self.weight if self.weight > 0 else float('nan')
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls()
+        stats.__dict__.update(state)
+        return stats
+
+
+class Reservoir:
+    """Uniform sample of at most `size` rows of a stream (algorithm R), mergeable across streams
+
+    A row is the values of every metric of a pair and its number of frames.
+
+    Args:
+        size (int): rows kept
+        num_columns (int): metrics per row
+        seed (int, optional): seed of the sampling. Defaults to 0.
+    """
+    def __init__(self, size, num_columns, seed=0):
+        self.size = size
+        self.seed = seed
+        self.seen = 0
+        self.values = np.empty((0, num_columns), dtype=np.float64)
+        self.frames = np.empty(0, dtype=np.int64)
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def update(self, values, frames):
+        """Offer rows [n, num_columns] with their frames [n]
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(len(frames), -1)
+        frames = np.asarray(frames, dtype=np.int64)
+        # fill the free slots first, then row i of the stream replaces a random slot with probability size / i
+        free = min(self.size - len(self), len(frames))
+        if free > 0:
+            self.values = np.concatenate([self.values, values[:free]])
+            self.frames = np.concatenate([self.frames, frames[:free]])
+        if free < len(frames):
+            positions = self.seen + np.arange(free, len(frames)) + 1
+            slots = (self._rng.random(len(positions)) * positions).astype(np.int64)
+            # in stream order, a later row taking the slot of an earlier one replaces it
+            for row in np.flatnonzero(slots < self.size):
+                self.values[slots[row]] = values[free + row]
+                self.frames[slots[row]] = frames[free + row]
+        self.seen += len(frames)
+        return self
+
+    def merge(self, other):
+        """Replace the sample by a uniform sample of the union of both streams
+
+        Reservoirs of different sizes merge into one of the smaller size, the
+        largest a uniform sample of the union can have.
+        """
+        self.size = min(self.size, other.size)
+        seen = self.seen + other.seen
+        keep = min(self.size, seen)
+        # how many of `keep` rows drawn from the union come from this stream
+        mine = int(self._rng.hypergeometric(self.seen, other.seen, keep)) if self.seen and other.seen else \
+            (keep if other.seen == 0 else 0)
+        from_self = self._rng.choice(len(self), mine, replace=False)
+        from_other = self._rng.choice(len(other), keep - mine, replace=False)
+        self.values = np.concatenate([self.values[from_self], other.values[from_other]])
+        self.frames = np.concatenate([self.frames[from_self], other.frames[from_other]])
+        self.seen = seen
+        return self
+
+    def to_dict(self):
+        return {'size': self.size, 'seed': self.seed, 'seen': self.seen, 'num_columns': self.values.shape[1],
+                'values': self.values.tolist(), 'frames': self.frames.tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        num_columns = state['num_columns']
+        reservoir = cls(state['size'], num_columns, state['seed'])
+        reservoir.seen = state['seen']
+        reservoir.values = np.asarray(state['values'], dtype=np.float64).reshape(-1, num_columns)
+        reservoir.frames = np.asarray(state['frames'], dtype=np.int64)
+        # not the generator of the saved run, but a deterministic one per (seed, rows seen)
+        reservoir._rng = np.random.default_rng([state['seed'], state['seen']])
+        return reservoir
+
+
+def bootstrap_means(values, frames, population, n_resamples=1000, seed=0):
+    """Bootstrap distributions of the utterance mean and frame-weighted mean of `population` rows from a sample of them
+
+    `values` [m, k] is a uniform sample of the population, its resamples give the
+    spread of a mean over m rows. Deviations from the sample means are scaled by
+    sqrt(m / population): a mean over the whole population is that much tighter.
+    Non-finite values are left out of the means, as RunningStats does.
+
+    Returns:
+        tuple: (utterance means [n_resamples, k], frame-weighted means [n_resamples, k]), centered on 0
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = len(frames)
+    indices = rng.integers(0, sample_size, size=(n_resamples, sample_size))
+    finite = np.isfinite(values)
+    values = np.where(finite, values, 0.0)
+    frames = finite * frames[:, None].astype(np.float64)
+    # [n_resamples, sample_size, k]: resampled values, and their count and frames where they are finite
+    resampled, counted, weights = values[indices], finite[indices], frames[indices]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        utterance = resampled.sum(axis=1) / counted.sum(axis=1) - values.sum(axis=0) / finite.sum(axis=0)
+        weighted = ((weights * resampled).sum(axis=1) / weights.sum(axis=1)
+                    - (frames * values).sum(axis=0) / frames.sum(axis=0))
+    scale = math.sqrt(sample_size / max(population, sample_size))
+    return utterance * scale, weighted * scale
+
+
+class OnlineAggregate:
+    """Corpus statistics of the metrics of a run, in constant memory
+
+    Every pair updates a RunningStats per metric (utterance mean and variance,
+    frame-weighted mean) and a reservoir sample of `reservoir_size` pairs the
+    bootstrap confidence intervals are drawn from. Aggregates of workers or
+    shards merge into the one of the whole run.
+
+        aggregate = OnlineAggregate("MCD", ['mcd'])
+        aggregate.update({'mcd': distances}, num_frames)
+        aggregate.merge(other_shard)
+        aggregate.confidence_intervals(0.95)
+
+    Args:
+        name (str): name of the metric run
+        keys (list): metric names, as the keys of MetricResults.metrics
+        reservoir_size (int, optional): pairs kept for the bootstrap. Defaults to 1000.
+        seed (int, optional): seed of the reservoir sampling. Defaults to 0.
+    """
+    def __init__(self, name, keys, reservoir_size=1000, seed=0):
+        self.name = name
+        self.keys = list(keys)
+        self.stats = {key: RunningStats() for key in self.keys}
+        self.reservoir = Reservoir(reservoir_size, len(self.keys), seed)
+        self.total_frames = 0
+
+    def __len__(self):
+        return self.reservoir.seen
+
+    def update(self, metrics, num_frames):
+        """Add pairs: `metrics` maps every key to per pair values, in the order of `num_frames`
+        """
+        num_frames = np.asarray(num_frames, dtype=np.int64)
+        columns = [np.asarray(metrics[key], dtype=np.float64) for key in self.keys]
+        for key, values in zip(self.keys, columns):
+            self.stats[key].update(values, num_frames)
+        self.reservoir.update(np.stack(columns, axis=1) if columns else np.empty((len(num_frames), 0)), num_frames)
+        self.total_frames += int(num_frames.sum())
+        return self
+
+    def update_results(self, results):
+        """Add the pairs of a MetricResults
+        """
+        return self.update(results.metrics, results.num_frames)
+
+    def merge(self, other):
+        """Fold in the aggregate of other pairs, e.g. of another shard
+        """
+        if other.keys != self.keys:
+            raise ValueError(f"Cannot merge aggregates of metrics {self.keys} and {other.keys}")
+        for key in self.keys:
+            self.stats[key].merge(other.stats[key])
+        self.reservoir.merge(other.reservoir)
+        self.total_frames += other.total_frames
+        return self
+
+    @classmethod
+    def combine(cls, aggregates, name=None):
+        """Merge several aggregates (left untouched) into a new one
+        """
+        aggregates = list(aggregates)
+        if not aggregates:
+            raise ValueError("Nothing to combine")
+        combined = cls.from_dict(aggregates[0].to_dict())
+        for aggregate in aggregates[1:]:
+            combined.merge(aggregate)
+        if name is not None:
+            combined.name = name
+        return combined
+
+    @property
+    def utterance_mean(self):
+        return {key: stats.mean if stats.count else float('nan') for key, stats in self.stats.items()}
+
+    @property
+    def frame_weighted(self):
+        return {key: stats.weighted_mean if stats.weight > 0 else float('nan') for key, stats in self.stats.items()}
+
+    @property
+    def std(self):
+        """Standard deviation over utterances
+        """
+        return {key: math.sqrt(stats.variance) for key, stats in self.stats.items()}
+
+    @property
+    def stderr(self):
+        """Standard error of the utterance mean
+        """
+        return {key: math.sqrt(stats.variance / stats.count) if stats.count > 1 else float('nan')
+                for key, stats in self.stats.items()}
+
+    def confidence_intervals(self, confidence=0.95, method='bootstrap', n_resamples=1000, seed=0):
+        """(low, high) of the utterance mean and frame-weighted mean of every metric
+
+        'bootstrap' resamples the reservoir (percentile intervals, see
+        bootstrap_means) and covers both means. 'normal' is mean +/- z * stderr
+        from the running variance; it needs no reservoir but only exists for the
+        utterance mean: frames of an utterance are not independent samples.
+
+        Returns:
+            dict: key -> {'utterance_mean': (low, high), 'frame_weighted': (low, high)}
+        """
+        if method not in CI_METHODS:
+            raise ValueError(f"Unknown confidence interval method {method!r}, expected one of {CI_METHODS}")
+        utterance_mean, frame_weighted = self.utterance_mean, self.frame_weighted
+        nan_interval = (float('nan'), float('nan'))
+        if method == 'normal':
+            z = NormalDist().inv_cdf(0.5 + confidence / 2)
+            stderr = self.stderr
+            return {key: {'utterance_mean': (utterance_mean[key] - z * stderr[key], utterance_mean[key] + z * stderr[key]),
+                          'frame_weighted': nan_interval}
+                    for key in self.keys}
+
+        if len(self.reservoir) < 2:
+            return {key: {'utterance_mean': nan_interval, 'frame_weighted': nan_interval} for key in self.keys}
+        utterance, weighted = bootstrap_means(self.reservoir.values, self.reservoir.frames, len(self),
+                                              n_resamples, seed)
+        tails = [50 * (1 - confidence), 50 * (1 + confidence)]
+        intervals = {}
+        for i, key in enumerate(self.keys):
+            low, high = np.percentile(utterance[:, i], tails).tolist()
+            weighted_low, weighted_high = np.percentile(weighted[:, i], tails).tolist()
+            # percentiles of the bootstrapped deviations, around the exact running means
+            intervals[key] = {'utterance_mean': (utterance_mean[key] + low, utterance_mean[key] + high),
+                              'frame_weighted': (frame_weighted[key] + weighted_low, frame_weighted[key] + weighted_high)}
+        return intervals
+
+    def compare(self, other, confidence=0.95, n_resamples=1000, seed=0):
+        """Difference of the utterance means of `self` and `other` (e.g. two checkpoints), with its bootstrap interval
+
+        The two runs are resampled independently, so the interval does not
+        assume they scored the same pairs; an interval excluding 0 is a
+        difference at level `confidence`.
+
+        Returns:
+            dict: key -> (difference, low, high)
+        """
+        if other.keys != self.keys:
+            raise ValueError(f"Cannot compare aggregates of metrics {self.keys} and {other.keys}")
+        if len(self.reservoir) < 2 or len(other.reservoir) < 2:
+            return {key: (self.utterance_mean[key] - other.utterance_mean[key], float('nan'), float('nan'))
+                    for key in self.keys}
+        mine, _ = bootstrap_means(self.reservoir.values, self.reservoir.frames, len(self), n_resamples, seed)
+        theirs, _ = bootstrap_means(other.reservoir.values, other.reservoir.frames, len(other), n_resamples, seed + 1)
+        tails = [50 * (1 - confidence), 50 * (1 + confidence)]
+        comparison = {}
+        for i, key in enumerate(self.keys):
+            difference = self.utterance_mean[key] - other.utterance_mean[key]
+            low, high = np.percentile(mine[:, i] - theirs[:, i], tails).tolist()
+            comparison[key] = (difference, difference + low, difference + high)
+        return comparison
+
+    def summary(self, confidence=0.95):
+        lines = [f"[INFO] {self.name} over {len(self)} pairs, {self.total_frames} frames"]
+        utterance_mean, frame_weighted, std = self.utterance_mean, self.frame_weighted, self.std
+        intervals = self.confidence_intervals(confidence)
+        for key in self.keys:
+            low, high = intervals[key]['utterance_mean']
+            weighted_low, weighted_high = intervals[key]['frame_weighted']
+            lines.append(f"[INFO] {key}: utterance mean {utterance_mean[key]} (std {std[key]}, "
+                         f"{confidence:.0%} CI [{low}, {high}]), frame weighted {frame_weighted[key]} "
+                         f"({confidence:.0%} CI [{weighted_low}, {weighted_high}])")
+            if self.stats[key].nonfinite:
+                lines.append(f"[INFO] {key}: {self.stats[key].nonfinite} pairs without a finite value left out")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {'name': self.name, 'keys': self.keys, 'total_frames': self.total_frames,
+                'stats': {key: stats.to_dict() for key, stats in self.stats.items()},
+                'reservoir': self.reservoir.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        aggregate = cls(state['name'], state['keys'], state['reservoir']['size'], state['reservoir']['seed'])
+        aggregate.total_frames = state['total_frames']
+        aggregate.stats = {key: RunningStats.from_dict(stats) for key, stats in state['stats'].items()}
+        aggregate.reservoir = Reservoir.from_dict(state['reservoir'])
+        return aggregate
+
+    def save(self, path):
+        """Write the state as JSON, to merge or compare later with load
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,181 @@
+## shared cache of decoded (and resampled) waveforms
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from tts_metrics.utils.lazy import lazy_import
+from tts_metrics.utils.profiling import cache_access, count, timer
+
+librosa = lazy_import('librosa')
+
+
+class WaveformCache:
+    """Decode-once cache of waveforms shared by every metric
+
+    Entries are keyed on (path, mtime, target sampling rate) so a modified file
+    or a different target rate never returns stale audio.
+
+    Args:
+        max_bytes (int): budget of the in-memory LRU, in bytes. 0 disables it.
+        cache_dir (str, optional): directory of the on-disk store of resampled
+            float32 arrays, reused across runs. Defaults to None (memory only).
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.current_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(path, sr):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size, sr)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.npy')
+
+    def _remember(self, key, wav):
+        if wav.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = wav
+            self.current_bytes += wav.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def load(self, path, sr=22050):
+        """Return the waveform of `path` at sampling rate `sr` as float32
+
+        Args:
+            path (str): path to audio file
+            sr (int, optional): target sampling rate, None keeps the native rate. Defaults to 22050.
+
+        Returns:
+            np.ndarray: read-only float32 waveform
+        """
+        key = self.make_key(path, sr)
+        with self._lock:
+            wav = self._entries.get(key)
+            if wav is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                cache_access('waveform_cache', True)
+                return wav
+
+        disk_path = self._disk_path(key) if self.cache_dir is not None else None
+        if disk_path is not None and os.path.exists(disk_path):
+            wav = np.load(disk_path)
+            with self._lock:
+                self.disk_hits += 1
+            cache_access('waveform_cache', True)
+        else:
+            cache_access('waveform_cache', False)
+            # librosa.load(path, sr=sr) in two steps, timed apart
+            with timer('decode'):
+                wav, native_sr = librosa.load(path, sr=None)
+            count('decoded_bytes', wav.nbytes)
+            if sr is not None and sr != native_sr:
+                with timer('resample'):
+                    wav = librosa.resample(wav, orig_sr=native_sr, target_sr=sr)
+            wav = np.ascontiguousarray(wav, dtype=np.float32)
+            with self._lock:
+                self.misses += 1
+            if disk_path is not None:
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                tmp_path = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, wav, allow_pickle=False)
+                os.replace(tmp_path, disk_path)
+
+        # cached arrays are shared between callers, never let one of them mutate it
+        wav.flags.writeable = False
+        self._remember(key, wav)
+        return wav
+
+    def prime(self, path, sr, wav):
+        """Put an already loaded waveform of `path` at `sr` back in memory, e.g. one prefetched then evicted
+        """
+        self._remember(self.make_key(path, sr), wav)
+
+    def __getstate__(self):
+        # sent to worker processes: keep the configuration, not the entries
+        state = self.__dict__.copy()
+        state['_entries'] = OrderedDict()
+        state['current_bytes'] = 0
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drop every in-memory entry (the on-disk store is kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return entries, bytes held and hit/miss counts, read together under the lock
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.current_bytes, 'hits': self.hits,
+                    'disk_hits': self.disk_hits, 'misses': self.misses}
+
+
+_default_cache = WaveformCache()
+
+
+def get_waveform_cache():
+    """Return the process-wide cache used by MCD and GPE
+    """
+    return _default_cache
+
+
+def set_waveform_cache(cache):
+    """Replace the process-wide cache, e.g. to enable the on-disk store
+
+    Args:
+        cache (WaveformCache): new shared cache
+    """
+    global _default_cache
+    _default_cache = cache
+
+
+def load_wav(path, sr=22050):
+    """Load `path` at `sr` through the shared waveform cache
+    """
+    return _default_cache.load(path, sr)
+
+
+def to_waveform(wav, sr=None, target_sr=22050):
+    """Bring an in-memory waveform to what load_wav returns: mono float32 at `target_sr`
+
+    Args:
+        wav (np.ndarray): [n] or [channels, n] waveform
+        sr (int, optional): sampling rate of `wav`, None when already at `target_sr`. Defaults to None.
+        target_sr (int, optional): sampling rate of the analysis. Defaults to 22050.
+    """
+    wav = np.asarray(wav, dtype=np.float32)
+    if wav.ndim > 1:
+        wav = librosa.to_mono(wav)
+    if sr is not None and sr != target_sr:
+        with timer('resample'):
+            wav = librosa.resample(wav, orig_sr=sr, target_sr=target_sr)
+    return np.ascontiguousarray(wav, dtype=np.float32)
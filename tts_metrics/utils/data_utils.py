@@ -1,46 +1,179 @@
 ## perform loading dataset
 import os
+from fractions import Fraction
 
-
-import pyworld
-import pysptk
-import librosa
 import numpy as np
 
+from tts_metrics.utils.audio_cache import load_wav
+from tts_metrics.utils.feature_store import FeatureStore
+from tts_metrics.utils.frontend import batch_mcep, power_to_mcep, world_envelope
+from tts_metrics.utils.lazy import lazy_import
+from tts_metrics.utils.profiling import count, timer
+from tts_metrics.utils.streaming import stream_features
+
+librosa = lazy_import('librosa')
+
+# F0 range of the WORLD analysis of extract_mcep (the defaults of pyworld.wav2world)
+WORLD_F0_FLOOR = 71.0
+WORLD_F0_CEIL = 800.0
+
+def mfcc_store_params(sample_rate=22050, n_mfcc=14, dct_type=2, norm='ortho', lifter=0, hop_length=1024,
+                      streaming=False):
+    """Feature store parameters of get_mfccs, see FeatureStore.make_key
+    """
+    params = dict(sample_rate=sample_rate, n_mfcc=n_mfcc, dct_type=dct_type,
+                  norm=norm, lifter=lifter, hop_length=hop_length)
+    if streaming:
+        params['streaming'] = True
+    return params
+
+def mcep_store_params(alpha=0.65, fft_size=512, mcep_size=24, SAMPLING_RATE=22050, FRAME_PERIOD=5.0,
+                      streaming=False, envelope='world'):
+    """Feature store parameters of wav_to_mcep, see FeatureStore.make_key
+    """
+    params = dict(alpha=alpha, fft_size=fft_size, mcep_size=mcep_size,
+                  sampling_rate=SAMPLING_RATE, frame_period=FRAME_PERIOD)
+    if streaming:
+        params['streaming'] = True
+    if envelope != 'world':
+        params['envelope'] = envelope
+    return params
+
 def get_mfccs(filepath=None,
               y=None,
               sample_rate=22050,
               S=None,
-              n_mfcc=14, # 13 + 1 overall 
+              n_mfcc=14, # 13 + 1 overall
               dct_type=2,
               norm='ortho',
               lifter=0,
-              hop_length=1024):
-    if y == None:
-        y, sr = librosa.load(filepath)
-        mfccs = librosa.feature.mfcc(y=y, sr=sample_rate,\
-            S=S, n_mfcc=n_mfcc, dct_type=dct_type, norm=norm, lifter=lifter, hop_length=hop_length) # [B, n_mfccs, t]
-        return mfccs
+              hop_length=1024,
+              feature_store=None,
+              streaming=False,
+              block_frames=2048):
+    if y is None:
+        def extract():
+            if streaming:
+                return np.concatenate(list(stream_mfccs(filepath, sample_rate=sample_rate, n_mfcc=n_mfcc,
+                                                        dct_type=dct_type, norm=norm, lifter=lifter,
+                                                        hop_length=hop_length, block_frames=block_frames)), axis=1)
+            wav = load_wav(filepath, sr=sample_rate)
+            with timer('features'):
+                mfccs = librosa.feature.mfcc(y=wav, sr=sample_rate,\
+                    S=S, n_mfcc=n_mfcc, dct_type=dct_type, norm=norm, lifter=lifter, hop_length=hop_length) # [B, n_mfccs, t]
+            count('feature_frames', mfccs.shape[-1])
+            return mfccs
+        if feature_store is None:
+            return extract()
+        params = mfcc_store_params(sample_rate=sample_rate, n_mfcc=n_mfcc, dct_type=dct_type, norm=norm,
+                                   lifter=lifter, hop_length=hop_length, streaming=streaming)
+        return feature_store.get_or_compute(filepath, 'mfcc', params, extract)
     else:
-        mfccs = librosa.feature.mfcc(y=y, sr=sample_rate,\
-            S=S, n_mfcc=n_mfcc, dct_type=dct_type, norm=norm, lifter=lifter, hop_length=hop_length) # [B, n_mfccs, t]
+        with timer('features'):
+            mfccs = librosa.feature.mfcc(y=y, sr=sample_rate,\
+                S=S, n_mfcc=n_mfcc, dct_type=dct_type, norm=norm, lifter=lifter, hop_length=hop_length) # [B, n_mfccs, t]
+        count('feature_frames', mfccs.shape[-1])
+        return mfccs
+
+def stream_mfccs(filepath, sample_rate=22050, n_mfcc=14, dct_type=2, norm='ortho', lifter=0,
+                 hop_length=1024, n_fft=2048, block_frames=2048):
+    """MFCCs of `filepath` as consecutive [n_mfccs, t] blocks, in bounded memory
+
+    Frames are the ones of librosa.feature.mfcc on the whole file (centered,
+    zero padded). Its 80 dB floor is relative to the loudest mel bin of the
+    file, so the file is read twice: once for that maximum, once for the MFCCs.
+    """
+    def mel_power(segment):
+        with timer('features'):
+            return librosa.feature.melspectrogram(y=segment, sr=sample_rate, n_fft=n_fft,
+                                                  hop_length=hop_length, center=False)
+    framing = dict(hop=hop_length, sr=sample_rate, pad=n_fft // 2, frame_length=n_fft,
+                   block_frames=block_frames, time_axis=1)
+
+    peak = max((block.max() for block in stream_features(filepath, mel_power, **framing)), default=0.0)
+    floor = librosa.power_to_db(np.array([peak]), top_db=None)[0] - 80.0
+
+    def mfcc(segment):
+        S = mel_power(segment)
+        with timer('features'):
+            log_S = np.maximum(librosa.power_to_db(S, top_db=None), floor)
+            mfccs = librosa.feature.mfcc(S=log_S, n_mfcc=n_mfcc, dct_type=dct_type, norm=norm, lifter=lifter)
+        count('feature_frames', mfccs.shape[-1])
         return mfccs
-    
-def  wav_to_mcep(wavfile, target_directory, alpha=0.65, fft_size=512, mcep_size=24, SAMPLING_RATE=22050, FRAME_PERIOD=5.0):
-    # make relevant directories
-    if not os.path.exists(target_directory):
-        os.makedirs(target_directory)
+    return stream_features(filepath, mfcc, **framing)
+
+def extract_mcep(wav, alpha=0.65, fft_size=512, mcep_size=24, SAMPLING_RATE=22050, FRAME_PERIOD=5.0,
+                 envelope='world'):
+    if envelope != 'world':
+        return batch_mcep([wav], alpha=alpha, fft_size=fft_size, mcep_size=mcep_size, SAMPLING_RATE=SAMPLING_RATE,
+                          FRAME_PERIOD=FRAME_PERIOD, envelope=envelope)[0]
+    with timer('features'):
+        # Use WORLD vocoder to spectral envelope (the aperiodicity of wav2world is not needed)
+        _, sp = world_envelope(wav, SAMPLING_RATE=SAMPLING_RATE, FRAME_PERIOD=FRAME_PERIOD, fft_size=fft_size)
+
+        # Extract MCEP features
+        mgc = power_to_mcep(sp, mcep_size=mcep_size, alpha=alpha)
+    count('feature_frames', mgc.shape[0])
+    return mgc
+
+def extract_world(wav, alpha=0.65, fft_size=512, mcep_size=24, SAMPLING_RATE=22050, FRAME_PERIOD=5.0,
+                  f0_floor=WORLD_F0_FLOOR, f0_ceil=WORLD_F0_CEIL):
+    """One WORLD analysis for both F0 and mel cepstrum
+
+    Same steps as extract_mcep (dio, stonemask, cheaptrick), keeping the F0;
+    with the default F0 range the mel cepstrum is the one of extract_mcep.
+
+    Returns:
+        tuple: (f0 [t], mel cepstrum [t, mcep_size + 1])
+    """
+    with timer('features'):
+        f0, sp = world_envelope(wav, SAMPLING_RATE=SAMPLING_RATE, FRAME_PERIOD=FRAME_PERIOD, fft_size=fft_size,
+                                f0_floor=f0_floor, f0_ceil=f0_ceil)
+        mgc = power_to_mcep(sp, mcep_size=mcep_size, alpha=alpha)
+    count('feature_frames', mgc.shape[0])
+    return f0, mgc
+
+def stream_mcep(wavfile, alpha=0.65, fft_size=512, mcep_size=24, SAMPLING_RATE=22050, FRAME_PERIOD=5.0,
+                block_frames=2048, context_frames=200, envelope='world'):
+    """Mel cepstrum of `wavfile` as consecutive [t, mcep_size + 1] blocks, in bounded memory
+
+    WORLD looks around every frame (F0 tracking, pitch-adaptive windows), so each
+    block is analysed with `context_frames` frames (1 s by default) on both sides.
+    """
+    hop = Fraction(SAMPLING_RATE) * Fraction(FRAME_PERIOD).limit_denominator(1000) / 1000
+
+    def mcep(segment):
+        return extract_mcep(segment, alpha=alpha, fft_size=fft_size, mcep_size=mcep_size,
+                            SAMPLING_RATE=SAMPLING_RATE, FRAME_PERIOD=FRAME_PERIOD, envelope=envelope)
+    return stream_features(wavfile, mcep, hop, sr=SAMPLING_RATE, context_frames=context_frames,
+                           block_frames=block_frames)
 
-    loaded_wav, _ = librosa.load(wavfile, sr=SAMPLING_RATE)
+def  wav_to_mcep(wavfile, target_directory=None, alpha=0.65, fft_size=512, mcep_size=24, SAMPLING_RATE=22050, FRAME_PERIOD=5.0,
+                 feature_store=None, streaming=False, block_frames=2048, envelope='world'):
+    """Extract mel cepstrum of `wavfile`, reusing it from the feature store when possible
 
-    # Use WORLD vocoder to spectral envelope
-    _, sp, _ = pyworld.wav2world(loaded_wav.astype(np.double), fs=SAMPLING_RATE,
-                                   frame_period=FRAME_PERIOD, fft_size=fft_size)
+    Args:
+        wavfile (str): path to audio file
+        target_directory (str, optional): root of the feature store, used when `feature_store` is not given
+        feature_store (FeatureStore, optional): store keyed by audio content and extraction parameters
+        streaming (bool, optional): read the audio block by block instead of loading it whole. Defaults to False.
+        block_frames (int, optional): frames per block when streaming. Defaults to 2048.
+        envelope (str, optional): 'world' (CheapTrick) or 'stft' (periodogram), see batch_mcep. Defaults to 'world'.
+    """
+    if feature_store is None and target_directory is not None:
+        feature_store = FeatureStore(target_directory)
 
-    # Extract MCEP features
-    mgc = pysptk.sptk.mcep(sp, order=mcep_size, alpha=alpha, maxiter=0,
-                           etype=1, eps=1.0E-8, min_det=0.0, itype=3)
+    def extract():
+        if streaming:
+            return np.concatenate(list(stream_mcep(wavfile, alpha=alpha, fft_size=fft_size, mcep_size=mcep_size,
+                                                   SAMPLING_RATE=SAMPLING_RATE, FRAME_PERIOD=FRAME_PERIOD,
+                                                   block_frames=block_frames, envelope=envelope)), axis=0)
+        loaded_wav = load_wav(wavfile, sr=SAMPLING_RATE)
+        return extract_mcep(loaded_wav, alpha=alpha, fft_size=fft_size, mcep_size=mcep_size,
+                            SAMPLING_RATE=SAMPLING_RATE, FRAME_PERIOD=FRAME_PERIOD, envelope=envelope)
 
-    fname = os.path.basename(wavfile).split('.')[0] + '-mcep'
-    np.save(os.path.join(target_directory, fname + '.npy'),mgc, allow_pickle=False)
-    return mgc
\ No newline at end of file
+    if feature_store is None:
+        return extract()
+    params = mcep_store_params(alpha=alpha, fft_size=fft_size, mcep_size=mcep_size, SAMPLING_RATE=SAMPLING_RATE,
+                               FRAME_PERIOD=FRAME_PERIOD, streaming=streaming, envelope=envelope)
+    return feature_store.get_or_compute(wavfile, 'mcep', params, extract)
@@ -0,0 +1,219 @@
+## exact dynamic time warping with vectorized cost matrix
+import math
+import importlib.util
+
+import numpy as np
+
+from tts_metrics.utils.lazy import lazy_import
+from tts_metrics.utils.profiling import count, timer
+
+spatial_distance = lazy_import('scipy.spatial.distance')
+
+log_spec_dB_const = 10.0 / math.log(10.0) * math.sqrt(2.0)
+
+METRICS = ('euclidean', 'log_spec_dB')
+
+
+def _frames(x, y, metric):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown DTW metric {metric}, expected one of {METRICS}")
+    x = np.asarray(x, dtype=np.float64).reshape(len(x), -1)
+    y = np.asarray(y, dtype=np.float64).reshape(len(y), -1)
+    if x.shape[1] != y.shape[1]:
+        raise ValueError(f"Feature dims differ: {x.shape[1]} vs {y.shape[1]}")
+    return x, y
+
+
+def cost_matrix(x, y, metric='euclidean'):
+    """Pairwise frame distances between two sequences
+
+    Args:
+        x (np.ndarray): [N] or [N, D] sequence
+        y (np.ndarray): [M] or [M, D] sequence
+        metric (str, optional): 'euclidean' or 'log_spec_dB' (scaled euclidean used by MCD). Defaults to 'euclidean'.
+
+    Returns:
+        np.ndarray: [N, M] cost matrix
+    """
+    x, y = _frames(x, y, metric)
+    # cdist evaluates every cell exactly (no |x|^2 + |y|^2 - 2xy rounding) in one C pass
+    cost = spatial_distance.cdist(x, y, metric='euclidean')
+    if metric == 'log_spec_dB':
+        cost *= log_spec_dB_const
+    return cost
+
+
+def band_cost(x, y, lo, hi, metric='euclidean', block_rows=64):
+    """Frame distances inside a band, stored row by row from its first column
+
+    Only the cells of the band are evaluated and kept: memory is
+    O(N * max(hi - lo)), not O(N * M).
+
+    Args:
+        x (np.ndarray): [N] or [N, D] sequence
+        y (np.ndarray): [M] or [M, D] sequence
+        lo (np.ndarray): first column of every row, see band_limits
+        hi (np.ndarray): column after the last of every row
+        metric (str, optional): see cost_matrix. Defaults to 'euclidean'.
+        block_rows (int, optional): rows evaluated together. Defaults to 64.
+
+    Returns:
+        np.ndarray: [N, max(hi - lo)], cell (i, k) is the distance of x[i] and y[lo[i] + k], inf past hi[i]
+    """
+    x, y = _frames(x, y, metric)
+    if not lo.any() and np.all(hi == y.shape[0]):
+        # no band: every row spans every column
+        return cost_matrix(x, y, metric)
+    width = int((hi - lo).max())
+    cost = np.full((x.shape[0], width), np.inf)
+    offsets = np.arange(width)
+    for start in range(0, x.shape[0], block_rows):
+        stop = min(start + block_rows, x.shape[0])
+        col_lo, col_hi = lo[start:stop].min(), hi[start:stop].max()
+        block = spatial_distance.cdist(x[start:stop], y[col_lo:col_hi], metric='euclidean')
+        # gather the band of every row out of the rectangle around the block
+        columns = lo[start:stop, None] - col_lo + offsets
+        inside = offsets < (hi[start:stop] - lo[start:stop])[:, None]
+        cost[start:stop] = np.where(inside, np.take_along_axis(block, np.minimum(columns, block.shape[1] - 1), axis=1),
+                                    np.inf)
+    if metric == 'log_spec_dB':
+        cost *= log_spec_dB_const
+    return cost
+
+
+def band_limits(n, m, band):
+    """Column range [lo, hi) of every row inside a Sakoe-Chiba band
+
+    The band follows the diagonal of the (possibly rectangular) matrix and is
+    widened to the slope so a warping path always exists.
+    """
+    if band is None or n == 1 or m == 1:
+        # a single row (or column) is the only path: it spans the whole other sequence
+        return np.zeros(n, dtype=np.int64), np.full(n, m, dtype=np.int64)
+    slope = (m - 1) / (n - 1)
+    radius = max(int(band), int(math.ceil(slope)))
+    centers = np.arange(n) * slope
+    lo = np.clip(np.floor(centers).astype(np.int64) - radius, 0, m)
+    hi = np.clip(np.ceil(centers).astype(np.int64) + radius + 1, 0, m)
+    return lo, hi
+
+
+# The kernels work on banded arrays: acc[i, k] is the cost of the best path from (0, 0)
+# to cell (i, lo[i] + k), inf outside the band.
+
+def _band_lookup(acc, lo, hi, i, j):
+    # acc at cells (i, j), inf where i < 0 or j is outside the band of row i
+    row = np.maximum(i, 0)
+    inside = (i >= 0) & (j >= lo[row]) & (j < hi[row])
+    return np.where(inside, acc[row, np.clip(j - lo[row], 0, acc.shape[1] - 1)], np.inf)
+
+
+def _accumulate_numpy(cost, lo, hi):
+    # wavefront over anti-diagonals: all cells of one diagonal only depend on the previous two
+    n, m = cost.shape[0], int(hi[-1])
+    acc = np.full(cost.shape, np.inf)
+    for d in range(n + m - 1):
+        i = np.arange(max(0, d - m + 1), min(n - 1, d) + 1)
+        j = d - i
+        inside = (j >= lo[i]) & (j < hi[i])
+        i, j = i[inside], j[inside]
+        best = np.minimum(np.minimum(_band_lookup(acc, lo, hi, i - 1, j), _band_lookup(acc, lo, hi, i, j - 1)),
+                          _band_lookup(acc, lo, hi, i - 1, j - 1))
+        best[(i == 0) & (j == 0)] = 0.0
+        acc[i, j - lo[i]] = cost[i, j - lo[i]] + best
+    return acc
+
+
+def _accumulate_python(cost, lo, hi):
+    n = cost.shape[0]
+    acc = np.full(cost.shape, np.inf)
+    for i in range(n):
+        for j in range(lo[i], hi[i]):
+            best = np.inf
+            if i == 0 and j == 0:
+                best = 0.0
+            if i > 0 and lo[i - 1] <= j < hi[i - 1]:
+                best = min(best, acc[i - 1, j - lo[i - 1]])
+            if j > lo[i]:
+                best = min(best, acc[i, j - 1 - lo[i]])
+            if i > 0 and lo[i - 1] <= j - 1 < hi[i - 1]:
+                best = min(best, acc[i - 1, j - 1 - lo[i - 1]])
+            acc[i, j - lo[i]] = cost[i, j - lo[i]] + best
+    return acc
+
+
+def _backtrack_python(acc, lo, hi):
+    # ties resolve like fastdtw: (i-1, j), then (i, j-1), then (i-1, j-1)
+    i, j = acc.shape[0] - 1, hi[-1] - 1
+    path_x = np.empty(i + j + 1, dtype=np.int64)
+    path_y = np.empty(i + j + 1, dtype=np.int64)
+    k = 0
+    while True:
+        path_x[k] = i
+        path_y[k] = j
+        k += 1
+        if i == 0 and j == 0:
+            break
+        up, left, diag = np.inf, np.inf, np.inf
+        if i > 0 and lo[i - 1] <= j < hi[i - 1]:
+            up = acc[i - 1, j - lo[i - 1]]
+        if j > lo[i]:
+            left = acc[i, j - 1 - lo[i]]
+        if i > 0 and lo[i - 1] <= j - 1 < hi[i - 1]:
+            diag = acc[i - 1, j - 1 - lo[i - 1]]
+        if up <= left and up <= diag:
+            i -= 1
+        elif left <= diag:
+            j -= 1
+        else:
+            i -= 1
+            j -= 1
+    return path_x[:k][::-1].copy(), path_y[:k][::-1].copy()
+
+
+_kernels = None
+
+
+def get_kernels():
+    """Return the (accumulate, backtrack) kernels, compiled with numba on first use
+
+    numba ships with librosa, the NumPy kernels are only a fallback. Importing
+    numba takes a while, so it is not done until the first DTW.
+    """
+    global _kernels
+    if _kernels is None:
+        if importlib.util.find_spec('numba') is not None:
+            import numba
+            _kernels = (numba.njit(cache=True)(_accumulate_python), numba.njit(cache=True)(_backtrack_python))
+        else:
+            _kernels = (_accumulate_numpy, _backtrack_python)
+    return _kernels
+
+
+def dtw(x, y, metric='euclidean', band=None):
+    """Exact DTW between two sequences
+
+    Uses the same step pattern and cost as fastdtw with an infinite radius:
+    steps (1, 0), (0, 1), (1, 1) and the distance is the sum of frame costs along the path.
+    With a band, only its cells are stored: time and memory are O(N * band)
+    instead of O(N * M).
+
+    Args:
+        x (np.ndarray): [N] or [N, D] sequence
+        y (np.ndarray): [M] or [M, D] sequence
+        metric (str, optional): frame distance, see cost_matrix. Defaults to 'euclidean'.
+        band (int, optional): Sakoe-Chiba radius in frames, None for no constraint. Defaults to None.
+
+    Returns:
+        tuple: (distance, path_x, path_y), path_* are int index arrays of equal length
+    """
+    if len(x) == 0 or len(y) == 0:
+        raise ValueError("DTW needs two non-empty sequences")
+    accumulate, backtrack = get_kernels()
+    with timer('dtw'):
+        lo, hi = band_limits(len(x), len(y), band)
+        cost = band_cost(x, y, lo, hi, metric=metric)
+        acc = accumulate(cost, lo, hi)
+        path_x, path_y = backtrack(acc, lo, hi)
+    count('dtw_cells', int(np.sum(hi - lo)))
+    return float(acc[-1, hi[-1] - 1 - lo[-1]]), path_x, path_y
@@ -0,0 +1,112 @@
+## packed corpus of features: one memory-mapped data file and an index
+import os
+import json
+import uuid
+
+import numpy as np
+
+DATA_FILE = 'data.bin'
+INDEX_FILE = 'index.json'
+
+
+class FeatureCorpus:
+    """Features of many utterances packed into one memory-mapped file
+
+    A data file holds the [t, D] frames of every utterance back to back and
+    `index.json` its name and their (offset, length) in frames, keyed by
+    utterance ID (the path relative to dataroot). Opening a corpus is one mmap; get returns a
+    read-only view into it, no file is opened per utterance.
+
+    Args:
+        root (str): directory written by FeatureCorpus.write
+    """
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.dtype = np.dtype(index['dtype'])
+        self.dim = index['dim']
+        self.params = index['params']
+        self._utterances = index['utterances']
+        num_frames = index['num_frames']
+        if num_frames:
+            self._data = np.memmap(os.path.join(root, index.get('data_file', DATA_FILE)), dtype=self.dtype, mode='r',
+                                   shape=(num_frames, self.dim))
+        else:
+            self._data = np.empty((0, self.dim), dtype=self.dtype)
+
+    def __len__(self):
+        return len(self._utterances)
+
+    def __contains__(self, utt_id):
+        return utt_id in self._utterances
+
+    def keys(self):
+        return self._utterances.keys()
+
+    def get(self, utt_id):
+        """Return the [t, D] frames of `utt_id`, a view into the mapped file, None when missing
+        """
+        location = self._utterances.get(utt_id)
+        if location is None:
+            return None
+        offset, length = location
+        return self._data[offset:offset + length]
+
+    def __getstate__(self):
+        # sent to worker processes: they map the file again instead of receiving a copy of it
+        return {'root': self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'])
+
+    @classmethod
+    def write(cls, root, items, params=None):
+        """Pack `items` into a new corpus under `root` and return it opened
+
+        Args:
+            root (str): output directory, an existing corpus there is replaced
+            items (iterable): (utt_id, feature [t, D]) in any order, all with the same D and dtype
+            params (dict, optional): extraction parameters, checked by the readers. Defaults to None.
+
+        Returns:
+            FeatureCorpus: the written corpus
+        """
+        os.makedirs(root, exist_ok=True)
+        # every write has its own data file, only named by the index once complete:
+        # a reader sees the old corpus or the new one, never an index over other frames
+        data_file = f"data.{uuid.uuid4().hex}.bin"
+        data_path = os.path.join(root, data_file)
+        index_path = os.path.join(root, INDEX_FILE)
+        utterances, offset, dtype, dim = {}, 0, None, None
+        try:
+            with open(data_path, 'wb') as f:
+                for utt_id, feature in items:
+                    feature = np.asarray(feature)
+                    if dtype is None:
+                        dtype, dim = feature.dtype, feature.shape[1]
+                    if feature.ndim != 2 or feature.shape[1] != dim:
+                        raise ValueError(f"{utt_id}: expected [t, {dim}] frames, got shape {feature.shape}")
+                    np.ascontiguousarray(feature, dtype=dtype).tofile(f)
+                    utterances[utt_id] = [offset, feature.shape[0]]
+                    offset += feature.shape[0]
+        except BaseException:
+            os.remove(data_path)
+            raise
+
+        previous = None
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                previous = json.load(f).get('data_file', DATA_FILE)
+        index = {'dtype': np.dtype(dtype if dtype is not None else np.float64).str, 'dim': dim or 0,
+                 'num_frames': offset, 'params': params or {}, 'utterances': utterances, 'data_file': data_file}
+        with open(index_path + f".{data_file}.tmp", 'w') as f:
+            json.dump(index, f)
+        os.replace(index_path + f".{data_file}.tmp", index_path)
+        if previous is not None and previous != data_file:
+            try:
+                # open readers keep their mapping of it
+                os.remove(os.path.join(root, previous))
+            except OSError:
+                pass
+        return cls(root)
@@ -0,0 +1,115 @@
+## content-addressed store of extracted features
+import os
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+from tts_metrics.utils.profiling import cache_access
+
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return sha1 of the content of `path`
+
+    Digests are memoized on (path, mtime, size) so a file is hashed once per process.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    memo_key = (path, stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        digest = _digest_memo.get(memo_key)
+    if digest is not None:
+        return digest
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+class FeatureStore:
+    """Features stored under a hash of the audio content and extraction parameters
+
+    Two files with the same name in different directories never collide, and a
+    feature is extracted again only when the audio or one of the parameters changes.
+
+    Args:
+        root (str): directory holding the stored `.npy` features
+    """
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(wavfile, kind, params):
+        """Return the store key of feature `kind` of `wavfile` extracted with `params`
+
+        Args:
+            wavfile (str): path to audio file
+            kind (str): feature name, e.g. 'mfcc' or 'mcep'
+            params (dict): every parameter that changes the extracted feature
+        """
+        payload = json.dumps({'audio': file_digest(wavfile), 'kind': kind, 'params': params},
+                             sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.npy')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Return the stored feature or None on a miss
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, allow_pickle=False)
+
+    def put(self, key, feature):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # readers see the whole feature or none: written aside, then renamed over the key
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, feature, allow_pickle=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_or_compute(self, wavfile, kind, params, extract_fn):
+        """Return the stored feature of `wavfile`, extracting and storing it on a miss
+
+        Args:
+            wavfile (str): path to audio file
+            kind (str): feature name
+            params (dict): extraction parameters, part of the key
+            extract_fn (callable): called without arguments on a miss, returns the feature
+
+        Returns:
+            np.ndarray: feature
+        """
+        key = self.make_key(wavfile, kind, params)
+        feature = self.get(key)
+        cache_access('feature_store', feature is not None)
+        if feature is not None:
+            self.hits += 1
+            return feature
+        self.misses += 1
+        feature = extract_fn()
+        self.put(key, feature)
+        return feature
@@ -0,0 +1,169 @@
+## batched spectral front-end: envelopes of many utterances to MFCCs / mel cepstra in vectorized NumPy
+from functools import lru_cache
+
+import numpy as np
+
+from tts_metrics.utils.lazy import lazy_import
+from tts_metrics.utils.profiling import count, timer
+
+pyworld = lazy_import('pyworld')
+pysptk = lazy_import('pysptk')
+librosa = lazy_import('librosa')
+
+ENVELOPES = ('world', 'stft')
+
+
+@lru_cache(maxsize=16)
+def freqt_matrix(in_order, order, alpha):
+    """[in_order + 1, order + 1] matrix of pysptk.freqt, which is linear in its input
+
+    Warping a batch of cepstra is then one matrix product instead of a
+    recursion per frame.
+    """
+    basis = np.eye(in_order + 1)
+    matrix = np.stack([pysptk.freqt(row, order, alpha) for row in basis])
+    matrix.flags.writeable = False
+    return matrix
+
+
+def power_to_mcep(sp, mcep_size=24, alpha=0.65, eps=1.0E-8):
+    """Mel cepstrum of spectral envelopes [..., fft_size // 2 + 1], any leading shape
+
+    Same values as pysptk.sptk.mcep(sp, order=mcep_size, alpha=alpha, maxiter=0,
+    etype=1, eps=eps, min_det=0.0, itype=3) frame by frame: without Newton
+    iterations SPTK's mcep is the half cepstrum of log(sp ** 2 + eps), end
+    points halved, warped by freqt.
+
+    Returns:
+        np.ndarray: [..., mcep_size + 1]
+    """
+    sp = np.asarray(sp, dtype=np.float64)
+    fft_size = 2 * (sp.shape[-1] - 1)
+    cepstrum = np.fft.irfft(np.log(sp * sp + eps), n=fft_size)[..., :fft_size // 2 + 1]
+    cepstrum[..., 0] /= 2.0
+    cepstrum[..., -1] /= 2.0
+    return cepstrum @ freqt_matrix(fft_size // 2, mcep_size, alpha)
+
+
+def world_envelope(wav, SAMPLING_RATE=22050, FRAME_PERIOD=5.0, fft_size=512, f0_floor=71.0, f0_ceil=800.0):
+    """Return (f0 [t], CheapTrick envelope [t, fft_size // 2 + 1]) of a waveform
+
+    The F0 and envelope steps of pyworld.wav2world, without D4C aperiodicity
+    that no metric uses.
+    """
+    wav = np.asarray(wav, dtype=np.double)
+    f0, t = pyworld.dio(wav, SAMPLING_RATE, f0_floor=f0_floor, f0_ceil=f0_ceil, frame_period=FRAME_PERIOD)
+    f0 = pyworld.stonemask(wav, f0, t, SAMPLING_RATE)
+    return f0, pyworld.cheaptrick(wav, f0, t, SAMPLING_RATE, fft_size=fft_size)
+
+
+def world_num_frames(num_samples, SAMPLING_RATE=22050, FRAME_PERIOD=5.0):
+    # frames of pyworld.dio: one every FRAME_PERIOD ms from 0 to the end of the signal
+    return int(1000.0 * num_samples / SAMPLING_RATE / FRAME_PERIOD) + 1
+
+
+def pad_batch(wavs, dtype=np.float64):
+    """Stack waveforms into a zero padded [B, max length] array, with their lengths
+    """
+    lengths = np.array([len(wav) for wav in wavs], dtype=np.int64)
+    batch = np.zeros((len(wavs), lengths.max(initial=0)), dtype=dtype)
+    for i, wav in enumerate(wavs):
+        batch[i, :len(wav)] = wav
+    return batch, lengths
+
+
+def stft_envelope_batch(wavs, SAMPLING_RATE=22050, FRAME_PERIOD=5.0, fft_size=512):
+    """Hann windowed periodograms of a batch, one frame every FRAME_PERIOD ms as WORLD
+
+    Frame k is centered on sample round(k * hop), so the frames line up with
+    the ones of world_envelope. The low order mel cepstrum of a periodogram is
+    its cepstrally smoothed envelope, without F0 analysis.
+
+    Returns:
+        tuple: (envelopes [B, t_max, fft_size // 2 + 1], number of frames of every waveform [B])
+    """
+    batch, lengths = pad_batch(wavs)
+    num_frames = np.array([world_num_frames(length, SAMPLING_RATE, FRAME_PERIOD) for length in lengths],
+                          dtype=np.int64)
+    hop = SAMPLING_RATE * FRAME_PERIOD / 1000.0
+    starts = np.round(np.arange(num_frames.max(initial=0)) * hop).astype(np.int64)
+    batch = np.pad(batch, ((0, 0), (fft_size // 2, fft_size // 2)))
+    frames = batch[:, starts[:, None] + np.arange(fft_size)[None, :]] * np.hanning(fft_size)
+    spectrum = np.fft.rfft(frames, axis=-1)
+    # power spectrum, the quantity CheapTrick estimates, converted by power_to_mcep the same way
+    return np.abs(spectrum) ** 2 / fft_size, num_frames
+
+
+def batch_mcep(wavs, alpha=0.65, fft_size=512, mcep_size=24, SAMPLING_RATE=22050, FRAME_PERIOD=5.0,
+               envelope='world', max_batch_frames=16384):
+    """Mel cepstra of many waveforms, the mel-cepstral analysis done for the whole batch at once
+
+    Args:
+        wavs (list of np.ndarray): waveforms at SAMPLING_RATE
+        envelope (str, optional): 'world' for the CheapTrick envelope of extract_mcep (same values,
+            one WORLD analysis per waveform), 'stft' for periodograms computed for the whole
+            batch. Defaults to 'world'.
+        max_batch_frames (int, optional): padded frames analysed at once with 'stft', bounds memory. Defaults to 16384.
+
+    Returns:
+        list of np.ndarray: [t, mcep_size + 1] of every waveform
+    """
+    if envelope not in ENVELOPES:
+        raise ValueError(f"Unknown envelope {envelope!r}, expected one of {ENVELOPES}")
+    if not wavs:
+        return []
+    if envelope == 'world':
+        with timer('features'):
+            envelopes = [world_envelope(wav, SAMPLING_RATE, FRAME_PERIOD, fft_size)[1] for wav in wavs]
+            mceps = power_to_mcep(np.concatenate(envelopes), mcep_size, alpha)
+        count('feature_frames', len(mceps))
+        return np.split(mceps, np.cumsum([len(sp) for sp in envelopes])[:-1])
+
+    mceps = []
+    for chunk in _frame_chunks(wavs, SAMPLING_RATE, FRAME_PERIOD, max_batch_frames):
+        with timer('features'):
+            envelopes, num_frames = stft_envelope_batch(chunk, SAMPLING_RATE, FRAME_PERIOD, fft_size)
+            chunk_mceps = power_to_mcep(envelopes, mcep_size, alpha)
+        mceps += [mcep[:n] for mcep, n in zip(chunk_mceps, num_frames)]
+        count('feature_frames', int(num_frames.sum()))
+    return mceps
+
+
+def _frame_chunks(wavs, SAMPLING_RATE, FRAME_PERIOD, max_batch_frames):
+    # consecutive waveforms whose padded batch stays under max_batch_frames (or a single waveform)
+    chunk, longest = [], 0
+    for wav in wavs:
+        frames = world_num_frames(len(wav), SAMPLING_RATE, FRAME_PERIOD)
+        if chunk and max(longest, frames) * (len(chunk) + 1) > max_batch_frames:
+            yield chunk
+            chunk, longest = [], 0
+        chunk.append(wav)
+        longest = max(longest, frames)
+    if chunk:
+        yield chunk
+
+
+def batch_mfccs(wavs, sample_rate=22050, n_mfcc=14, dct_type=2, norm='ortho', lifter=0, hop_length=1024,
+                n_fft=2048, top_db=80.0):
+    """MFCCs of many waveforms from one mel spectrogram of the zero padded batch
+
+    Same values as get_mfccs on every waveform: centered frames only see zeros
+    past the end of a waveform either way, and the top_db floor is taken per
+    waveform over its own frames.
+
+    Returns:
+        list of np.ndarray: [n_mfcc, t] of every waveform
+    """
+    if not wavs:
+        return []
+    # float32 as load_wav, so the spectrogram is the one of each waveform alone
+    batch, lengths = pad_batch(wavs, dtype=np.float32)
+    num_frames = 1 + lengths // hop_length
+    with timer('features'):
+        mel = librosa.feature.melspectrogram(y=batch, sr=sample_rate, n_fft=n_fft, hop_length=hop_length)
+        log_S = librosa.power_to_db(mel, top_db=None)
+        for i, n in enumerate(num_frames):
+            np.maximum(log_S[i], log_S[i, :, :n].max() - top_db, out=log_S[i])
+        mfccs = librosa.feature.mfcc(S=log_S, n_mfcc=n_mfcc, dct_type=dct_type, norm=norm, lifter=lifter)
+    count('feature_frames', int(num_frames.sum()))
+    return [mfcc[:, :n] for mfcc, n in zip(mfccs, num_frames)]
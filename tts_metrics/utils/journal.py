@@ -0,0 +1,76 @@
+## append-only journal of per-pair scores, to resume interrupted runs
+import os
+import json
+import hashlib
+
+
+def _to_json(value):
+    # numpy scalars (np.float64, np.int64, ...) are not JSON serializable
+    return value.item() if hasattr(value, 'item') else value
+
+
+class ScoreJournal:
+    """JSONL file with one line per scored pair, appended as soon as it is scored
+
+    An entry is reused only when the metric parameters and the stat (mtime, size)
+    of both audio files are unchanged, so a restarted run skips exactly the
+    pairs whose score would come out the same. A line cut by a crash is ignored.
+
+    Args:
+        path (str): path to the journal file, created if missing
+        params (dict): everything that changes the score of a pair (metric, config)
+    """
+    def __init__(self, path, params):
+        self.path = path
+        self.params = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('params') == self.params:
+                        self._entries[(entry['ref'], entry['syn'])] = entry
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'a')
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def fingerprint(*paths):
+        """Return the (mtime, size) of every path, the part of an entry checked on reuse
+        """
+        fingerprint = []
+        for path in paths:
+            stat = os.stat(path)
+            fingerprint.append([stat.st_mtime_ns, stat.st_size])
+        return fingerprint
+
+    def get(self, ref_file, syn_file, inputs):
+        """Return the journaled result of the pair, None when missing or stale
+        """
+        entry = self._entries.get((ref_file, syn_file))
+        if entry is None or entry['inputs'] != inputs:
+            return None
+        return tuple(entry['result'])
+
+    def append(self, ref_file, syn_file, inputs, result):
+        entry = {'ref': ref_file, 'syn': syn_file, 'params': self.params,
+                 'inputs': inputs, 'result': [_to_json(value) for value in result]}
+        self._file.write(json.dumps(entry) + '\n')
+        # one line per pair reaches the OS right away, a killed run loses at most the pair in flight
+        self._file.flush()
+        self._entries[(ref_file, syn_file)] = entry
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,31 @@
+## modules imported on first use, to keep `import tts_metrics` and CLI startup fast
+import importlib
+
+
+class LazyModule:
+    """Stand-in for a module that is imported the first time one of its attributes is used
+
+    Args:
+        name (str): absolute module name, e.g. 'librosa' or 'scipy.spatial.distance'
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """Return a LazyModule for `name`, see LazyModule
+    """
+    return LazyModule(name)
@@ -0,0 +1,224 @@
+## lazily read manifests of (reference, synthesized) pairs: JSON dict, JSONL or TSV
+import os
+import re
+import json
+
+EXTENSIONS = {'.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.tsv': 'tsv', '.txt': 'tsv'}
+SPLITS = ('stride', 'bytes')
+# "key": "value" followed by its separator, the whole entry when neither string has escapes
+_PLAIN_ENTRY = re.compile(r'\s*"([^"\\]*)"\s*:\s*"([^"\\]*)"\s*([,}])')
+# a JSONL line as write_manifest writes it, without escapes
+_PLAIN_LINE = re.compile(r'\{"ref": "([^"\\]*)", "syn": "([^"\\]*)"\}')
+
+
+def manifest_format(path):
+    """Format of the manifest at `path`, from its extension; other extensions are JSON mappers, as before manifests
+    """
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'json')
+
+
+def iter_json_object(f, chunk_size=1 << 20):
+    """Yield the (key, value) items of the JSON object in text file `f`, reading `chunk_size` characters at a time
+
+    Same items as json.load(f).items() for a {str: str} object, but the object
+    is never held whole: memory is one chunk, whatever the size of the file.
+    Duplicate keys are all yielded (json.load keeps the last one).
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def refill():
+        nonlocal buffer, position, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+    def next_char():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\n\r":
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position] if position < len(buffer) else None
+            refill()
+
+    def expect(chars):
+        nonlocal position
+        char = next_char()
+        if char is None or char not in chars:
+            raise ValueError(f"Malformed JSON manifest: expected one of {chars!r}, got {char!r}")
+        position += 1
+        return char
+
+    def string():
+        nonlocal position
+        next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # cut by the end of the chunk, read on
+                if eof:
+                    raise
+                refill()
+                continue
+            if not isinstance(value, str):
+                raise ValueError(f"Manifest entries must be file paths, got {value!r}")
+            position = end
+            return value
+
+    expect("{")
+    if next_char() == "}":
+        return
+    while True:
+        entry = _PLAIN_ENTRY.match(buffer, position)
+        if entry is not None:
+            position = entry.end()
+            yield entry.group(1), entry.group(2)
+            if entry.group(3) == "}":
+                return
+            continue
+        # escapes, or an entry cut by the end of the chunk
+        key = string()
+        expect(":")
+        yield key, string()
+        if expect(",}") == "}":
+            return
+
+
+def parse_line(line, fmt):
+    """(ref_file, syn_file) of a JSONL or TSV line, None for a blank line, comment or TSV header
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if fmt == 'tsv':
+        fields = line.split("\t")
+        if len(fields) != 2:
+            raise ValueError(f"Expected 'reference<TAB>synthesized', got {line!r}")
+        return None if fields == ['ref', 'syn'] else tuple(fields)
+    plain = _PLAIN_LINE.fullmatch(line)
+    if plain is not None:
+        return plain.group(1), plain.group(2)
+    entry = json.loads(line)
+    if isinstance(entry, dict):
+        return entry['ref'], entry['syn']
+    ref_file, syn_file = entry
+    return ref_file, syn_file
+
+
+class Manifest:
+    """Pairs of a manifest file, read lazily every time they are iterated
+
+    A drop-in for the {reference: synthesized} dict of a mapper (items(),
+    iteration over references, len()) that never holds the pairs: memory stays
+    flat and scoring starts as soon as the first pair is read. It pickles as
+    its path, so worker processes do not receive a copy of the pairs.
+
+    Formats, from the extension:
+        - .json: {"ref.wav": "syn.wav", ...}, the mapper format, parsed incrementally
+        - .jsonl/.ndjson: one {"ref": ..., "syn": ...} or ["ref", "syn"] per line
+        - .tsv/.txt: one "ref<TAB>syn" per line, an optional "ref<TAB>syn" header
+
+    Shards of JSONL/TSV manifests are contiguous byte ranges ('bytes' split): a
+    shard seeks straight to its first line and reads nothing else. JSON shards
+    keep every `num_shards`-th pair ('stride' split, as shard_pairs), and read
+    the whole file.
+
+    Args:
+        path (str): manifest file
+        shard_index (int, optional): shard kept. Defaults to 0.
+        num_shards (int, optional): number of shards the manifest is split into. Defaults to 1.
+        split (str, optional): 'stride' or 'bytes' (line formats only). Defaults to None ('bytes' for
+            JSONL/TSV, 'stride' for JSON).
+    """
+    def __init__(self, path, shard_index=0, num_shards=1, split=None):
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+        self.path = path
+        self.format = manifest_format(path)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        self.split = split or ('stride' if self.format == 'json' else 'bytes')
+        if self.split not in SPLITS:
+            raise ValueError(f"Unknown split {self.split!r}, expected one of {SPLITS}")
+        if self.split == 'bytes' and self.format == 'json':
+            raise ValueError("A JSON manifest can only be split by 'stride', convert it to JSONL to seek by bytes")
+        self._length = None
+
+    def _iter_all(self):
+        if self.format == 'json':
+            with open(self.path) as f:
+                yield from iter_json_object(f)
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                pair = parse_line(line, self.format)
+                if pair is not None:
+                    yield pair
+
+    def _iter_byte_range(self):
+        size = os.path.getsize(self.path)
+        start = size * self.shard_index // self.num_shards
+        stop = size * (self.shard_index + 1) // self.num_shards
+        with open(self.path, 'rb') as f:
+            # a line belongs to the shard its first byte falls in
+            position = 0
+            if start > 0:
+                f.seek(start - 1)
+                position = start - 1 + len(f.readline())
+            for line in f:
+                if position >= stop:
+                    break
+                position += len(line)
+                pair = parse_line(line.decode('utf-8'), self.format)
+                if pair is not None:
+                    yield pair
+
+    def items(self):
+        """Yield the (ref_file, syn_file) pairs of the shard, in file order
+        """
+        if self.split == 'bytes':
+            yield from self._iter_byte_range()
+            return
+        for i, pair in enumerate(self._iter_all()):
+            if i % self.num_shards == self.shard_index:
+                yield pair
+
+    def __iter__(self):
+        return (ref_file for ref_file, _ in self.items())
+
+    def keys(self):
+        return iter(self)
+
+    def __len__(self):
+        # one pass over the file, remembered
+        if self._length is None:
+            self._length = sum(1 for _ in self.items())
+        return self._length
+
+    def __getstate__(self):
+        return {'path': self.path, 'shard_index': self.shard_index, 'num_shards': self.num_shards,
+                'split': self.split}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+def write_manifest(path, pairs):
+    """Write `pairs` ((ref_file, syn_file) iterable) to `path`, in the format of its extension
+    """
+    fmt = manifest_format(path)
+    with open(path, 'w', encoding='utf-8') as f:
+        if fmt == 'json':
+            # written entry by entry, the pairs are not held either
+            f.write("{")
+            for i, (ref_file, syn_file) in enumerate(pairs):
+                f.write(("," if i else "") + f"\n {json.dumps(ref_file)}: {json.dumps(syn_file)}")
+            f.write("\n}\n")
+            return
+        for ref_file, syn_file in pairs:
+            if fmt == 'tsv':
+                f.write(f"{ref_file}\t{syn_file}\n")
+            else:
+                f.write(json.dumps({'ref': ref_file, 'syn': syn_file}) + "\n")
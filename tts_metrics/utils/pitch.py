@@ -0,0 +1,157 @@
+## registry of F0 estimators sharing one (f0, voiced) contract
+import numpy as np
+
+from tts_metrics.utils.lazy import lazy_import
+
+librosa = lazy_import('librosa')
+pysptk = lazy_import('pysptk')
+pyworld = lazy_import('pyworld')
+
+F0_ESTIMATORS = {}
+
+# yin: the period is the first trough of the cumulative mean normalized difference (CMND) under
+# YIN_TROUGH_THRESHOLD, else its global minimum; the frame is voiced when the CMND at that period is
+# under YIN_VOICING_THRESHOLD (aperiodic frames stay near 1) and the frame is louder than YIN_SILENCE_DB
+# (dB relative to full scale), where the CMND of near digital silence is meaningless
+YIN_TROUGH_THRESHOLD = 0.1
+YIN_VOICING_THRESHOLD = 0.2
+YIN_SILENCE_DB = -60.0
+
+
+def register_f0_estimator(name):
+    """Decorator adding an estimator to F0_ESTIMATORS, selectable through GPEConfig.method
+
+    An estimator is called as fn(wav, sr, fmin, fmax, frame_length, hop_length, center)
+    and returns (f0, voiced): f0 in Hz with 0 on unvoiced frames and a boolean
+    voicing flag, one value per frame. Frame k starts at sample k * hop_length
+    of `wav`, or is centered on it when `center` is True, like librosa.
+    """
+    def register(fn):
+        F0_ESTIMATORS[name] = fn
+        return fn
+    return register
+
+
+def get_f0_estimator(name):
+    if name not in F0_ESTIMATORS:
+        raise ValueError(f"Unknown F0 method {name}, expected one of {tuple(F0_ESTIMATORS)}")
+    return F0_ESTIMATORS[name]
+
+
+def num_frames(num_samples, frame_length, hop_length, center=True):
+    """Number of frames librosa gives a signal of `num_samples` samples
+    """
+    if center:
+        return 1 + num_samples // hop_length
+    return 1 + max(num_samples - frame_length, 0) // hop_length
+
+
+def _fix_frames(f0, n):
+    # trackers that do not frame like librosa are cut or zero padded (unvoiced) to its frame count
+    f0 = np.asarray(f0, dtype=np.float64)[:n]
+    f0 = np.pad(f0, (0, n - len(f0)))
+    return f0, f0 > 0
+
+
+def _centered(track):
+    # WORLD and SPTK frames are centered on k * hop_length, shift the input by half
+    # a frame when frames must start there instead
+    def estimate(wav, sr, fmin, fmax, frame_length, hop_length, center=True):
+        n = num_frames(len(wav), frame_length, hop_length, center)
+        if not center:
+            wav = wav[frame_length // 2:]
+        return _fix_frames(track(wav, sr, fmin, fmax, hop_length), n)
+    return estimate
+
+
+@register_f0_estimator('pyin')
+def pyin(wav, sr, fmin, fmax, frame_length, hop_length, center=True):
+    f0, voiced, _ = librosa.pyin(wav, fmin=fmin, fmax=fmax, sr=sr, frame_length=frame_length,
+                                 hop_length=hop_length, center=center)
+    return np.where(np.isnan(f0), 0.0, f0), voiced
+
+
+def cmnd(frames, min_period, max_period):
+    """Cumulative mean normalized difference of [frame_length, n] frames at lags min_period..max_period
+
+    Equation 8 of de Cheveigné and Kawahara (2002), as librosa.yin computes it.
+    """
+    acf = librosa.autocorrelate(frames, max_size=max_period + 1, axis=0)
+    energy = np.cumsum(np.square(frames), axis=0)
+    diff = np.zeros((max_period + 1, frames.shape[1]), dtype=frames.dtype)
+    # d(k) = 2 * (acf(0) - acf(k)) - sum_{m<k} y(m)^2
+    diff[1:] = 2 * (acf[:1] - acf[1:]) - energy[:max_period]
+    cumulative_mean = np.cumsum(diff[1:], axis=0) / np.arange(1, max_period + 1)[:, None]
+    return diff[min_period:] / (cumulative_mean[min_period - 1:] + np.finfo(frames.dtype).tiny)
+
+
+def _parabolic_shifts(values):
+    # offset of the vertex of the parabola through every value and its neighbours, 0 when it falls outside them
+    shifts = np.zeros_like(values)
+    left, middle, right = values[:-2], values[1:-1], values[2:]
+    a = right + left - 2 * middle
+    b = (right - left) / 2
+    inside = np.abs(b) < np.abs(a)
+    shifts[1:-1][inside] = -b[inside] / a[inside]
+    return shifts
+
+
+@register_f0_estimator('yin')
+def yin(wav, sr, fmin, fmax, frame_length, hop_length, center=True):
+    # librosa.yin returns a period for every frame, voiced or not: its CMND gives the voicing too
+    wav = np.asarray(wav, dtype=np.float32)
+    if center:
+        wav = np.pad(wav, frame_length // 2)
+    wav = np.pad(wav, (0, max(frame_length - len(wav), 0)))
+    frames = librosa.util.frame(wav, frame_length=frame_length, hop_length=hop_length, axis=-1)
+    min_period = int(np.floor(sr / fmax))
+    max_period = min(int(np.ceil(sr / fmin)), frame_length - 1)
+    values = cmnd(frames, min_period, max_period)
+
+    is_trough = np.zeros(values.shape, dtype=bool)
+    is_trough[0] = values[0] < values[1]
+    is_trough[1:-1] = (values[1:-1] < values[:-2]) & (values[1:-1] <= values[2:])
+    below = is_trough & (values < YIN_TROUGH_THRESHOLD)
+    lag = np.where(below.any(axis=0), below.argmax(axis=0), values.argmin(axis=0))
+    columns = np.arange(values.shape[1])
+    trough = values[lag, columns]
+    f0 = sr / (min_period + lag + _parabolic_shifts(values)[lag, columns])
+
+    loud = 10 * np.log10(np.mean(np.square(frames), axis=0) + 1e-12) > YIN_SILENCE_DB
+    voiced = (trough < YIN_VOICING_THRESHOLD) & loud
+    return np.where(voiced, f0, 0.0), voiced
+
+
+def _frame_period(sr, hop_length):
+    return 1000.0 * hop_length / sr
+
+
+@register_f0_estimator('dio')
+@_centered
+def dio(wav, sr, fmin, fmax, hop_length):
+    wav = wav.astype(np.float64)
+    f0, t = pyworld.dio(wav, sr, f0_floor=fmin, f0_ceil=fmax, frame_period=_frame_period(sr, hop_length))
+    return pyworld.stonemask(wav, f0, t, sr)
+
+
+@register_f0_estimator('harvest')
+@_centered
+def harvest(wav, sr, fmin, fmax, hop_length):
+    f0, _ = pyworld.harvest(wav.astype(np.float64), sr, f0_floor=fmin, f0_ceil=fmax,
+                            frame_period=_frame_period(sr, hop_length))
+    return f0
+
+
+@register_f0_estimator('rapt')
+@_centered
+def rapt(wav, sr, fmin, fmax, hop_length):
+    # SPTK expects 16 bit sample values
+    return pysptk.rapt((wav * 32768.0).astype(np.float32), fs=sr, hopsize=hop_length,
+                       min=fmin, max=fmax, otype='f0')
+
+
+@register_f0_estimator('swipe')
+@_centered
+def swipe(wav, sr, fmin, fmax, hop_length):
+    return pysptk.swipe((wav * 32768.0).astype(np.float64), fs=sr, hopsize=hop_length,
+                        min=fmin, max=fmax, otype='f0')
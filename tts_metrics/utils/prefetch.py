@@ -0,0 +1,81 @@
+## background read/decode of the next pairs while the current one is scored
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+@dataclass
+class PrefetchConfig:
+    depth: int = 4 # pairs read ahead of the one being scored, rounded up to whole prepare_pairs windows
+    max_bytes: int = 256 * 1024 * 1024 # decoded audio held by finished, not yet scored pairs
+    num_threads: int = 2
+
+
+class Prefetcher:
+    """Yield `items` in order with `fetch(item)` already run for the next ones in background threads
+
+    At most `depth` items are in flight, and no new one is started while they
+    hold `max_bytes` or more, counting unfinished ones at the largest result
+    seen so far. Until a result is seen, and when the cap is reached, one
+    item is in flight.
+
+    Starvation stats: `requests` items consumed, `starved` of them not fetched
+    yet when asked for, `wait_seconds` spent waiting on those, `peak_bytes`
+    held at most.
+
+    Args:
+        fetch (callable): loads an item, its result is yielded with it
+        items (list): items, yielded in this order
+        config (PrefetchConfig): depth, memory cap and threads
+        nbytes (callable): memory held by a result of `fetch`
+    """
+    def __init__(self, fetch, items, config, nbytes):
+        self.fetch = fetch
+        self.nbytes = nbytes
+        self.items = list(items)
+        self.config = config
+        self.requests = 0
+        self.starved = 0
+        self.wait_seconds = 0.0
+        self.peak_bytes = 0
+        self._item_bytes = None # largest result seen, the estimate of the unfinished ones
+
+    def _result_bytes(self, result):
+        nbytes = self.nbytes(result)
+        self._item_bytes = max(self._item_bytes or 0, nbytes)
+        return nbytes
+
+    def _held_bytes(self, future):
+        if future.done() and not future.exception():
+            return self._result_bytes(future.result())
+        return self._item_bytes or 0
+
+    def __iter__(self):
+        pending = deque()
+        next_index = 0
+        with ThreadPoolExecutor(max_workers=self.config.num_threads) as executor:
+            for item in self.items:
+                while next_index < len(self.items) and len(pending) < max(self.config.depth, 1):
+                    held = sum(self._held_bytes(future) for future in pending)
+                    self.peak_bytes = max(self.peak_bytes, held)
+                    if pending and (self._item_bytes is None or held >= self.config.max_bytes):
+                        break
+                    pending.append(executor.submit(self.fetch, self.items[next_index]))
+                    next_index += 1
+
+                future = pending.popleft()
+                self.requests += 1
+                if not future.done():
+                    self.starved += 1
+                    start = time.perf_counter()
+                    future.result()
+                    self.wait_seconds += time.perf_counter() - start
+                result = future.result()
+                held = self._result_bytes(result) + sum(self._held_bytes(future) for future in pending)
+                self.peak_bytes = max(self.peak_bytes, held)
+                yield item, result
+
+    def summary(self, unit='pairs'):
+        return (f"[INFO] Prefetch: {self.starved}/{self.requests} {unit} not ready when scored, "
+                f"{self.wait_seconds:.2f} s waiting, peak {self.peak_bytes / 1024 ** 2:.1f} MiB held")
@@ -0,0 +1,187 @@
+## per-stage timers, counters and cache hit rates of a metric run
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+# returned by every timer while profiling is off: entering it costs a method call, nothing is recorded
+_NULL_TIMER = nullcontext()
+
+
+class _StageTimer:
+    __slots__ = ('profiler', 'stage', 'start')
+
+    def __init__(self, profiler, stage):
+        self.profiler = profiler
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_time(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """Time spent per stage, counters and cache hit rates of a run
+
+    Stages are timed with `with profiler.timer('decode'):`; seconds of a stage
+    are summed over threads and worker processes, so they can exceed the wall
+    time. Stages do not nest in the library (decode and resample are outside
+    of features, features outside of dtw), so they add up to the work done.
+
+    Counters are plain sums ('decoded_bytes', 'feature_frames', ...), and every
+    cache reports accesses as '<cache>.hits' and '<cache>.misses'.
+
+    A disabled profiler records nothing and its timer is a shared no-op
+    context manager, so instrumented code runs at full speed.
+
+    Args:
+        enabled (bool, optional): record stages and counters. Defaults to False.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.sinks = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded stage and counter
+        """
+        with self._lock:
+            self.stages = {} # stage -> [calls, seconds]
+            self.counters = {}
+            self.start_time = time.perf_counter()
+
+    def timer(self, stage):
+        """Context manager adding the time spent in its block to `stage`
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def add_time(self, stage, seconds, calls=1):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def cache_access(self, cache, hit):
+        """Record a hit or a miss of `cache`
+        """
+        self.count(f"{cache}.hits" if hit else f"{cache}.misses")
+
+    def drain(self):
+        """Return the stages and counters recorded so far and forget them, None when disabled
+
+        Worker processes send it back with every result, see merge.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            snapshot = {'stages': self.stages, 'counters': self.counters}
+            self.stages, self.counters = {}, {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """Add stages and counters returned by drain, e.g. in another process
+        """
+        if snapshot is None:
+            return
+        for stage, (calls, seconds) in snapshot['stages'].items():
+            self.add_time(stage, seconds, calls)
+        with self._lock:
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        """Return stages, counters and hit rates as a JSON serializable dict
+        """
+        with self._lock:
+            stages = {stage: {'calls': calls, 'seconds': seconds, 'mean_ms': 1000.0 * seconds / max(calls, 1)}
+                      for stage, (calls, seconds) in sorted(self.stages.items(), key=lambda item: -item[1][1])}
+            counters = dict(sorted(self.counters.items()))
+        caches = sorted({name.rsplit('.', 1)[0] for name in counters if name.endswith(('.hits', '.misses'))})
+        hit_rates = {}
+        for cache in caches:
+            hits, misses = counters.get(f"{cache}.hits", 0), counters.get(f"{cache}.misses", 0)
+            hit_rates[cache] = hits / (hits + misses) if hits + misses else float('nan')
+        return {'wall_seconds': time.perf_counter() - self.start_time, 'stages': stages,
+                'counters': counters, 'cache_hit_rates': hit_rates}
+
+    def summary(self):
+        profile = self.to_dict()
+        lines = [f"[INFO] Profile over {profile['wall_seconds']:.2f} s wall time"]
+        for stage, entry in profile['stages'].items():
+            lines.append(f"[INFO] {stage}: {entry['seconds']:.3f} s in {entry['calls']} calls "
+                         f"({entry['mean_ms']:.2f} ms each)")
+        for cache, rate in profile['cache_hit_rates'].items():
+            lines.append(f"[INFO] {cache} hit rate: {rate:.1%}")
+        return "\n".join(lines)
+
+    def add_sink(self, sink):
+        """Call `sink(profile)` with the dict of to_dict on every report
+        """
+        self.sinks.append(sink)
+
+    def report(self, path=None):
+        """Send the profile to every sink and, when `path` is given, write it there as JSON
+
+        Returns:
+            dict: the profile, see to_dict
+        """
+        profile = self.to_dict()
+        for sink in self.sinks:
+            sink(profile)
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(profile, f, indent=2)
+        return profile
+
+    def __getstate__(self):
+        # sent to worker processes: they record on their own and send back drain()
+        return {'enabled': self.enabled}
+
+    def __setstate__(self, state):
+        self.__init__(state['enabled'])
+
+
+_default_profiler = Profiler()
+
+
+def get_profiler():
+    """Return the process-wide profiler the library records to
+    """
+    return _default_profiler
+
+
+def set_profiler(profiler):
+    """Replace the process-wide profiler, e.g. with Profiler(enabled=True)
+
+    Args:
+        profiler (Profiler): new shared profiler
+    """
+    global _default_profiler
+    _default_profiler = profiler
+
+
+def timer(stage):
+    """Time a block of code as `stage` in the process-wide profiler
+    """
+    return _default_profiler.timer(stage)
+
+
+def count(name, value=1):
+    _default_profiler.count(name, value)
+
+
+def cache_access(cache, hit):
+    _default_profiler.cache_access(cache, hit)
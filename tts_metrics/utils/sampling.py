@@ -0,0 +1,56 @@
+## random scoring orders for progressive evaluation, optionally stratified by speaker
+import re
+
+import numpy as np
+
+
+def speaker_function(stratify):
+    """Callable giving the speaker of a reference file
+
+    Args:
+        stratify (callable or str): the callable itself, or a regular expression searched in the path:
+            its first group (or the whole match) is the speaker, e.g. r"^([^/]+)/" for one dir per speaker
+    """
+    if callable(stratify):
+        return stratify
+    pattern = re.compile(stratify)
+
+    def speaker(ref_file):
+        match = pattern.search(ref_file)
+        if match is None:
+            raise ValueError(f"Speaker pattern {stratify!r} does not match {ref_file!r}")
+        return match.group(1) if pattern.groups else match.group(0)
+    return speaker
+
+
+def progressive_order(pairs, stratify=None, seed=0):
+    """(ref_file, syn_file) pairs in a random order whose every prefix is a fair sample
+
+    Without `stratify` the order is a uniform shuffle. With it, the pairs of
+    every speaker are shuffled and spread evenly over the order (each speaker
+    gets a random offset, then one slot every 1/n_speaker of the way), so any
+    prefix holds the speakers in the proportions of the whole set.
+
+    Args:
+        pairs (iterable): (ref_file, syn_file) pairs
+        stratify (callable or str, optional): see speaker_function. Defaults to None.
+        seed (int, optional): seed of the order. Defaults to 0.
+
+    Returns:
+        list: the pairs, reordered
+    """
+    rng = np.random.default_rng(seed)
+    pairs = list(pairs)
+    if stratify is None:
+        return [pairs[i] for i in rng.permutation(len(pairs))]
+    speaker = speaker_function(stratify)
+    strata = {}
+    for pair in pairs:
+        strata.setdefault(speaker(pair[0]), []).append(pair)
+    ordered, positions = [], []
+    for members in strata.values():
+        offset = rng.random()
+        for rank, i in enumerate(rng.permutation(len(members))):
+            ordered.append(members[i])
+            positions.append((rank + offset) / len(members))
+    return [ordered[i] for i in np.argsort(positions, kind='stable')]
@@ -0,0 +1,120 @@
+## block-wise feature extraction of long audio with bounded memory
+from fractions import Fraction
+
+import numpy as np
+
+from tts_metrics.utils.lazy import lazy_import
+from tts_metrics.utils.profiling import count, timer
+
+sf = lazy_import('soundfile')
+
+
+class _PaddedStream:
+    """Mono waveform of an open SoundFile, resampled and zero padded on both sides
+
+    Samples are addressed by their index in the padded signal; only the range
+    still needed by the caller is kept in memory.
+    """
+    def __init__(self, sound_file, sr, pad=0, read_size=65536):
+        self._file = sound_file
+        self._read_size = read_size
+        self._pad = pad
+        self._resampler = None
+        if sr is not None and sr != sound_file.samplerate:
+            try:
+                import soxr
+            except ImportError:  # soxr ships with librosa >= 0.10, only needed to resample
+                raise ImportError(f"Streaming {sound_file.name} at {sr} Hz needs soxr to resample "
+                                  f"from {sound_file.samplerate} Hz (pip install soxr)")
+            # same resampler as librosa.load's default res_type 'soxr_hq'
+            self._resampler = soxr.ResampleStream(sound_file.samplerate, sr, 1, dtype='float32', quality='HQ')
+        self._buffer = np.zeros(pad, dtype=np.float32)
+        self._offset = 0
+        self.exhausted = False
+
+    def _pull(self):
+        with timer('decode'):
+            data = self._file.read(self._read_size, dtype='float32', always_2d=True)
+            last = data.shape[0] < self._read_size
+            wav = data.mean(axis=1)
+        count('decoded_bytes', wav.nbytes)
+        if self._resampler is not None:
+            with timer('resample'):
+                wav = self._resampler.resample_chunk(wav, last=last)
+        if last:
+            wav = np.concatenate([wav, np.zeros(self._pad, dtype=np.float32)])
+            self.exhausted = True
+        self._buffer = np.concatenate([self._buffer, wav.astype(np.float32, copy=False)])
+
+    def read(self, start, stop):
+        """Return samples [start, stop), shorter when the signal ends before `stop`
+        """
+        while not self.exhausted and self._offset + len(self._buffer) < stop:
+            self._pull()
+        return self._buffer[start - self._offset:stop - self._offset].copy()
+
+    def discard(self, before):
+        """Forget every sample before index `before`
+        """
+        drop = min(max(before - self._offset, 0), len(self._buffer))
+        self._buffer = self._buffer[drop:]
+        self._offset += drop
+
+
+def stream_features(path, extract, hop, sr=22050, pad=0, frame_length=0, context_frames=0,
+                    block_frames=2048, time_axis=0):
+    """Extract frame features of `path` block by block, yielding them in order
+
+    Frame k of `extract` is assumed to start at sample k * hop of its input
+    (librosa with center=False on a signal padded by `pad`, or WORLD with
+    pad=0). Every block is cut on a frame boundary, so the concatenated
+    output has the frames of `extract` run on the whole (padded) file.
+    `context_frames` extra frames on each side are extracted and dropped, for
+    features that look beyond their own window (F0 tracking, Viterbi). The
+    output equals the whole-file extraction only when every frame depends on
+    no more than that context: trackers with global decisions (RAPT) or end
+    of signal handling (WORLD, SWIPE) are approximate near block or file edges.
+
+    Peak memory is bounded by (block_frames + 2 * context_frames) * hop samples,
+    whatever the length of the file.
+
+    Args:
+        path (str): path to audio file
+        extract (callable): maps a float32 waveform to a feature array
+        hop (int or Fraction): samples between two frames
+        sr (int, optional): sampling rate of the analysis, None keeps the native rate. Defaults to 22050.
+        pad (int, optional): zeros added before and after the signal, n_fft // 2 for centered librosa frames. Defaults to 0.
+        frame_length (int, optional): samples a frame spans after its start. Defaults to 0.
+        context_frames (int, optional): frames of context on each side of a block. Defaults to 0.
+        block_frames (int, optional): frames yielded per block. Defaults to 2048.
+        time_axis (int, optional): frame axis of the output of `extract`. Defaults to 0.
+
+    Yields:
+        np.ndarray: features of consecutive blocks of frames
+    """
+    hop = Fraction(hop)
+    # blocks span a multiple of hop.denominator frames, so they start on an integer sample
+    step = hop.denominator
+    block_frames = -(-block_frames // step) * step
+    context_frames = -(-context_frames // step) * step
+
+    with sf.SoundFile(path) as sound_file:
+        stream = _PaddedStream(sound_file, sr, pad=pad)
+        first = 0
+        while True:
+            lead = min(context_frames, first)
+            start = int((first - lead) * hop)
+            stop = int((first + block_frames + context_frames) * hop) + frame_length
+            segment = stream.read(start, stop)
+            final = len(segment) < stop - start
+            if len(segment) < max(frame_length, 1):
+                return
+            frames = np.moveaxis(extract(segment), time_axis, 0)
+            frames = frames[lead:] if final else frames[lead:lead + block_frames]
+            if frames.shape[0] == 0:
+                return
+            yield np.moveaxis(frames, 0, time_axis)
+            if final:
+                return
+            first += block_frames
+            stream.discard(int((first - context_frames) * hop))